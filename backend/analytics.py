@@ -0,0 +1,147 @@
+"""
+Вспомогательные алгоритмы для аналитики цен, не зависящие от БД.
+"""
+import heapq
+import math
+import random
+from typing import List, Optional, Sequence, Tuple
+
+# Способы усреднения изменений цен по продуктам
+AGGREGATORS = ("mean", "median", "trimmed", "geomean", "weighted")
+
+
+def lttb(points: Sequence[Tuple[float, float]], threshold: int) -> List[Tuple[float, float]]:
+    """
+    Прореживание временного ряда алгоритмом Largest-Triangle-Three-Buckets.
+    Сохраняет первую и последнюю точки и визуальную форму графика.
+    Точки должны быть отсортированы по x.
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0
+
+    for i in range(threshold - 2):
+        # Среднее по следующей корзине — третья вершина треугольника
+        next_start = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        next_bucket = points[next_start:next_end]
+        avg_x = sum(p[0] for p in next_bucket) / len(next_bucket)
+        avg_y = sum(p[1] for p in next_bucket) / len(next_bucket)
+
+        # Выбираем точку текущей корзины с максимальной площадью треугольника
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        ax, ay = points[a]
+        max_area = -1.0
+        max_index = start
+        for j in range(start, end):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                max_index = j
+
+        sampled.append(points[max_index])
+        a = max_index
+
+    sampled.append(points[-1])
+    return sampled
+
+
+def select_kth(values: Sequence[float], k: int) -> float:
+    """
+    k-й по возрастанию элемент (с нуля) за ожидаемое O(n) — быстрый выбор
+    без полной сортировки.
+    """
+    values = list(values)
+    while True:
+        pivot = values[random.randrange(len(values))]
+        lower = [v for v in values if v < pivot]
+        if k < len(lower):
+            values = lower
+            continue
+        equal = sum(1 for v in values if v == pivot)
+        if k < len(lower) + equal:
+            return pivot
+        k -= len(lower) + equal
+        values = [v for v in values if v > pivot]
+
+
+class ChangeAggregator:
+    """
+    Накопитель процентных изменений цен по продуктам. Суммы для среднего,
+    геометрического и взвешенного считаются на лету за один проход;
+    медиана и усечённое среднее — выбором по сохранённым изменениям.
+    """
+
+    def __init__(self, trim: float = 0.1):
+        self.trim = trim  # доля отбрасываемых значений с каждой стороны
+        self.changes = []
+        self.total = 0.0
+        self.log_total = 0.0
+        self.log_count = 0
+        self.start_total = 0.0
+        self.end_total = 0.0
+
+    def __len__(self):
+        return len(self.changes)
+
+    def count(self, agg: str = "mean") -> int:
+        """
+        Сколько продуктов вошло в результат: для geomean отношения цен
+        ≤ 0 (нулевая или отрицательная конечная цена) не учитываются.
+        """
+        return self.log_count if agg == "geomean" else len(self.changes)
+
+    def add(self, start_price: float, end_price: float) -> bool:
+        """
+        Учесть продукт. False, если изменение не определено (нулевая цена).
+        """
+        if start_price == 0:
+            return False
+        change = (end_price - start_price) / start_price * 100
+        self.changes.append(change)
+        self.total += change
+        ratio = end_price / start_price
+        if ratio > 0:
+            self.log_total += math.log(ratio)
+            self.log_count += 1
+        self.start_total += start_price
+        self.end_total += end_price
+        return True
+
+    def result(self, agg: str = "mean") -> Optional[float]:
+        n = len(self.changes)
+        if n == 0:
+            return None
+        if agg == "mean":
+            return self.total / n
+        if agg == "median":
+            upper = select_kth(self.changes, n // 2)
+            if n % 2:
+                return upper
+            return (select_kth(self.changes, n // 2 - 1) + upper) / 2
+        if agg == "trimmed":
+            k = int(n * self.trim)
+            if k == 0:
+                return self.total / n
+            dropped = sum(heapq.nsmallest(k, self.changes)) + sum(
+                heapq.nlargest(k, self.changes)
+            )
+            return (self.total - dropped) / (n - 2 * k)
+        if agg == "geomean":
+            # Среднее геометрическое отношений цен, выраженное в процентах
+            if self.log_count == 0:
+                return None
+            return (math.exp(self.log_total / self.log_count) - 1) * 100
+        if agg == "weighted":
+            # Взвешивание по начальной цене: изменение стоимости корзины
+            # из одной единицы каждого продукта
+            if self.start_total == 0:
+                return None
+            return (self.end_total - self.start_total) / self.start_total * 100
+        raise ValueError(f"Неизвестный способ усреднения: {agg}")
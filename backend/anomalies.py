@@ -0,0 +1,283 @@
+"""
+Проверка спарсенных цен перед записью: устойчивый z-score по медиане
+и MAD последних цен продукта, скачки относительно предыдущей цены
+и скидка выше обычной цены. Подозрительные цены попадают в карантин
+на ручную проверку, а не в таблицу prices.
+"""
+from collections import deque
+from datetime import datetime
+from statistics import median
+
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, select, func
+from sqlalchemy.orm import declarative_base, Session
+
+QuarantineBase = declarative_base()
+
+# Статусы записей карантина
+PENDING = "pending"
+APPROVED = "approved"
+REJECTED = "rejected"
+
+# Источник: свежий парсинг или проверка уже сохранённой истории
+SOURCE_SCRAPE = "scrape"
+SOURCE_HISTORY = "history"
+
+
+class QuarantinedPrice(QuarantineBase):
+    __tablename__ = "quarantined_prices"
+
+    QuarantineID = Column(Integer, primary_key=True)
+    ProductID = Column(Integer, nullable=False, index=True)
+    PriceID = Column(Integer, nullable=True)  # запись в prices для SOURCE_HISTORY
+    PriceWithDiscount = Column(Float, nullable=True)
+    PriceWithoutDiscount = Column(Float, nullable=True)
+    PriceDate = Column(Date, nullable=False)
+    Baseline = Column(Float, nullable=True)  # медиана последних цен
+    Reasons = Column(String, nullable=False)
+    Source = Column(String, nullable=False)
+    Status = Column(String, nullable=False, default=PENDING, index=True)
+    CreatedAt = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class AnomalyPolicy:
+    """
+    Пороги проверок. Отклонение считается выбросом, только если оно велико
+    и в единицах MAD, и относительно медианы и последней цены: у продуктов
+    с почти постоянной ценой MAD близок к нулю. Если подряд пришли две
+    подозрительные цены в пределах confirm_tolerance друг от друга, это
+    считается реальным изменением уровня цены, а не ошибкой парсинга.
+    """
+
+    def __init__(
+        self,
+        window: int = 30,
+        min_history: int = 5,
+        z_threshold: float = 6.0,
+        min_relative_deviation: float = 0.5,
+        jump_ratio: float = 3.0,
+        confirm_tolerance: float = 0.05,
+    ):
+        self.window = window
+        self.min_history = min_history
+        self.z_threshold = z_threshold
+        self.min_relative_deviation = min_relative_deviation
+        self.jump_ratio = jump_ratio
+        self.confirm_tolerance = confirm_tolerance
+
+
+def check_price(
+    history, with_discount, without_discount, policy: AnomalyPolicy, previous=None
+):
+    """
+    Проверить цену по последним ценам продукта (history — список в
+    хронологическом порядке). previous — предыдущая отклонённая цена
+    продукта, если она новее истории. Возвращает (причины, медиана истории);
+    пустой список причин — цена в порядке.
+    """
+    reasons = []
+    price = with_discount if with_discount is not None else without_discount
+    if price is None:
+        return reasons, None
+    if price <= 0 or (without_discount is not None and without_discount <= 0):
+        reasons.append("non_positive")
+    if (
+        with_discount is not None
+        and without_discount is not None
+        and with_discount > without_discount
+    ):
+        reasons.append("discount_above_list")
+
+    baseline = median(history) if history else None
+    if len(history) >= policy.min_history and baseline > 0:
+        mad = median(abs(value - baseline) for value in history)
+        # Нижняя граница MAD — 1% медианы, чтобы z-score не уходил в бесконечность
+        scale = max(mad, baseline * 0.01) / 0.6745
+        deviation = abs(price - baseline)
+        if (
+            deviation / scale > policy.z_threshold
+            and deviation / baseline > policy.min_relative_deviation
+            and history[-1] > 0
+            and abs(price - history[-1]) / history[-1] > policy.min_relative_deviation
+        ):
+            reasons.append("outlier")
+    if history and history[-1] > 0 and price > 0:
+        ratio = price / history[-1]
+        if ratio >= policy.jump_ratio or ratio <= 1 / policy.jump_ratio:
+            reasons.append("jump")
+    if (
+        previous
+        and set(reasons) <= {"outlier", "jump"}
+        and abs(price - previous) / previous <= policy.confirm_tolerance
+    ):
+        reasons = []  # Подтверждённое изменение уровня цены
+    return reasons, baseline
+
+
+def _valid_price(with_discount, without_discount):
+    price = with_discount if with_discount is not None else without_discount
+    return float(price) if price is not None else None
+
+
+def recent_prices(db: Session, price_model, product_ids, before, window: int) -> dict:
+    """
+    Последние window цен каждого продукта до даты before одним запросом:
+    {product_id: [цена, ...]} в хронологическом порядке.
+    """
+    value = func.coalesce(price_model.PriceWithDiscount, price_model.PriceWithoutDiscount)
+    ranked = (
+        select(
+            price_model.ProductID,
+            price_model.PriceDate,
+            value.label("value"),
+            func.row_number()
+            .over(
+                partition_by=price_model.ProductID,
+                order_by=price_model.PriceDate.desc(),
+            )
+            .label("rn"),
+        )
+        .where(
+            price_model.ProductID.in_(product_ids),
+            price_model.PriceDate < before,
+            value.isnot(None),
+        )
+        .subquery()
+    )
+    rows = db.execute(
+        select(ranked.c.ProductID, ranked.c.value)
+        .where(ranked.c.rn <= window)
+        .order_by(ranked.c.ProductID, ranked.c.PriceDate)
+    )
+    history = {product_id: [] for product_id in product_ids}
+    for product_id, price in rows:
+        history[product_id].append(float(price))
+    return history
+
+
+def last_quarantined_prices(db: Session, product_ids) -> dict:
+    """
+    Последняя ожидающая проверки спарсенная цена каждого продукта.
+    """
+    latest = (
+        select(func.max(QuarantinedPrice.QuarantineID))
+        .where(
+            QuarantinedPrice.ProductID.in_(product_ids),
+            QuarantinedPrice.Source == SOURCE_SCRAPE,
+            QuarantinedPrice.Status == PENDING,
+        )
+        .group_by(QuarantinedPrice.ProductID)
+    )
+    rows = db.execute(
+        select(
+            QuarantinedPrice.ProductID,
+            QuarantinedPrice.PriceWithDiscount,
+            QuarantinedPrice.PriceWithoutDiscount,
+        ).where(QuarantinedPrice.QuarantineID.in_(latest))
+    )
+    return {
+        product_id: _valid_price(with_discount, without_discount)
+        for product_id, with_discount, without_discount in rows
+    }
+
+
+def validate_scraped_prices(
+    db: Session, price_model, items: dict, price_date, policy: AnomalyPolicy
+) -> dict:
+    """
+    Проверить пачку спарсенных цен {product_id: (со скидкой, без скидки)}
+    за дату price_date. История всех продуктов пачки читается одним
+    запросом. Подозрительные цены добавляются в карантин (без коммита)
+    и исключаются из результата; возвращаются прошедшие проверку.
+    """
+    if not items:
+        return {}
+    history = recent_prices(db, price_model, list(items), price_date, policy.window)
+    previous = last_quarantined_prices(db, list(items))
+    accepted = {}
+    for product_id, (with_discount, without_discount) in items.items():
+        reasons, baseline = check_price(
+            history[product_id],
+            with_discount,
+            without_discount,
+            policy,
+            previous=previous.get(product_id),
+        )
+        if not reasons:
+            accepted[product_id] = (with_discount, without_discount)
+            continue
+        db.add(
+            QuarantinedPrice(
+                ProductID=product_id,
+                PriceWithDiscount=with_discount,
+                PriceWithoutDiscount=without_discount,
+                PriceDate=price_date,
+                Baseline=baseline,
+                Reasons=",".join(reasons),
+                Source=SOURCE_SCRAPE,
+            )
+        )
+    return accepted
+
+
+def scan_price_history(
+    db: Session, price_model, policy: AnomalyPolicy, dry_run: bool = False
+) -> list:
+    """
+    Пакетная проверка всей сохранённой истории за один проход: каждая
+    запись сравнивается с предыдущими window принятыми ценами продукта.
+    Найденные записи остаются в prices и попадают в карантин на проверку
+    (уже отправленные туда пропускаются). Возвращает найденные записи.
+    """
+    already = set(
+        db.execute(
+            select(QuarantinedPrice.PriceID).where(QuarantinedPrice.PriceID.isnot(None))
+        ).scalars()
+    )
+    rows = db.execute(
+        select(
+            price_model.PriceID,
+            price_model.ProductID,
+            price_model.PriceDate,
+            price_model.PriceWithDiscount,
+            price_model.PriceWithoutDiscount,
+        ).order_by(price_model.ProductID, price_model.PriceDate)
+    )
+    found = []
+    current_product = None
+    window = deque(maxlen=policy.window)
+    previous = None
+    for price_id, product_id, price_date, with_discount, without_discount in rows:
+        if product_id != current_product:
+            current_product = product_id
+            window.clear()
+            previous = None
+        with_discount = float(with_discount) if with_discount is not None else None
+        without_discount = float(without_discount) if without_discount is not None else None
+        reasons, baseline = check_price(
+            list(window), with_discount, without_discount, policy, previous=previous
+        )
+        price = _valid_price(with_discount, without_discount)
+        if reasons:
+            # Выброс не попадает в окно и не сдвигает медиану для следующих записей
+            previous = price
+            if price_id not in already:
+                found.append(
+                    QuarantinedPrice(
+                        ProductID=product_id,
+                        PriceID=price_id,
+                        PriceWithDiscount=with_discount,
+                        PriceWithoutDiscount=without_discount,
+                        PriceDate=price_date,
+                        Baseline=baseline,
+                        Reasons=",".join(reasons),
+                        Source=SOURCE_HISTORY,
+                    )
+                )
+            continue
+        previous = None
+        if price is not None:
+            window.append(price)
+    if not dry_run and found:
+        db.add_all(found)
+        db.commit()
+    return found
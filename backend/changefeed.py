@@ -0,0 +1,125 @@
+"""
+Журнал изменений для инкрементальной синхронизации клиентов.
+Каждая запись получает монотонно возрастающий номер Seq; клиент хранит
+последний полученный номер и запрашивает только то, что изменилось после него.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import Column, Integer, String, DateTime, select, delete, insert, func
+from sqlalchemy import literal
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import declarative_base, Session
+
+ChangeLogBase = declarative_base()
+
+
+class Change(ChangeLogBase):
+    __tablename__ = "changes"
+    # AUTOINCREMENT: номера не переиспользуются даже после очистки журнала
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    Seq = Column(Integer, primary_key=True)
+    Entity = Column(String, nullable=False)  # category | product | price
+    Op = Column(String, nullable=False)  # insert | update | delete
+    EntityID = Column(Integer, nullable=False)
+    CreatedAt = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+def register_change_tracking(entities: dict, owners: dict = None):
+    """
+    Автоматически журналировать изменения моделей при каждом flush.
+    entities — {класс модели: имя сущности в журнале}. Запись идёт в той же
+    транзакции, что и изменение, поэтому покрывает все пути записи —
+    эндпоинты, фоновый парсер и каскадные удаления.
+    owners — {класс модели: атрибут владельца}: перенос записи к другому
+    владельцу (цена другого продукта) журналируется как delete и insert,
+    чтобы подписчики, группирующие записи по владельцу, убрали её у старого.
+    """
+    owners = owners or {}
+
+    @event.listens_for(Session, "after_flush")
+    def log_changes(session, flush_context):
+        rows = []
+        for op, objects in (
+            ("insert", session.new),
+            ("update", session.dirty),
+            ("delete", session.deleted),
+        ):
+            for obj in objects:
+                entity = entities.get(type(obj))
+                if entity is None:
+                    continue
+                if op == "update" and not session.is_modified(obj):
+                    continue
+                state = inspect(obj)
+                identity = state.mapper.primary_key_from_instance(obj)
+                if identity[0] is None:
+                    continue
+                ops = [op]
+                owner = owners.get(type(obj))
+                if op == "update" and owner and state.attrs[owner].history.deleted:
+                    ops = ["delete", "insert"]
+                for logged_op in ops:
+                    rows.append(
+                        {
+                            "Entity": entity,
+                            "Op": logged_op,
+                            "EntityID": identity[0],
+                            "CreatedAt": datetime.utcnow(),
+                        }
+                    )
+        if rows:
+            session.connection().execute(insert(Change), rows)
+
+
+def log_bulk_changes(db: Session, entity: str, op: str, entity_ids) -> int:
+    """
+    Журналировать изменения, сделанные массовым UPDATE/DELETE мимо ORM
+    (такие запросы не вызывают after_flush). entity_ids — select с одной
+    колонкой идентификаторов; записи добавляются одним INSERT ... SELECT
+    и должны выполняться до самого изменения. Не коммитит.
+    """
+    ids = entity_ids.subquery()
+    id_column = list(ids.c)[0]
+    result = db.execute(
+        insert(Change).from_select(
+            ["Entity", "Op", "EntityID", "CreatedAt"],
+            select(
+                literal(entity),
+                literal(op),
+                id_column,
+                literal(datetime.utcnow(), DateTime),
+            ),
+        )
+    )
+    return result.rowcount
+
+
+def changes_since_query(since: int, limit: int):
+    return select(Change).where(Change.Seq > since).order_by(Change.Seq).limit(limit)
+
+
+def get_changes_since(db: Session, since: int, limit: int):
+    return db.execute(changes_since_query(since, limit)).scalars().all()
+
+
+def get_first_seq(db: Session) -> int:
+    """
+    Наименьший номер, оставшийся в журнале (0, если журнал пуст).
+    """
+    return db.execute(select(func.min(Change.Seq))).scalar() or 0
+
+
+def trim_change_log(db: Session, max_age_days: int) -> int:
+    """
+    Удалить записи старше max_age_days. Возвращает число удалённых записей.
+    Последняя запись сохраняется всегда: по ней клиент с устаревшим номером
+    понимает, что часть журнала удалена и нужна полная синхронизация.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=max_age_days)
+    last_seq = select(func.max(Change.Seq)).scalar_subquery()
+    result = db.execute(
+        delete(Change).where(Change.CreatedAt < cutoff, Change.Seq < last_seq)
+    )
+    db.commit()
+    return result.rowcount
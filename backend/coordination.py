@@ -0,0 +1,123 @@
+"""
+Координация нескольких процессов-воркеров API через общую базу данных:
+аренда (lease) продуктов на цикл парсинга и версии кэшей.
+"""
+import os
+import socket
+from datetime import datetime, timedelta
+
+from sqlalchemy import Column, Integer, String, DateTime, select, delete
+from sqlalchemy.orm import declarative_base, Session
+from sqlalchemy.dialects import postgresql, sqlite
+
+CoordinationBase = declarative_base()
+
+
+class ScrapeLease(CoordinationBase):
+    __tablename__ = "scrape_leases"
+
+    ProductID = Column(Integer, primary_key=True)
+    Owner = Column(String, nullable=False)
+    ExpiresAt = Column(DateTime, nullable=False)
+
+
+class CacheVersion(CoordinationBase):
+    __tablename__ = "cache_versions"
+
+    Name = Column(String, primary_key=True)
+    Version = Column(Integer, nullable=False, default=0)
+
+
+def get_worker_id() -> str:
+    """
+    Идентификатор текущего процесса (хост и PID).
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _upsert(db: Session, model):
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+
+def acquire_scrape_lease(
+    db: Session, product_id: int, ttl_seconds: float, owner: str = None
+) -> bool:
+    """
+    Атомарно взять продукт в аренду для парсинга на ttl_seconds.
+    Удаётся, если аренды нет, она истекла или уже принадлежит owner.
+    Пока аренда действует, другие воркеры этот продукт не парсят.
+    """
+    owner = owner or get_worker_id()
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=ttl_seconds)
+    stmt = _upsert(db, ScrapeLease).values(
+        ProductID=product_id, Owner=owner, ExpiresAt=expires_at
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ScrapeLease.ProductID],
+        set_={"Owner": owner, "ExpiresAt": expires_at},
+        where=(ScrapeLease.ExpiresAt <= now) | (ScrapeLease.Owner == owner),
+    )
+    result = db.execute(stmt)
+    db.commit()
+    return result.rowcount == 1
+
+
+def release_scrape_lease(db: Session, product_id: int, owner: str = None):
+    """
+    Освободить аренду (например, после неудачного парсинга),
+    чтобы другой воркер мог повторить попытку в этом же цикле.
+    """
+    owner = owner or get_worker_id()
+    db.execute(
+        delete(ScrapeLease).where(
+            ScrapeLease.ProductID == product_id, ScrapeLease.Owner == owner
+        )
+    )
+    db.commit()
+
+
+def cache_version_query(name: str):
+    return select(CacheVersion.Version).where(CacheVersion.Name == name)
+
+
+def get_cache_version(db: Session, name: str) -> int:
+    return db.execute(cache_version_query(name)).scalar() or 0
+
+
+def bump_cache_version(db: Session, name: str):
+    """
+    Увеличить общую версию кэша. Не коммитит: вызывается в той же
+    транзакции, что и изменение данных, и фиксируется вместе с ним.
+    """
+    stmt = _upsert(db, CacheVersion).values(Name=name, Version=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CacheVersion.Name],
+        set_={"Version": CacheVersion.Version + 1},
+    )
+    db.execute(stmt)
+
+
+class VersionedCache:
+    """
+    Кэш в памяти процесса, который сбрасывается, как только общая версия
+    в БД отличается от версии, с которой были загружены значения.
+    Так изменения, сделанные в одном воркере, видны во всех остальных.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.version = None
+        self.values = {}
+
+    def get(self, version: int, key, default=None):
+        if version != self.version:
+            self.values = {}
+            self.version = version
+        return self.values.get(key, default)
+
+    def set(self, version: int, key, value):
+        if version == self.version:
+            self.values[key] = value
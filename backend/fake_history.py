@@ -46,6 +46,48 @@ DATABASE_URL = "sqlite:///./test.db"  # Замените на ваш путь к
 PRICE_CHANGE_PERCENT = 0.05  # Максимальное изменение цены (5%)
 FREQUENCY_DAYS = 7  # Периодичность генерации цен (еженедельно)
 
+def random_change_factor(rng=random):
+    # Случайное изменение цены в пределах ±PRICE_CHANGE_PERCENT
+    return 1 + rng.uniform(-PRICE_CHANGE_PERCENT, PRICE_CHANGE_PERCENT)
+
+def generate_price_events(hours, change_every_hours, promo_every_hours=None, promo_length_hours=72,
+                          start_price=120.0, rng=random):
+    """
+    Сгенерировать непрерывную историю цен одного продукта на hours часов:
+    обычная цена меняется в среднем раз в change_every_hours часов,
+    акции (скидка 10–30%) начинаются в среднем раз в promo_every_hours часов.
+    Возвращает [(час, цена со скидкой или None, цена без скидки), ...] —
+    только моменты, когда цены на полке действительно изменились.
+    """
+    moments = []
+    t = rng.expovariate(1 / change_every_hours)
+    while t < hours:
+        moments.append((t, "change"))
+        t += rng.expovariate(1 / change_every_hours)
+    if promo_every_hours:
+        t = rng.expovariate(1 / promo_every_hours)
+        while t < hours:
+            moments.append((t, "promo"))
+            moments.append((t + promo_length_hours, "promo_end"))
+            t += promo_length_hours + rng.expovariate(1 / promo_every_hours)
+    moments.sort()
+
+    price = start_price
+    discount = None
+    events = [(0.0, None, round(price, 2))]
+    for t, kind in moments:
+        if t >= hours:
+            break
+        if kind == "change":
+            price *= random_change_factor(rng)
+        elif kind == "promo":
+            discount = rng.uniform(0.1, 0.3)
+        else:
+            discount = None
+        with_discount = round(price * (1 - discount), 2) if discount else None
+        events.append((t, with_discount, round(price, 2)))
+    return events
+
 def get_engine(db_url=DATABASE_URL):
     return create_engine(db_url, connect_args={"check_same_thread": False})
 
@@ -92,8 +134,7 @@ def generate_price_history():
 
             # Генерация цен назад по времени до one_year_ago
             while current_date > one_year_ago:
-                # Случайное изменение цены в пределах ±PRICE_CHANGE_PERCENT
-                change_factor = 1 + random.uniform(-PRICE_CHANGE_PERCENT, PRICE_CHANGE_PERCENT)
+                change_factor = random_change_factor()
                 new_price_with_discount = Decimal(current_price_with_discount * change_factor).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
                 new_price_without_discount = Decimal(current_price_without_discount * change_factor).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
 
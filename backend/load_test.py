@@ -0,0 +1,87 @@
+# load_test.py
+# Нагрузочный тест эндпоинтов чтения: запросы в секунду и хвостовые задержки.
+#
+# Сравнение синхронного и асинхронного слоя данных:
+#   uvicorn main:app --port 8000                  # синхронный режим
+#   ASYNC_DB=1 uvicorn main:app --port 8000       # асинхронный режим
+#   python load_test.py --url http://127.0.0.1:8000 --clients 200 --requests 20
+import argparse
+import asyncio
+import time
+
+import httpx
+
+# Параметры
+DEFAULT_PATHS = [
+    "/categories/",
+    "/products/1",
+    "/inflation/product/1?start_date=2024-01-01&end_date=2024-12-01",
+    "/inflation/category/1?start_date=2024-01-01&end_date=2024-12-01",
+    "/inflation/overall?start_date=2024-01-01&end_date=2024-12-01",
+]
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run_client(client, paths, requests_per_client, latencies, errors):
+    for i in range(requests_per_client):
+        path = paths[i % len(paths)]
+        started = time.perf_counter()
+        try:
+            response = await client.get(path)
+            if response.status_code >= 500:
+                errors.append(response.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+async def run_load_test(url, clients, requests_per_client, paths):
+    latencies = []
+    errors = []
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(
+                run_client(client, paths, requests_per_client, latencies, errors)
+                for _ in range(clients)
+            )
+        )
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": (latencies[-1] if latencies else 0.0) * 1000,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный тест API")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=20, help="запросов на клиента")
+    parser.add_argument("--path", action="append", help="путь для запросов (можно несколько)")
+    args = parser.parse_args()
+
+    result = asyncio.run(
+        run_load_test(args.url, args.clients, args.requests, args.path or DEFAULT_PATHS)
+    )
+    print(
+        f"{result['requests']} запросов, ошибок: {result['errors']}, "
+        f"{result['rps']:.1f} req/s, p50 {result['p50_ms']:.1f} мс, "
+        f"p95 {result['p95_ms']:.1f} мс, p99 {result['p99_ms']:.1f} мс, "
+        f"max {result['max_ms']:.1f} мс"
+    )
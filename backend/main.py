@@ -1,22 +1,181 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, Request, Header
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse, FileResponse, PlainTextResponse
+from fastapi.routing import APIRoute
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, Date, DECIMAL
+from sqlalchemy import text, func, select, insert, update, delete, Index, and_, or_, union
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.pool import NullPool
+from sqlalchemy.exc import OperationalError, IntegrityError
 from sqlalchemy.orm import sessionmaker, declarative_base, relationship, joinedload
+from sqlalchemy.orm import configure_mappers, aliased
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from typing import List, Optional, Literal
+from contextlib import asynccontextmanager
 from pydantic import BaseModel
 import uvicorn
 from datetime import datetime, date
+from itertools import chain, groupby
+import asyncio
+import os
+import re
+import threading
+import time
+
+# Момент импорта модуля — от него отсчитывается время до готовности
+IMPORT_STARTED = time.perf_counter()
 
 # Импорт парсеров
-from parsers.magnit import parse_magnit
-from parsers.five import parse_5ka
+from parsers.registry import STORE_PARSERS, get_store_for_url, page_cache, parse_url
 from parsers.driver_settings import get_driver
+from parsers.batch import parse_many, get_batch_driver
+
+from analytics import lttb, ChangeAggregator
+from coordination import (
+    CoordinationBase,
+    VersionedCache,
+    acquire_scrape_lease,
+    bump_cache_version,
+    cache_version_query,
+    get_cache_version,
+)
+from changefeed import (
+    ChangeLogBase,
+    register_change_tracking,
+    get_changes_since,
+    get_first_seq,
+    trim_change_log,
+    log_bulk_changes,
+)
+from scrape_queue import (
+    ScrapeQueueBase,
+    ScrapeJob,
+    StoreCircuit,
+    LEASED,
+    ScrapePolicy,
+    enqueue_scrape,
+    is_circuit_open,
+    circuit_open_until,
+    record_store_success,
+    record_store_failure,
+    process_jobs,
+    retry_dead_job,
+)
+from anomalies import (
+    QuarantineBase,
+    QuarantinedPrice,
+    AnomalyPolicy,
+    validate_scraped_prices,
+)
+from price_stats import (
+    PriceStatsBase,
+    ProductPriceStats,
+    register_price_stats,
+    ensure_price_stats,
+    refresh_price_stats,
+)
+from price_store import CompactPriceStore, ID_CHUNK
+from matching import MatchBase, ProductMatch, MatchPolicy, propose_matches
+from profiling import (
+    ProfilePolicy,
+    install_profiling,
+    list_profiles,
+    profile_path,
+    format_profile_file,
+)
+from scheduling import (
+    ScheduleBase,
+    ScrapeSchedule,
+    SchedulePolicy,
+    rebuild_schedule,
+    mark_scraped,
+    postpone_scrape,
+)
+
+# Создание базы данных (по умолчанию SQLite)
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
+# Асинхронный слой данных для эндпоинтов чтения (aiosqlite / asyncpg)
+ASYNC_DB = os.getenv("ASYNC_DB", "0").lower() in ("1", "true", "yes")
+# Размер пула соединений для серверных СУБД. По умолчанию равен размеру пула
+# потоков Starlette (40): при меньшем пуле синхронные эндпоинты под нагрузкой
+# занимают все потоки в ожидании соединения, и закрыть сессии становится некому.
+# Для SQLite пул не используется — открыть файл дешевле, чем ждать соединения.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "40"))
+
+# Параметры запуска. WORKERS > 1 — продакшн-режим с несколькими процессами
+# (аналогично: gunicorn main:app -k uvicorn.workers.UvicornWorker -w 4)
+HOST = os.getenv("HOST", "127.0.0.1")
+PORT = int(os.getenv("PORT", "8000"))
+WORKERS = int(os.getenv("WORKERS", "1"))
+# Период фонового обновления цен в секундах (0 — отключено).
+# Каждый продукт за цикл парсит только один воркер — тот, кто взял его в аренду.
+SCRAPE_INTERVAL_SECONDS = int(os.getenv("SCRAPE_INTERVAL_SECONDS", "0"))
+# Очередь повторов парсинга: число потоков-обработчиков на процесс
+SCRAPE_QUEUE_THREADS = int(os.getenv("SCRAPE_QUEUE_THREADS", "1"))
+# Параллельный парсинг в цикле: вкладок на браузер и ссылок на один браузер
+SCRAPE_TABS = int(os.getenv("SCRAPE_TABS", "4"))
+SCRAPE_BATCH_SIZE = int(os.getenv("SCRAPE_BATCH_SIZE", "50"))
+SCRAPE_QUEUE_POLL_SECONDS = float(os.getenv("SCRAPE_QUEUE_POLL_SECONDS", "5"))
+# Адаптивное расписание: бюджет страниц в час на все продукты (0 — парсить
+# все продукты каждый цикл). Волатильные и акционные продукты парсятся чаще.
+SCRAPE_BUDGET_PER_HOUR = float(os.getenv("SCRAPE_BUDGET_PER_HOUR", "0"))
+# Сколько секунд повторный парсинг той же ссылки берётся из кэша
+SCRAPE_PAGE_CACHE_SECONDS = int(os.getenv("SCRAPE_PAGE_CACHE_SECONDS", "300"))
+# Сколько дней хранить журнал изменений
+CHANGE_LOG_RETENTION_DAYS = int(os.getenv("CHANGE_LOG_RETENTION_DAYS", "30"))
+# Прогрев при старте: данные и запросы (WARMUP=0 — отключить)
+# и запуск браузера парсера (WARMUP_DRIVER=1)
+WARMUP = os.getenv("WARMUP", "1").lower() in ("1", "true", "yes")
+WARMUP_DRIVER = os.getenv("WARMUP_DRIVER", "0").lower() in ("1", "true", "yes")
+# Аналитика по компактной копии истории цен в памяти вместо запросов к БД
+# (PRICE_STORE=1); PRICE_STORE_PATH — файл для быстрой загрузки при перезапуске
+PRICE_STORE = os.getenv("PRICE_STORE", "0").lower() in ("1", "true", "yes")
+PRICE_STORE_PATH = os.getenv("PRICE_STORE_PATH") or None
+# Токен администратора (заголовок X-Admin-Token) для эндпоинтов /admin:
+# массовых операций и профилирования запросов
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN") or None
+
+
+def get_engine_options(url: str) -> dict:
+    if url.startswith("sqlite"):
+        return {"poolclass": NullPool}
+    return {"pool_size": DB_POOL_SIZE}
+
 
-# Создание базы данных SQLite
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL,
+    connect_args=(
+        {"check_same_thread": False}
+        if SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+        else {}
+    ),
+    **get_engine_options(SQLALCHEMY_DATABASE_URL),
+)
+
+
+# Асинхронные драйверы по СУБД: синхронный драйвер в URL (pysqlite,
+# psycopg2 и т. п.) заменяется целиком
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def get_async_database_url(url: str) -> URL:
+    """
+    Подобрать асинхронный драйвер для URL синхронной базы данных.
+    """
+    url = make_url(url)
+    drivername = ASYNC_DRIVERS.get(url.get_backend_name())
+    return url.set(drivername=drivername) if drivername else url
+
+
+async_engine = (
+    create_async_engine(
+        get_async_database_url(SQLALCHEMY_DATABASE_URL),
+        **get_engine_options(SQLALCHEMY_DATABASE_URL),
+    )
+    if ASYNC_DB
+    else None
 )
 
 # Базовый класс для моделей
@@ -42,23 +201,156 @@ class Product(Base):
     ProductLink = Column(String, unique=True)
 
     category = relationship("Category", back_populates="products")
-    prices = relationship("Price", back_populates="product", cascade="all, delete")
+    # Цены удаляет база (ON DELETE CASCADE), ORM не загружает их перед удалением
+    prices = relationship(
+        "Price", back_populates="product", cascade="all, delete", passive_deletes=True
+    )
 
 
 class Price(Base):
     __tablename__ = "prices"
 
     PriceID = Column(Integer, primary_key=True, index=True)
-    ProductID = Column(Integer, ForeignKey("products.ProductID"))
+    ProductID = Column(Integer, ForeignKey("products.ProductID", ondelete="CASCADE"))
     PriceWithDiscount = Column(DECIMAL(10, 2), nullable=True)
     PriceWithoutDiscount = Column(DECIMAL(10, 2), nullable=True)
     PriceDate = Column(Date)
 
     product = relationship("Product", back_populates="prices")
 
+    # Составной индекс для диапазонных выборок истории одного продукта
+    __table_args__ = (Index("ix_prices_product_date", "ProductID", "PriceDate"),)
+
+
+# Полнотекстовый индекс по продуктам (SQLite FTS5).
+# Синхронизируется триггерами, поэтому любые записи в products/categories
+# (в том числе каскадные удаления) сразу отражаются в поиске.
+SEARCH_INDEX_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        ProductName,
+        CategoryName,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3 4'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, ProductName, CategoryName)
+        VALUES (
+            new.ProductID,
+            new.ProductName,
+            (SELECT CategoryName FROM categories WHERE CategoryID = new.CategoryID)
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+        DELETE FROM products_fts WHERE rowid = old.ProductID;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE ON products BEGIN
+        DELETE FROM products_fts WHERE rowid = old.ProductID;
+        INSERT INTO products_fts(rowid, ProductName, CategoryName)
+        VALUES (
+            new.ProductID,
+            new.ProductName,
+            (SELECT CategoryName FROM categories WHERE CategoryID = new.CategoryID)
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS categories_fts_au
+    AFTER UPDATE OF CategoryName ON categories BEGIN
+        UPDATE products_fts SET CategoryName = new.CategoryName
+        WHERE rowid IN (
+            SELECT ProductID FROM products WHERE CategoryID = new.CategoryID
+        );
+    END
+    """,
+]
+
+
+def init_search_index(bind):
+    """
+    Создать FTS5-таблицу и триггеры, если их ещё нет.
+    При первом создании индекс заполняется из существующих продуктов.
+    """
+    if bind.dialect.name != "sqlite":
+        return
+    with bind.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE name = 'products_fts'")
+        ).first()
+        for ddl in SEARCH_INDEX_DDL:
+            conn.execute(text(ddl))
+        if not exists:
+            conn.execute(
+                text(
+                    """
+                    INSERT INTO products_fts(rowid, ProductName, CategoryName)
+                    SELECT p.ProductID, p.ProductName, c.CategoryName
+                    FROM products p
+                    LEFT JOIN categories c ON c.CategoryID = p.CategoryID
+                    """
+                )
+            )
+
+
+def ensure_indexes(bind):
+    """
+    Создать индексы, добавленные в модели после создания таблиц.
+    create_all не добавляет индексы к уже существующим таблицам.
+    """
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+
 
-# Создание сессии и таблиц, если они ещё не созданы
-Base.metadata.create_all(bind=engine)
+def init_database(bind, attempts: int = 5):
+    """
+    Проверка схемы: создать недостающие таблицы, индексы и поисковый индекс,
+    заполнить статистику цен. Выполняется один раз при старте приложения
+    (и в служебных скриптах), а не при импорте модуля. Воркеры стартуют
+    одновременно: проигравший гонку получает «already exists» или
+    блокировку и повторяет проверку, которая тогда находит готовую схему.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            create_schema(bind)
+            return
+        except (OperationalError, IntegrityError):
+            if attempt == attempts:
+                raise
+            time.sleep(0.5 * attempt)
+
+
+def create_schema(bind):
+    for metadata in (
+        Base.metadata,
+        CoordinationBase.metadata,
+        ChangeLogBase.metadata,
+        ScrapeQueueBase.metadata,
+        ScheduleBase.metadata,
+        PriceStatsBase.metadata,
+        QuarantineBase.metadata,
+        MatchBase.metadata,
+    ):
+        metadata.create_all(bind=bind)
+    ensure_indexes(bind)
+    init_search_index(bind)
+    with Session(bind) as session:
+        ensure_price_stats(session, Price)
+
+
+# Журналирование всех изменений каталога и цен
+register_change_tracking(
+    {Category: "category", Product: "product", Price: "price"},
+    owners={Price: "ProductID"},
+)
+# Статистика цен по продуктам обновляется в той же транзакции, что и цены
+register_price_stats(Price)
 
 # Модели данных для запросов
 
@@ -104,6 +396,22 @@ class ProductResponse(BaseModel):
     model_config = {"from_attributes": True}
 
 
+class ProductSearchHit(BaseModel):
+    ProductID: int
+    ProductName: str
+    CategoryID: int
+    CategoryName: Optional[str] = None
+    ProductLink: str
+    rank: Optional[float] = None
+
+
+class ProductSearchResponse(BaseModel):
+    total: int
+    limit: int
+    offset: int
+    items: List[ProductSearchHit]
+
+
 class PriceResponse(BaseModel):
     PriceID: int
     ProductID: int
@@ -114,13 +422,54 @@ class PriceResponse(BaseModel):
     model_config = {"from_attributes": True}
 
 
+class ProductPriceStatsResponse(BaseModel):
+    product_id: int
+    first_date: date
+    first_price: float
+    last_date: date
+    last_price: float
+    min_price: float
+    max_price: float
+    avg_price: float
+    price_count: int
+    discount_count: int
+    discount_share: float  # доля записей со скидкой, %
+    avg_discount_percentage: Optional[float] = None
+    inflation_percentage: Optional[float] = None
+
+
+class PricePoint(BaseModel):
+    date: date
+    price: float
+
+
+class PriceHistoryResponse(BaseModel):
+    product_id: int
+    bucket: Optional[str] = None
+    agg: str
+    points: List[PricePoint]
+
+
 # Новые модели для инфляции
 
+# Способ усреднения изменений цен по продуктам
+InflationAgg = Literal["mean", "median", "trimmed", "geomean", "weighted"]
+
+
+class InflationCoverage(BaseModel):
+    products_total: int
+    products_used: int
+    # Нет цены на одну из дат, нулевая начальная цена или (для geomean)
+    # неположительное отношение цен
+    products_skipped: int
+
 
 class InflationResponse(BaseModel):
     inflation_percentage: Optional[float] = None
     start_date: date
     end_date: date
+    agg: str = "mean"
+    coverage: Optional[InflationCoverage] = None
 
     model_config = {"from_attributes": True}
 
@@ -143,6 +492,8 @@ class InflationOverallResponse(BaseModel):
     inflation_percentage: Optional[float] = None
     start_date: date
     end_date: date
+    agg: str = "mean"
+    coverage: Optional[InflationCoverage] = None
 
     model_config = {"from_attributes": True}
 
@@ -150,10 +501,178 @@ class InflationOverallResponse(BaseModel):
 class InflationOverallAllTimeResponse(BaseModel):
     inflation_percentage: Optional[float] = None
     observation_period: Optional[str] = "All Time"
+    agg: str = "mean"
+    coverage: Optional[InflationCoverage] = None
+
+    model_config = {"from_attributes": True}
+
+
+class ChangeResponse(BaseModel):
+    Seq: int
+    Entity: str
+    Op: str
+    EntityID: int
+    CreatedAt: datetime
+
+    model_config = {"from_attributes": True}
+
+
+class ChangeFeedResponse(BaseModel):
+    changes: List[ChangeResponse]
+    last_seq: int
+
+
+class ScrapeJobResponse(BaseModel):
+    JobID: int
+    ProductID: int
+    Url: str
+    Store: str
+    Status: str
+    Attempts: int
+    MaxAttempts: int
+    NextRunAt: datetime
+    LastError: Optional[str] = None
+    UpdatedAt: datetime
+
+    model_config = {"from_attributes": True}
+
+
+class StoreCircuitResponse(BaseModel):
+    Store: str
+    ConsecutiveFailures: int
+    OpenUntil: Optional[datetime] = None
+
+    model_config = {"from_attributes": True}
+
+
+class ScrapeScheduleResponse(BaseModel):
+    ProductID: int
+    ChangeRate: float
+    PromoRate: float
+    IntervalHours: float
+    LastScrapedAt: Optional[datetime] = None
+    NextScrapeAt: datetime
+
+    model_config = {"from_attributes": True}
+
+
+class QuarantinedPriceResponse(BaseModel):
+    QuarantineID: int
+    ProductID: int
+    PriceID: Optional[int] = None
+    PriceWithDiscount: Optional[float] = None
+    PriceWithoutDiscount: Optional[float] = None
+    PriceDate: date
+    Baseline: Optional[float] = None
+    Reasons: str
+    Source: str
+    Status: str
+    CreatedAt: datetime
+
+    model_config = {"from_attributes": True}
+
+
+class ProductMatchCreate(BaseModel):
+    ProductID: int
+    MatchedProductID: int
+
+
+class ProductMatchResponse(BaseModel):
+    MatchID: int
+    ProductID: int
+    Store: str
+    MatchedProductID: int
+    MatchedStore: str
+    Score: Optional[float] = None
+    Status: str
+    CreatedAt: datetime
 
     model_config = {"from_attributes": True}
 
 
+class MatchProposalResponse(BaseModel):
+    products: int
+    proposed: int
+    seconds: float
+
+
+class ComparePair(BaseModel):
+    match_id: int
+    category_id: Optional[int] = None
+    product_id: int
+    product_name: str
+    price: Optional[float] = None
+    price_date: Optional[date] = None
+    matched_product_id: int
+    matched_product_name: str
+    matched_price: Optional[float] = None
+    matched_price_date: Optional[date] = None
+
+
+class CompareCategorySummary(BaseModel):
+    category_id: Optional[int] = None
+    pairs: int
+    cheaper: int  # дешевле в store
+    matched_cheaper: int  # дешевле в matched_store
+    equal: int
+    average_difference_percentage: Optional[float] = None
+
+
+class CompareResponse(BaseModel):
+    store: str
+    matched_store: str
+    pairs: List[ComparePair]
+    categories: List[CompareCategorySummary]
+
+
+class ProductMoveRequest(BaseModel):
+    ToCategoryID: int
+    FromCategoryID: Optional[int] = None
+    ProductIDs: Optional[List[int]] = None
+
+
+class PricePurgeRequest(BaseModel):
+    StartDate: date
+    EndDate: date
+    CategoryID: Optional[int] = None
+    Store: Optional[str] = None
+
+
+class BulkOperationResponse(BaseModel):
+    products_updated: int = 0
+    products_deleted: int = 0
+    prices_deleted: int = 0
+    seconds: float
+
+
+class InflationSpec(BaseModel):
+    scope: Literal["product", "category", "overall"]
+    id: Optional[int] = None
+    start_date: date
+    end_date: date
+    agg: InflationAgg = "mean"
+
+
+class InflationBatchRequest(BaseModel):
+    specs: List[InflationSpec]
+
+
+class InflationBatchItem(BaseModel):
+    scope: str
+    id: Optional[int] = None
+    name: Optional[str] = None
+    start_date: date
+    end_date: date
+    agg: str = "mean"
+    inflation_percentage: Optional[float] = None
+    coverage: Optional[InflationCoverage] = None
+    detail: Optional[str] = None
+
+
+class InflationBatchResponse(BaseModel):
+    results: List[InflationBatchItem]
+
+
 # Создание сессии для работы с БД
 def get_db():
     SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -164,8 +683,26 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 # Инициализация FastAPI приложения
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Схема проверяется до приёма запросов, остальной прогрев идёт в фоне,
+    # а /health/ready сообщает балансировщику, когда он закончен
+    warmup_state["steps"]["import"] = round(time.perf_counter() - IMPORT_STARTED, 3)
+    await run_in_threadpool(run_warmup_step, "schema", lambda: init_database(engine))
+    start_background_tasks()
+    warmup_task = asyncio.create_task(warm_up())
+    yield
+    warmup_task.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
 
 origins = ["*"]
 
@@ -177,6 +714,56 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Профилирование запросов: по заголовку X-Profile от администратора и
+# выборочно — каждый PROFILE_SAMPLE_EVERY-й запрос маршрута
+PROFILE_POLICY = ProfilePolicy(
+    admin_token=ADMIN_TOKEN,
+    sample_every=int(os.getenv("PROFILE_SAMPLE_EVERY", "0")),
+    directory=os.getenv("PROFILE_DIR", "profiles"),
+    keep=int(os.getenv("PROFILE_KEEP", "200")),
+)
+if PROFILE_POLICY.enabled:
+    install_profiling(
+        app,
+        PROFILE_POLICY,
+        engines=[engine] + ([async_engine.sync_engine] if async_engine else []),
+    )
+
+
+# Политика повторов парсинга и предохранителя магазинов
+SCRAPE_POLICY = ScrapePolicy(
+    max_attempts=int(os.getenv("SCRAPE_MAX_ATTEMPTS", "5")),
+    base_delay=float(os.getenv("SCRAPE_BASE_DELAY_SECONDS", "30")),
+    max_delay=float(os.getenv("SCRAPE_MAX_DELAY_SECONDS", "3600")),
+    failure_threshold=int(os.getenv("SCRAPE_CIRCUIT_THRESHOLD", "5")),
+    cooldown_seconds=float(os.getenv("SCRAPE_CIRCUIT_COOLDOWN_SECONDS", "900")),
+)
+
+page_cache.ttl_seconds = SCRAPE_PAGE_CACHE_SECONDS
+
+# Пороги проверки спарсенных цен перед записью
+ANOMALY_POLICY = AnomalyPolicy(
+    z_threshold=float(os.getenv("ANOMALY_Z_THRESHOLD", "6")),
+    jump_ratio=float(os.getenv("ANOMALY_JUMP_RATIO", "3")),
+)
+
+# Пороги поиска одинаковых товаров разных магазинов
+MATCH_POLICY = MatchPolicy(
+    min_score=float(os.getenv("MATCH_MIN_SCORE", "0.6")),
+)
+
+SCHEDULE_POLICY = SchedulePolicy(
+    budget_per_hour=SCRAPE_BUDGET_PER_HOUR,
+    min_interval_hours=float(os.getenv("SCRAPE_MIN_INTERVAL_HOURS", "1")),
+    max_interval_hours=float(os.getenv("SCRAPE_MAX_INTERVAL_HOURS", "168")),
+    promo_weight=float(os.getenv("SCRAPE_PROMO_WEIGHT", "2")),
+)
+
+# Кэши в памяти процесса, согласованные между воркерами через версии в БД
+categories_cache = VersionedCache("categories")
+prices_cache = VersionedCache("prices")
+price_store = CompactPriceStore(path=PRICE_STORE_PATH)
+
 
 # Вспомогательные функции
 def get_valid_price(price_record: Price) -> Optional[float]:
@@ -202,6 +789,9 @@ def get_price_on_or_before(db: Session, product_id: int, target_date: date):
     """
     Получить последнюю цену продукта на или до заданной даты.
     """
+    if PRICE_STORE:
+        price_store.refresh(db, Price)
+        return price_store.price_on_or_before(product_id, target_date)
     return (
         db.query(Price)
         .filter(Price.ProductID == product_id, Price.PriceDate <= target_date)
@@ -210,6 +800,186 @@ def get_price_on_or_before(db: Session, product_id: int, target_date: date):
     )
 
 
+def prices_as_of_query(last_date: date, product_ids=None):
+    """
+    Запрос истории цен до заданной даты, упорядоченной по (ProductID, PriceDate).
+    Общий для синхронной и асинхронной сессий.
+    """
+    query = select(
+        Price.ProductID,
+        Price.PriceDate,
+        Price.PriceWithDiscount,
+        Price.PriceWithoutDiscount,
+    ).filter(Price.PriceDate <= last_date)
+    if product_ids is not None:
+        query = query.filter(Price.ProductID.in_(product_ids))
+    return query.order_by(Price.ProductID, Price.PriceDate)
+
+
+def prices_as_of_queries(last_date: date, product_ids=None):
+    """
+    prices_as_of_query, разбитый на пачки по ID_CHUNK продуктов (лимит
+    параметров SQLite на больших категориях). Пачки идут по возрастанию
+    ProductID, поэтому их результаты склеиваются без нарушения порядка.
+    """
+    if product_ids is None:
+        return [prices_as_of_query(last_date)]
+    ids = sorted(set(product_ids))
+    return [
+        prices_as_of_query(last_date, ids[i : i + ID_CHUNK])
+        for i in range(0, len(ids), ID_CHUNK)
+    ]
+
+
+def collect_prices_as_of(rows, dates):
+    """
+    Собрать цены всех продуктов на или до каждой из дат за один проход.
+    rows — результат prices_as_of_query. Возвращает {дата: {ProductID: цена}};
+    продукт отсутствует в словаре, если до этой даты у него нет записей,
+    и имеет цену None, если в последней записи обе цены пустые
+    (как в get_valid_price).
+    """
+    dates = sorted(set(dates))
+    snapshot = {d: {} for d in dates}
+    for product_id, records in groupby(rows, key=lambda r: r.ProductID):
+        i = 0
+        last = None
+        for record in records:
+            while i < len(dates) and dates[i] < record.PriceDate:
+                if last is not None:
+                    snapshot[dates[i]][product_id] = get_valid_price(last)
+                i += 1
+            last = record
+        for d in dates[i:]:
+            snapshot[d][product_id] = get_valid_price(last)
+    return snapshot
+
+
+def get_prices_as_of(db: Session, dates, product_ids=None):
+    """
+    Получить цены продуктов (по умолчанию всех) на или до каждой из дат
+    одним запросом.
+    """
+    if not dates:
+        return {}
+    if PRICE_STORE:
+        price_store.refresh(db, Price)
+        return price_store.prices_as_of(dates, product_ids)
+    rows = chain.from_iterable(
+        db.execute(query.execution_options(yield_per=10000))
+        for query in prices_as_of_queries(max(dates), product_ids)
+    )
+    return collect_prices_as_of(rows, dates)
+
+
+def aggregate_inflation(start_prices: dict, end_prices: dict, product_ids, agg: str):
+    """
+    Усреднить инфляцию по продуктам из снимков цен на две даты за один
+    проход. Продукты без данных на одну из дат пропускаются и учитываются
+    в покрытии. Возвращает (инфляция или None, покрытие).
+    """
+    aggregator = ChangeAggregator()
+    for product_id in product_ids:
+        start_price = start_prices.get(product_id)
+        end_price = end_prices.get(product_id)
+        if start_price is None or end_price is None:
+            continue  # Пропустить, если недостаточно данных
+        aggregator.add(start_price, end_price)
+    used = aggregator.count(agg)
+    coverage = InflationCoverage(
+        products_total=len(product_ids),
+        products_used=used,
+        products_skipped=len(product_ids) - used,
+    )
+    inflation = aggregator.result(agg)
+    return (round(inflation, 2) if inflation is not None else None), coverage
+
+
+def build_inflation_batch(specs, snapshot, products, category_names):
+    """
+    Посчитать все запрошенные показатели инфляции по общему снимку цен.
+    products — строки (ProductID, ProductName, CategoryID).
+    """
+    product_names = {p.ProductID: p.ProductName for p in products}
+    category_products = {}
+    for p in products:
+        category_products.setdefault(p.CategoryID, []).append(p.ProductID)
+
+    results = []
+    for spec in specs:
+        item = InflationBatchItem(
+            scope=spec.scope,
+            id=spec.id,
+            start_date=spec.start_date,
+            end_date=spec.end_date,
+        )
+        results.append(item)
+
+        if spec.scope == "product":
+            if spec.id not in product_names:
+                item.detail = "Product not found"
+                continue
+            item.name = product_names[spec.id]
+            product_ids = [spec.id]
+        elif spec.scope == "category":
+            if spec.id not in category_names:
+                item.detail = "Category not found"
+                continue
+            item.name = category_names[spec.id]
+            product_ids = category_products.get(spec.id, [])
+            if not product_ids:
+                item.detail = "No products found in this category"
+                continue
+        else:
+            product_ids = list(product_names)
+            if not product_ids:
+                item.detail = "No products found"
+                continue
+
+        item.agg = spec.agg
+        item.inflation_percentage, item.coverage = aggregate_inflation(
+            snapshot[spec.start_date], snapshot[spec.end_date], product_ids, spec.agg
+        )
+        if item.inflation_percentage is None:
+            item.detail = "Insufficient price data to calculate inflation"
+
+    return InflationBatchResponse(results=results)
+
+
+def make_all_time_response(stats, product_ids, agg: str):
+    """
+    Инфляция за всё время по строкам (ProductID, FirstPrice, LastPrice).
+    """
+    inflation, coverage = aggregate_inflation(
+        {row.ProductID: row.FirstPrice for row in stats},
+        {row.ProductID: row.LastPrice for row in stats},
+        product_ids,
+        agg,
+    )
+    if inflation is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Insufficient price data to calculate overall inflation",
+        )
+    return InflationOverallAllTimeResponse(
+        inflation_percentage=inflation,
+        observation_period="All Time",
+        agg=agg,
+        coverage=coverage,
+    )
+
+
+def build_fts_query(q: str) -> Optional[str]:
+    """
+    Преобразовать пользовательскую строку в безопасный запрос FTS5.
+    Каждое слово экранируется и ищется по префиксу (для подсказок при вводе).
+    """
+    tokens = re.findall(r"\w+", q.lower())
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
 def calculate_inflation(start_price: float, end_price: float) -> Optional[float]:
     """
     Рассчитать процентное изменение цены (инфляцию).
@@ -239,6 +1009,7 @@ def create_category(category: CategoryCreate, db: Session = Depends(get_db)):
         CategoryName=category.CategoryName, Description=category.Description
     )
     db.add(db_category)
+    bump_cache_version(db, "categories")
     db.commit()
     db.refresh(db_category)
     return db_category
@@ -246,7 +1017,14 @@ def create_category(category: CategoryCreate, db: Session = Depends(get_db)):
 
 @app.get("/categories/", response_model=List[CategoryResponse])
 def get_categories(db: Session = Depends(get_db)):
-    return db.query(Category).all()
+    version = get_cache_version(db, "categories")
+    categories = categories_cache.get(version, "all")
+    if categories is None:
+        categories = [
+            CategoryResponse.model_validate(c) for c in db.query(Category).all()
+        ]
+        categories_cache.set(version, "all", categories)
+    return categories
 
 
 @app.get("/categories/{category_id}", response_model=CategoryResponse)
@@ -281,6 +1059,7 @@ def update_category(
 
     db_category.CategoryName = updated_category.CategoryName
     db_category.Description = updated_category.Description
+    bump_cache_version(db, "categories")
     db.commit()
     db.refresh(db_category)
     return db_category
@@ -297,6 +1076,7 @@ def delete_category(category_id: int, db: Session = Depends(get_db)):
             status_code=400, detail="Cannot delete category with associated products"
         )
     db.delete(db_category)
+    bump_cache_version(db, "categories")
     db.commit()
     return {"detail": "Category deleted successfully"}
 
@@ -307,20 +1087,12 @@ def delete_category(category_id: int, db: Session = Depends(get_db)):
 @app.post("/products/", response_model=ProductResponse)
 def create_product(product: ProductCreate, db: Session = Depends(get_db)):
     # Валидация URL
-    url = product.ProductLink.lower()
-    if "magnit" in url and "5ka" in url:
-        raise HTTPException(
-            status_code=400,
-            detail="URL не должен содержать одновременно 'magnit' и '5ka'",
-        )
-    elif "magnit" in url:
-        parser = parse_magnit
-    elif "5ka" in url:
-        parser = parse_5ka
-    else:
+    store = get_store_for_url(product.ProductLink)
+    if store is None:
         raise HTTPException(
             status_code=400,
-            detail="URL должен содержать 'magnit' или '5ka'",
+            detail="URL должен вести на сайт поддерживаемого магазина: "
+            + ", ".join(STORE_PARSERS),
         )
 
     # Проверка существования категории
@@ -349,38 +1121,33 @@ def create_product(product: ProductCreate, db: Session = Depends(get_db)):
     db.commit()
     db.refresh(db_product)
 
-    # Парсинг цены
-    try:
-        with get_driver() as driver:
-            parsed_prices = parser(driver, product.ProductLink)
-    except Exception as e:
-        # Если парсинг не удался, удаляем созданный продукт
-        db.delete(db_product)
-        db.commit()
-        raise HTTPException(
-            status_code=500, detail=f"Ошибка при парсинге цены: {str(e)}"
-        )
+    # Парсинг цены; при ошибке продукт сохраняется, а цена будет получена
+    # повторной попыткой из очереди
+    parsed_prices = scrape_now_or_enqueue(
+        db, db_product.ProductID, product.ProductLink, store
+    )
 
     # Проверка и создание цены, если данные получены
     price_with_discount = None
     price_without_discount = None
     price_date = None
 
-    if parsed_prices:
-        price_with_discount = parsed_prices.get("price_with_discount")
-        price_without_discount = parsed_prices.get("price_without_discount")
-        if price_with_discount is not None or price_without_discount is not None:
-            price_date = (
-                datetime.utcnow().date()
-            )  # Изменено с isoformat() на date объект
-            db_price = Price(
-                ProductID=db_product.ProductID,
-                PriceWithDiscount=price_with_discount,
-                PriceWithoutDiscount=price_without_discount,
-                PriceDate=price_date,
-            )
-            db.add(db_price)
-            db.commit()
+    # Подозрительная цена уходит в карантин и не записывается
+    accepted = validate_parsed_prices(db, {db_product.ProductID: parsed_prices})
+    if db_product.ProductID in accepted:
+        price_with_discount, price_without_discount = accepted[db_product.ProductID]
+        price_date = (
+            datetime.utcnow().date()
+        )  # Изменено с isoformat() на date объект
+        db_price = Price(
+            ProductID=db_product.ProductID,
+            PriceWithDiscount=price_with_discount,
+            PriceWithoutDiscount=price_without_discount,
+            PriceDate=price_date,
+        )
+        db.add(db_price)
+        bump_cache_version(db, "prices")
+    db.commit()
 
     return ProductResponse(
         ProductID=db_product.ProductID,
@@ -409,12 +1176,12 @@ def get_products(db: Session = Depends(get_db)):
                 ProductLink=product.ProductLink,
                 LatestPriceWithDiscount=(
                     float(latest_price.PriceWithDiscount)
-                    if latest_price.PriceWithDiscount
+                    if latest_price and latest_price.PriceWithDiscount
                     else None
                 ),
                 LatestPriceWithoutDiscount=(
                     float(latest_price.PriceWithoutDiscount)
-                    if latest_price.PriceWithoutDiscount
+                    if latest_price and latest_price.PriceWithoutDiscount
                     else None
                 ),
                 LatestPriceDate=latest_price.PriceDate if latest_price else None,
@@ -423,6 +1190,64 @@ def get_products(db: Session = Depends(get_db)):
     return response
 
 
+@app.get("/products/search", response_model=ProductSearchResponse)
+def search_products(
+    q: str,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+):
+    fts_query = build_fts_query(q)
+    if fts_query is None:
+        raise HTTPException(status_code=400, detail="Пустой поисковый запрос")
+
+    if db.get_bind().dialect.name != "sqlite":
+        # Без FTS5 — простой поиск по подстроке в названии
+        base = (
+            db.query(Product, Category.CategoryName)
+            .outerjoin(Category, Category.CategoryID == Product.CategoryID)
+            .filter(Product.ProductName.ilike(f"%{q}%"))
+        )
+        total = base.count()
+        rows = base.order_by(Product.ProductName).offset(offset).limit(limit).all()
+        items = [
+            ProductSearchHit(
+                ProductID=product.ProductID,
+                ProductName=product.ProductName,
+                CategoryID=product.CategoryID,
+                CategoryName=category_name,
+                ProductLink=product.ProductLink,
+            )
+            for product, category_name in rows
+        ]
+        return ProductSearchResponse(
+            total=total, limit=limit, offset=offset, items=items
+        )
+
+    total = db.execute(
+        text("SELECT count(*) FROM products_fts WHERE products_fts MATCH :q"),
+        {"q": fts_query},
+    ).scalar()
+    # Совпадение в названии весит больше, чем в названии категории
+    rows = db.execute(
+        text(
+            """
+            SELECT p.ProductID, p.ProductName, p.CategoryID, c.CategoryName,
+                   p.ProductLink, bm25(products_fts, 10.0, 1.0) AS rank
+            FROM products_fts
+            JOIN products p ON p.ProductID = products_fts.rowid
+            LEFT JOIN categories c ON c.CategoryID = p.CategoryID
+            WHERE products_fts MATCH :q
+            ORDER BY rank
+            LIMIT :limit OFFSET :offset
+            """
+        ),
+        {"q": fts_query, "limit": limit, "offset": offset},
+    ).mappings()
+    items = [ProductSearchHit(**row) for row in rows]
+    return ProductSearchResponse(total=total, limit=limit, offset=offset, items=items)
+
+
 @app.get("/products/{product_id}", response_model=ProductResponse)
 def get_product(product_id: int, db: Session = Depends(get_db)):
     db_product = (
@@ -445,18 +1270,127 @@ def get_product(product_id: int, db: Session = Depends(get_db)):
         ProductLink=db_product.ProductLink,
         LatestPriceWithDiscount=(
             float(latest_price.PriceWithDiscount)
-            if latest_price.PriceWithDiscount
+            if latest_price and latest_price.PriceWithDiscount
             else None
         ),
         LatestPriceWithoutDiscount=(
             float(latest_price.PriceWithoutDiscount)
-            if latest_price.PriceWithoutDiscount
+            if latest_price and latest_price.PriceWithoutDiscount
             else None
         ),
         LatestPriceDate=latest_price.PriceDate if latest_price else None,
     )
 
 
+@app.get("/products/{product_id}/prices", response_model=PriceHistoryResponse)
+def get_product_price_history(
+    product_id: int,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    bucket: Optional[Literal["day", "week", "month"]] = None,
+    agg: Literal["last", "min", "max", "avg"] = "last",
+    points: Optional[int] = Query(None, ge=3),
+    db: Session = Depends(get_db),
+):
+    db_product = db.query(Product).filter(Product.ProductID == product_id).first()
+    if db_product is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+
+    # Та же логика, что и в get_valid_price: сначала цена со скидкой
+    value = func.coalesce(Price.PriceWithDiscount, Price.PriceWithoutDiscount)
+    if bucket == "week":
+        # Начало недели (понедельник)
+        bucket_expr = func.date(Price.PriceDate, "weekday 0", "-6 days")
+    elif bucket == "month":
+        bucket_expr = func.strftime("%Y-%m-01", Price.PriceDate)
+    else:
+        bucket_expr = func.date(Price.PriceDate)
+
+    filters = [Price.ProductID == product_id, value.isnot(None)]
+    if start is not None:
+        filters.append(Price.PriceDate >= start)
+    if end is not None:
+        filters.append(Price.PriceDate <= end)
+
+    # Диапазонная выборка по индексу (ProductID, PriceDate), агрегация в SQL
+    if agg == "last":
+        ranked = (
+            db.query(
+                bucket_expr.label("bucket"),
+                value.label("value"),
+                func.row_number()
+                .over(partition_by=bucket_expr, order_by=Price.PriceDate.desc())
+                .label("rn"),
+            )
+            .filter(*filters)
+            .subquery()
+        )
+        rows = (
+            db.query(ranked.c.bucket, ranked.c.value)
+            .filter(ranked.c.rn == 1)
+            .order_by(ranked.c.bucket)
+            .all()
+        )
+    else:
+        aggregate = {"min": func.min, "max": func.max, "avg": func.avg}[agg]
+        rows = (
+            db.query(bucket_expr.label("bucket"), aggregate(value))
+            .filter(*filters)
+            .group_by(bucket_expr)
+            .order_by(bucket_expr)
+            .all()
+        )
+
+    series = [(date.fromisoformat(b).toordinal(), float(v)) for b, v in rows]
+    if points is not None:
+        series = lttb(series, points)
+
+    return PriceHistoryResponse(
+        product_id=product_id,
+        bucket=bucket,
+        agg=agg,
+        points=[
+            PricePoint(date=date.fromordinal(int(x)), price=round(y, 2))
+            for x, y in series
+        ],
+    )
+
+
+def make_price_stats_response(stats: ProductPriceStats) -> ProductPriceStatsResponse:
+    inflation = calculate_inflation(stats.FirstPrice, stats.LastPrice)
+    return ProductPriceStatsResponse(
+        product_id=stats.ProductID,
+        first_date=stats.FirstDate,
+        first_price=round(stats.FirstPrice, 2),
+        last_date=stats.LastDate,
+        last_price=round(stats.LastPrice, 2),
+        min_price=round(stats.MinPrice, 2),
+        max_price=round(stats.MaxPrice, 2),
+        avg_price=round(stats.PriceSum / stats.Count, 2),
+        price_count=stats.Count,
+        discount_count=stats.DiscountCount,
+        discount_share=round(stats.DiscountCount / stats.Count * 100, 2),
+        avg_discount_percentage=(
+            round(stats.DiscountSum / stats.DiscountCount, 2)
+            if stats.DiscountCount
+            else None
+        ),
+        inflation_percentage=round(inflation, 2) if inflation is not None else None,
+    )
+
+
+@app.get("/products/{product_id}/stats", response_model=ProductPriceStatsResponse)
+def get_product_price_stats(product_id: int, db: Session = Depends(get_db)):
+    stats = db.get(ProductPriceStats, product_id)
+    if stats is None:
+        if db.get(Product, product_id) is None:
+            raise HTTPException(status_code=404, detail="Product not found")
+        raise HTTPException(
+            status_code=404, detail="Insufficient price data for inflation calculation"
+        )
+    return make_price_stats_response(stats)
+
+
 @app.put("/products/{product_id}", response_model=ProductResponse)
 def update_product(
     product_id: int, updated_product: ProductCreate, db: Session = Depends(get_db)
@@ -466,20 +1400,12 @@ def update_product(
         raise HTTPException(status_code=404, detail="Product not found")
 
     # Валидация URL
-    url = updated_product.ProductLink.lower()
-    if "magnit" in url and "5ka" in url:
-        raise HTTPException(
-            status_code=400,
-            detail="URL не должен содержать одновременно 'magnit' и '5ka'",
-        )
-    elif "magnit" in url:
-        parser = parse_magnit
-    elif "5ka" in url:
-        parser = parse_5ka
-    else:
+    store = get_store_for_url(updated_product.ProductLink)
+    if store is None:
         raise HTTPException(
             status_code=400,
-            detail="URL должен содержать 'magnit' или '5ka'",
+            detail="URL должен вести на сайт поддерживаемого магазина: "
+            + ", ".join(STORE_PARSERS),
         )
 
     # Проверка существования категории
@@ -511,47 +1437,40 @@ def update_product(
     db.commit()
     db.refresh(db_product)
 
-    # Парсинг цены
-    try:
-        with get_driver() as driver:
-            parsed_prices = parser(driver, updated_product.ProductLink)
-    except Exception as e:
-        raise HTTPException(
-            status_code=500, detail=f"Ошибка при парсинге цены: {str(e)}"
-        )
+    # Парсинг цены; при ошибке возвращается текущая цена, а обновление
+    # выполнится повторной попыткой из очереди
+    parsed_prices = scrape_now_or_enqueue(
+        db, db_product.ProductID, updated_product.ProductLink, store
+    )
 
-    # Проверка и создание цены, если данные получены
-    price_with_discount = None
-    price_without_discount = None
-    price_date = None
-
-    if parsed_prices:
-        price_with_discount = parsed_prices.get("price_with_discount")
-        price_without_discount = parsed_prices.get("price_without_discount")
-        if price_with_discount is not None or price_without_discount is not None:
-            price_date = datetime.utcnow().date()
-            # Получаем последнюю цену для продукта
-            db_price = (
-                db.query(Price)
-                .filter(Price.ProductID == db_product.ProductID)
-                .order_by(Price.PriceDate.desc())
-                .first()
+    # Проверка и создание цены, если данные получены и прошли проверку
+    accepted = validate_parsed_prices(db, {db_product.ProductID: parsed_prices})
+    if db_product.ProductID in accepted:
+        price_with_discount, price_without_discount = accepted[db_product.ProductID]
+        price_date = datetime.utcnow().date()
+        # Получаем последнюю цену для продукта
+        db_price = (
+            db.query(Price)
+            .filter(Price.ProductID == db_product.ProductID)
+            .order_by(Price.PriceDate.desc())
+            .first()
+        )
+        if db_price:
+            # Обновляем существующую цену
+            db_price.PriceWithDiscount = price_with_discount
+            db_price.PriceWithoutDiscount = price_without_discount
+            db_price.PriceDate = price_date
+        else:
+            # Создаем новую цену
+            db_price = Price(
+                ProductID=db_product.ProductID,
+                PriceWithDiscount=price_with_discount,
+                PriceWithoutDiscount=price_without_discount,
+                PriceDate=price_date,
             )
-            if db_price:
-                # Обновляем существующую цену
-                db_price.PriceWithDiscount = price_with_discount
-                db_price.PriceWithoutDiscount = price_without_discount
-                db_price.PriceDate = price_date
-            else:
-                # Создаем новую цену
-                db_price = Price(
-                    ProductID=db_product.ProductID,
-                    PriceWithDiscount=price_with_discount,
-                    PriceWithoutDiscount=price_without_discount,
-                    PriceDate=price_date,
-                )
-                db.add(db_price)
-            db.commit()
+            db.add(db_price)
+        bump_cache_version(db, "prices")
+    db.commit()
 
     # Получение последней цены для ответа
     latest_price = None
@@ -565,12 +1484,12 @@ def update_product(
         ProductLink=db_product.ProductLink,
         LatestPriceWithDiscount=(
             float(latest_price.PriceWithDiscount)
-            if latest_price.PriceWithDiscount
+            if latest_price and latest_price.PriceWithDiscount
             else None
         ),
         LatestPriceWithoutDiscount=(
             float(latest_price.PriceWithoutDiscount)
-            if latest_price.PriceWithoutDiscount
+            if latest_price and latest_price.PriceWithoutDiscount
             else None
         ),
         LatestPriceDate=latest_price.PriceDate if latest_price else None,
@@ -582,7 +1501,7 @@ def delete_product(product_id: int, db: Session = Depends(get_db)):
     db_product = db.query(Product).filter(Product.ProductID == product_id).first()
     if not db_product:
         raise HTTPException(status_code=404, detail="Product not found")
-    db.delete(db_product)
+    delete_products_where(db, Product.ProductID == product_id)
     db.commit()
     return {"detail": "Product deleted successfully"}
 
@@ -605,6 +1524,7 @@ def create_price(price: PriceCreate, db: Session = Depends(get_db)):
         PriceDate=price.PriceDate,
     )
     db.add(db_price)
+    bump_cache_version(db, "prices")
     db.commit()
     db.refresh(db_price)
     return db_price
@@ -643,6 +1563,7 @@ def update_price(
     db_price.PriceWithDiscount = updated_price.PriceWithDiscount
     db_price.PriceWithoutDiscount = updated_price.PriceWithoutDiscount
     db_price.PriceDate = updated_price.PriceDate
+    bump_cache_version(db, "prices")
     db.commit()
     db.refresh(db_price)
     return db_price
@@ -654,16 +1575,671 @@ def delete_price(price_id: int, db: Session = Depends(get_db)):
     if not db_price:
         raise HTTPException(status_code=404, detail="Price not found")
     db.delete(db_price)
+    bump_cache_version(db, "prices")
     db.commit()
     return {"detail": "Price deleted successfully"}
 
 
+# Массовые операции
+
+
+def execute_bulk(db: Session, statement) -> int:
+    # Массовый запрос без синхронизации объектов сессии: строки не загружаются
+    return db.execute(statement, execution_options={"synchronize_session": False}).rowcount
+
+
+def store_link_filter(store: str):
+    """
+    Условие на ProductLink для продуктов магазина (по его доменам в реестре
+    парсеров), чтобы выбрать их одним запросом, как get_store_for_url.
+    """
+    conditions = []
+    for host in STORE_PARSERS[store].hosts:
+        for scheme in ("http", "https"):
+            conditions.append(Product.ProductLink.like(f"{scheme}://{host}/%"))
+            conditions.append(Product.ProductLink.like(f"{scheme}://%.{host}/%"))
+    return or_(*conditions)
+
+
+def delete_products_where(db: Session, condition) -> tuple:
+    """
+    Удалить продукты по условию вместе с ценами набором DELETE без загрузки
+    строк в сессию. Журнал изменений, статистика цен, расписание, очередь,
+    карантин и пары товаров обновляются в той же транзакции. Цены удаляются
+    явным запросом, а не каскадом: так известно их число, и это работает
+    на базах, созданных до ON DELETE CASCADE. Не коммитит.
+    Возвращает (удалено продуктов, удалено цен).
+    """
+    product_ids = select(Product.ProductID).where(condition)
+    log_bulk_changes(
+        db, "price", "delete", select(Price.PriceID).where(Price.ProductID.in_(product_ids))
+    )
+    log_bulk_changes(db, "product", "delete", product_ids)
+    for statement in (
+        delete(ProductPriceStats).where(ProductPriceStats.ProductID.in_(product_ids)),
+        delete(ScrapeSchedule).where(ScrapeSchedule.ProductID.in_(product_ids)),
+        # Захваченные задания обработчик пропустит сам: продукта уже нет
+        delete(ScrapeJob).where(
+            ScrapeJob.ProductID.in_(product_ids), ScrapeJob.Status != LEASED
+        ),
+        delete(QuarantinedPrice).where(QuarantinedPrice.ProductID.in_(product_ids)),
+        delete(ProductMatch).where(
+            or_(
+                ProductMatch.ProductID.in_(product_ids),
+                ProductMatch.MatchedProductID.in_(product_ids),
+            )
+        ),
+    ):
+        execute_bulk(db, statement)
+    prices = execute_bulk(db, delete(Price).where(Price.ProductID.in_(product_ids)))
+    products = execute_bulk(db, delete(Product).where(condition))
+    bump_cache_version(db, "prices")
+    return products, prices
+
+
+def purge_prices_where(db: Session, condition) -> int:
+    """
+    Удалить записи цен по условию одним DELETE и пересчитать статистику
+    затронутых продуктов. Не коммитит. Возвращает число удалённых записей.
+    """
+    product_ids = (
+        db.execute(select(Price.ProductID).where(condition).distinct()).scalars().all()
+    )
+    price_ids = select(Price.PriceID).where(condition)
+    log_bulk_changes(db, "price", "delete", price_ids)
+    execute_bulk(db, delete(QuarantinedPrice).where(QuarantinedPrice.PriceID.in_(price_ids)))
+    deleted = execute_bulk(db, delete(Price).where(condition))
+    refresh_price_stats(db, Price, product_ids)
+    bump_cache_version(db, "prices")
+    return deleted
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    # Без ADMIN_TOKEN эндпоинты /admin недоступны
+    if not PROFILE_POLICY.is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+@app.post(
+    "/admin/products/move",
+    response_model=BulkOperationResponse,
+    dependencies=[Depends(require_admin)],
+)
+def move_products(request: ProductMoveRequest, db: Session = Depends(get_db)):
+    """
+    Перенести продукты (из категории FromCategoryID и/или из списка
+    ProductIDs) в категорию ToCategoryID одним UPDATE.
+    """
+    started = time.perf_counter()
+    if request.FromCategoryID is None and not request.ProductIDs:
+        raise HTTPException(
+            status_code=400, detail="FromCategoryID or ProductIDs is required"
+        )
+    if db.get(Category, request.ToCategoryID) is None:
+        raise HTTPException(status_code=404, detail="Category not found")
+    conditions = [
+        or_(Product.CategoryID.is_(None), Product.CategoryID != request.ToCategoryID)
+    ]
+    if request.FromCategoryID is not None:
+        conditions.append(Product.CategoryID == request.FromCategoryID)
+    if request.ProductIDs:
+        conditions.append(Product.ProductID.in_(request.ProductIDs))
+    condition = and_(*conditions)
+    log_bulk_changes(db, "product", "update", select(Product.ProductID).where(condition))
+    updated = execute_bulk(
+        db, update(Product).where(condition).values(CategoryID=request.ToCategoryID)
+    )
+    bump_cache_version(db, "prices")
+    db.commit()
+    return BulkOperationResponse(
+        products_updated=updated, seconds=round(time.perf_counter() - started, 3)
+    )
+
+
+@app.post(
+    "/admin/stores/{store}/purge",
+    response_model=BulkOperationResponse,
+    dependencies=[Depends(require_admin)],
+)
+def purge_store(store: str, db: Session = Depends(get_db)):
+    """
+    Удалить все продукты магазина вместе с историей цен.
+    """
+    started = time.perf_counter()
+    if store not in STORE_PARSERS:
+        raise HTTPException(status_code=404, detail="Store not found")
+    products, prices = delete_products_where(db, store_link_filter(store))
+    db.commit()
+    return BulkOperationResponse(
+        products_deleted=products,
+        prices_deleted=prices,
+        seconds=round(time.perf_counter() - started, 3),
+    )
+
+
+@app.post(
+    "/admin/prices/purge",
+    response_model=BulkOperationResponse,
+    dependencies=[Depends(require_admin)],
+)
+def purge_prices(request: PricePurgeRequest, db: Session = Depends(get_db)):
+    """
+    Удалить записи цен за период [StartDate, EndDate], при необходимости
+    только для категории или магазина.
+    """
+    started = time.perf_counter()
+    if request.StartDate > request.EndDate:
+        raise HTTPException(status_code=400, detail="StartDate must not be after EndDate")
+    conditions = [Price.PriceDate.between(request.StartDate, request.EndDate)]
+    if request.CategoryID is not None:
+        conditions.append(
+            Price.ProductID.in_(
+                select(Product.ProductID).where(Product.CategoryID == request.CategoryID)
+            )
+        )
+    if request.Store is not None:
+        if request.Store not in STORE_PARSERS:
+            raise HTTPException(status_code=404, detail="Store not found")
+        conditions.append(
+            Price.ProductID.in_(
+                select(Product.ProductID).where(store_link_filter(request.Store))
+            )
+        )
+    deleted = purge_prices_where(db, and_(*conditions))
+    db.commit()
+    return BulkOperationResponse(
+        prices_deleted=deleted, seconds=round(time.perf_counter() - started, 3)
+    )
+
+
+# Очередь парсинга
+
+
+@app.get("/scrape/jobs", response_model=List[ScrapeJobResponse])
+def get_scrape_jobs(
+    status: Optional[Literal["pending", "leased", "done", "dead"]] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+):
+    query = db.query(ScrapeJob)
+    if status is not None:
+        query = query.filter(ScrapeJob.Status == status)
+    return query.order_by(ScrapeJob.UpdatedAt.desc()).limit(limit).all()
+
+
+@app.post("/scrape/jobs/{job_id}/retry", response_model=ScrapeJobResponse)
+def retry_scrape_job(job_id: int, db: Session = Depends(get_db)):
+    job = db.get(ScrapeJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Scrape job not found")
+    if job.Status != "dead":
+        raise HTTPException(status_code=400, detail="Only dead jobs can be retried")
+    retry_dead_job(db, job)
+    return job
+
+
+@app.get("/scrape/circuits", response_model=List[StoreCircuitResponse])
+def get_store_circuits(db: Session = Depends(get_db)):
+    return db.query(StoreCircuit).all()
+
+
+@app.get("/scrape/schedule", response_model=List[ScrapeScheduleResponse])
+def get_scrape_schedule(
+    limit: int = Query(100, ge=1, le=1000), db: Session = Depends(get_db)
+):
+    return db.query(ScrapeSchedule).order_by(ScrapeSchedule.NextScrapeAt).limit(limit).all()
+
+
+# Карантин подозрительных цен
+
+
+@app.get("/quarantine", response_model=List[QuarantinedPriceResponse])
+def get_quarantined_prices(
+    status: Optional[Literal["pending", "approved", "rejected"]] = "pending",
+    product_id: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+):
+    query = db.query(QuarantinedPrice)
+    if status is not None:
+        query = query.filter(QuarantinedPrice.Status == status)
+    if product_id is not None:
+        query = query.filter(QuarantinedPrice.ProductID == product_id)
+    return query.order_by(QuarantinedPrice.QuarantineID.desc()).limit(limit).all()
+
+
+def get_pending_quarantined_price(db: Session, quarantine_id: int) -> QuarantinedPrice:
+    entry = db.get(QuarantinedPrice, quarantine_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Quarantined price not found")
+    if entry.Status != "pending":
+        raise HTTPException(status_code=400, detail="Quarantined price already reviewed")
+    return entry
+
+
+@app.post("/quarantine/{quarantine_id}/approve", response_model=QuarantinedPriceResponse)
+def approve_quarantined_price(quarantine_id: int, db: Session = Depends(get_db)):
+    """
+    Признать цену верной. Спарсенная цена записывается в prices,
+    запись из истории остаётся как есть.
+    """
+    entry = get_pending_quarantined_price(db, quarantine_id)
+    if entry.Source == "scrape":
+        if db.get(Product, entry.ProductID) is None:
+            raise HTTPException(status_code=404, detail="Product not found")
+        upsert_daily_prices(
+            db,
+            {entry.ProductID: (entry.PriceWithDiscount, entry.PriceWithoutDiscount)},
+            entry.PriceDate,
+        )
+    entry.Status = "approved"
+    db.commit()
+    return entry
+
+
+@app.post("/quarantine/{quarantine_id}/reject", response_model=QuarantinedPriceResponse)
+def reject_quarantined_price(quarantine_id: int, db: Session = Depends(get_db)):
+    """
+    Отклонить цену. Запись из истории удаляется из prices.
+    """
+    entry = get_pending_quarantined_price(db, quarantine_id)
+    if entry.PriceID is not None:
+        db_price = db.get(Price, entry.PriceID)
+        if db_price is not None:
+            db.delete(db_price)
+            bump_cache_version(db, "prices")
+    entry.Status = "rejected"
+    db.commit()
+    return entry
+
+
+# Сопоставление товаров разных магазинов
+
+
+def get_product_match(db: Session, match_id: int) -> ProductMatch:
+    match = db.get(ProductMatch, match_id)
+    if match is None:
+        raise HTTPException(status_code=404, detail="Product match not found")
+    return match
+
+
+def confirm_product_match(db: Session, match: ProductMatch):
+    """
+    Подтвердить пару. Остальные предложения для этих товаров с тем же
+    магазином отклоняются: у товара не больше одного двойника в магазине.
+    """
+    match.Status = "confirmed"
+    db.query(ProductMatch).filter(
+        ProductMatch.Status == "proposed",
+        ProductMatch.MatchID != match.MatchID,
+        or_(
+            and_(
+                ProductMatch.ProductID == match.ProductID,
+                ProductMatch.MatchedStore == match.MatchedStore,
+            ),
+            and_(
+                ProductMatch.MatchedProductID == match.MatchedProductID,
+                ProductMatch.Store == match.Store,
+            ),
+        ),
+    ).update({ProductMatch.Status: "rejected"}, synchronize_session=False)
+
+
+@app.post("/matches/propose", response_model=MatchProposalResponse)
+def propose_product_matches(db: Session = Depends(get_db)):
+    """
+    Найти вероятные пары одинаковых товаров разных магазинов и сохранить
+    их на проверку. Уже рассмотренные пары и товары, у которых в том
+    магазине есть подтверждённый двойник, не предлагаются повторно.
+    """
+    started = time.perf_counter()
+    products = [
+        (product_id, name, get_store_for_url(link))
+        for product_id, name, link in db.query(
+            Product.ProductID, Product.ProductName, Product.ProductLink
+        )
+    ]
+    stores = {product_id: store for product_id, _, store in products}
+    known = db.query(
+        ProductMatch.ProductID,
+        ProductMatch.MatchedProductID,
+        ProductMatch.Store,
+        ProductMatch.MatchedStore,
+        ProductMatch.Status,
+    ).all()
+    confirmed = set()
+    for product_id, matched_id, store, matched_store, status in known:
+        if status == "confirmed":
+            confirmed.add((product_id, matched_store))
+            confirmed.add((matched_id, store))
+    proposals = [
+        {
+            "ProductID": product_id,
+            "Store": stores[product_id],
+            "MatchedProductID": matched_id,
+            "MatchedStore": stores[matched_id],
+            "Score": score,
+            "Status": "proposed",
+        }
+        for product_id, matched_id, score in propose_matches(
+            products, MATCH_POLICY, exclude={(row[0], row[1]) for row in known}
+        )
+        if (product_id, stores[matched_id]) not in confirmed
+        and (matched_id, stores[product_id]) not in confirmed
+    ]
+    if proposals:
+        db.execute(insert(ProductMatch), proposals)
+    db.commit()
+    return MatchProposalResponse(
+        products=len(products),
+        proposed=len(proposals),
+        seconds=round(time.perf_counter() - started, 3),
+    )
+
+
+@app.get("/matches", response_model=List[ProductMatchResponse])
+def get_product_matches(
+    status: Optional[Literal["proposed", "confirmed", "rejected"]] = "proposed",
+    product_id: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+):
+    query = db.query(ProductMatch)
+    if status is not None:
+        query = query.filter(ProductMatch.Status == status)
+    if product_id is not None:
+        query = query.filter(
+            or_(
+                ProductMatch.ProductID == product_id,
+                ProductMatch.MatchedProductID == product_id,
+            )
+        )
+    return (
+        query.order_by(ProductMatch.Score.desc(), ProductMatch.MatchID)
+        .limit(limit)
+        .all()
+    )
+
+
+@app.post("/matches", response_model=ProductMatchResponse)
+def create_product_match(match: ProductMatchCreate, db: Session = Depends(get_db)):
+    """
+    Вручную подтвердить пару, которую поиск не нашёл.
+    """
+    products = {
+        product.ProductID: product
+        for product in db.query(Product).filter(
+            Product.ProductID.in_([match.ProductID, match.MatchedProductID])
+        )
+    }
+    if len(products) != 2:
+        raise HTTPException(status_code=404, detail="Product not found")
+    stores = {
+        product_id: get_store_for_url(product.ProductLink)
+        for product_id, product in products.items()
+    }
+    if None in stores.values() or len(set(stores.values())) != 2:
+        raise HTTPException(
+            status_code=400, detail="Products must belong to different known stores"
+        )
+    left, right = sorted(products, key=lambda product_id: stores[product_id])
+    db_match = (
+        db.query(ProductMatch)
+        .filter(ProductMatch.ProductID == left, ProductMatch.MatchedProductID == right)
+        .first()
+    )
+    if db_match is None:
+        db_match = ProductMatch(
+            ProductID=left,
+            Store=stores[left],
+            MatchedProductID=right,
+            MatchedStore=stores[right],
+        )
+        db.add(db_match)
+        db.flush()
+    confirm_product_match(db, db_match)
+    db.commit()
+    db.refresh(db_match)
+    return db_match
+
+
+@app.post("/matches/{match_id}/confirm", response_model=ProductMatchResponse)
+def confirm_proposed_match(match_id: int, db: Session = Depends(get_db)):
+    match = get_product_match(db, match_id)
+    if match.Status != "proposed":
+        raise HTTPException(status_code=400, detail="Product match already reviewed")
+    confirm_product_match(db, match)
+    db.commit()
+    db.refresh(match)
+    return match
+
+
+@app.post("/matches/{match_id}/reject", response_model=ProductMatchResponse)
+def reject_proposed_match(match_id: int, db: Session = Depends(get_db)):
+    match = get_product_match(db, match_id)
+    if match.Status == "rejected":
+        raise HTTPException(status_code=400, detail="Product match already reviewed")
+    match.Status = "rejected"
+    db.commit()
+    db.refresh(match)
+    return match
+
+
+def confirmed_pairs_query(as_of: Optional[date] = None):
+    """
+    Подтверждённые пары с последними (на дату as_of) ценами обоих товаров
+    одним запросом: последние цены считаются оконной функцией только для
+    товаров из пар и присоединяются к паре дважды.
+    """
+    confirmed = ProductMatch.Status == "confirmed"
+    matched_ids = union(
+        select(ProductMatch.ProductID).where(confirmed),
+        select(ProductMatch.MatchedProductID).where(confirmed),
+    )
+    ranked = select(
+        Price.ProductID,
+        func.coalesce(Price.PriceWithDiscount, Price.PriceWithoutDiscount).label("Price"),
+        Price.PriceDate,
+        func.row_number()
+        .over(partition_by=Price.ProductID, order_by=Price.PriceDate.desc())
+        .label("rn"),
+    ).where(Price.ProductID.in_(matched_ids))
+    if as_of is not None:
+        ranked = ranked.where(Price.PriceDate <= as_of)
+    ranked = ranked.subquery()
+    latest = select(ranked).where(ranked.c.rn == 1).cte("latest_prices")
+    left, right = aliased(Product), aliased(Product)
+    left_price, right_price = latest.alias("left_price"), latest.alias("right_price")
+    return (
+        select(
+            ProductMatch.MatchID,
+            ProductMatch.Store,
+            left.ProductID,
+            left.ProductName,
+            left.CategoryID,
+            left_price.c.Price,
+            left_price.c.PriceDate,
+            right.ProductID,
+            right.ProductName,
+            right.CategoryID,
+            right_price.c.Price,
+            right_price.c.PriceDate,
+        )
+        .join(left, left.ProductID == ProductMatch.ProductID)
+        .join(right, right.ProductID == ProductMatch.MatchedProductID)
+        .outerjoin(left_price, left_price.c.ProductID == ProductMatch.ProductID)
+        .outerjoin(right_price, right_price.c.ProductID == ProductMatch.MatchedProductID)
+        .where(confirmed)
+    )
+
+
+@app.get("/compare", response_model=CompareResponse)
+def compare_stores(
+    store: str,
+    matched_store: str,
+    category_id: Optional[int] = None,
+    as_of: Optional[date] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Сравнить цены одинаковых товаров двух магазинов: подтверждённые пары
+    с последними ценами и сводка по категориям (категория товара store).
+    average_difference_percentage — насколько в среднем matched_store
+    дороже store (отрицательное значение — дешевле).
+    """
+    rows = db.execute(
+        confirmed_pairs_query(as_of).where(
+            or_(
+                and_(ProductMatch.Store == store, ProductMatch.MatchedStore == matched_store),
+                and_(ProductMatch.Store == matched_store, ProductMatch.MatchedStore == store),
+            )
+        )
+    ).all()
+    pairs = []
+    summary = {}
+    for row in rows:
+        match_id, row_store, *sides = row
+        left, right = sides[:5], sides[5:]
+        if row_store != store:
+            left, right = right, left
+        product_id, product_name, product_category, price, price_date = left
+        matched_id, matched_name, _, matched_price, matched_date = right
+        if category_id is not None and product_category != category_id:
+            continue
+        price = float(price) if price is not None else None
+        matched_price = float(matched_price) if matched_price is not None else None
+        pairs.append(
+            ComparePair(
+                match_id=match_id,
+                category_id=product_category,
+                product_id=product_id,
+                product_name=product_name,
+                price=price,
+                price_date=price_date,
+                matched_product_id=matched_id,
+                matched_product_name=matched_name,
+                matched_price=matched_price,
+                matched_price_date=matched_date,
+            )
+        )
+        counts = summary.setdefault(
+            product_category,
+            {"pairs": 0, "cheaper": 0, "matched_cheaper": 0, "equal": 0, "differences": []},
+        )
+        counts["pairs"] += 1
+        if price is None or matched_price is None:
+            continue
+        if price < matched_price:
+            counts["cheaper"] += 1
+        elif price > matched_price:
+            counts["matched_cheaper"] += 1
+        else:
+            counts["equal"] += 1
+        difference = calculate_inflation(price, matched_price)
+        if difference is not None:
+            counts["differences"].append(difference)
+    categories = [
+        CompareCategorySummary(
+            category_id=category,
+            pairs=counts["pairs"],
+            cheaper=counts["cheaper"],
+            matched_cheaper=counts["matched_cheaper"],
+            equal=counts["equal"],
+            average_difference_percentage=(
+                round(sum(counts["differences"]) / len(counts["differences"]), 2)
+                if counts["differences"]
+                else None
+            ),
+        )
+        for category, counts in sorted(
+            summary.items(), key=lambda item: (item[0] is None, item[0] or 0)
+        )
+    ]
+    return CompareResponse(
+        store=store, matched_store=matched_store, pairs=pairs, categories=categories
+    )
+
+
+# Журнал изменений
+
+
+def check_change_log_gap(db: Session, since: int):
+    # Записи после since уже удалены — клиенту нужна полная синхронизация
+    first_seq = get_first_seq(db)
+    if since > 0 and first_seq > since + 1:
+        raise HTTPException(
+            status_code=410,
+            detail="Журнал изменений очищен, требуется полная синхронизация",
+        )
+
+
+@app.get("/changes", response_model=ChangeFeedResponse)
+def get_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=10000),
+    db: Session = Depends(get_db),
+):
+    check_change_log_gap(db, since)
+    changes = get_changes_since(db, since, limit)
+    return ChangeFeedResponse(
+        changes=changes, last_seq=changes[-1].Seq if changes else since
+    )
+
+
+def fetch_changes(since: int, limit: int = 1000):
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = SessionLocal()
+    try:
+        check_change_log_gap(db, since)
+        return [
+            ChangeResponse.model_validate(c)
+            for c in get_changes_since(db, since, limit)
+        ]
+    finally:
+        db.close()
+
+
+@app.get("/changes/stream")
+async def stream_changes(request: Request, since: int = Query(0, ge=0)):
+    # При переподключении EventSource сам передаёт номер последнего события
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+    await run_in_threadpool(fetch_changes, since, 1)  # 410 до начала потока
+
+    async def event_stream():
+        nonlocal since
+        idle = 0
+        while not await request.is_disconnected():
+            try:
+                changes = await run_in_threadpool(fetch_changes, since)
+            except HTTPException as e:
+                yield f"event: reset\ndata: {e.detail}\n\n"
+                return
+            for change in changes:
+                since = change.Seq
+                yield f"id: {change.Seq}\nevent: change\ndata: {change.model_dump_json()}\n\n"
+            if changes:
+                idle = 0
+                continue
+            idle += 1
+            if idle % 15 == 0:
+                yield ": keepalive\n\n"
+            await asyncio.sleep(1)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
 # Эндпоинты для расчета инфляции
 
 
 @app.get("/inflation/category/{category_id}", response_model=InflationCategoryResponse)
 def get_inflation_by_category(
-    category_id: int, start_date: date, end_date: date, db: Session = Depends(get_db)
+    category_id: int,
+    start_date: date,
+    end_date: date,
+    agg: InflationAgg = "mean",
+    db: Session = Depends(get_db),
 ):
     # Проверка существования категории
     db_category = db.query(Category).filter(Category.CategoryID == category_id).first()
@@ -671,52 +2247,55 @@ def get_inflation_by_category(
         raise HTTPException(status_code=404, detail="Category not found")
 
     # Получение всех продуктов в категории
-    products = db.query(Product).filter(Product.CategoryID == category_id).all()
-    if not products:
+    product_ids = [
+        product_id
+        for (product_id,) in db.query(Product.ProductID).filter(
+            Product.CategoryID == category_id
+        )
+    ]
+    if not product_ids:
         raise HTTPException(
             status_code=404, detail="No products found in this category"
         )
 
-    inflations = []
-
-    for product in products:
-        start_price_record = get_price_on_or_before(db, product.ProductID, start_date)
-        end_price_record = get_price_on_or_before(db, product.ProductID, end_date)
-
-        if not start_price_record or not end_price_record:
-            continue  # Пропустить, если недостаточно данных
-
-        # Извлечение валидных цен
-        start_price = get_valid_price(start_price_record)
-        end_price = get_valid_price(end_price_record)
-
-        if start_price is None or end_price is None:
-            continue  # Пропустить, если цена отсутствует
-
-        inflation = calculate_inflation(start_price, end_price)
-        if inflation is not None:
-            inflations.append(inflation)
-
-    if not inflations:
+    # Цены всех продуктов категории на обе даты одним запросом
+    snapshot = get_prices_as_of(db, [start_date, end_date], product_ids)
+    inflation, coverage = aggregate_inflation(
+        snapshot[start_date], snapshot[end_date], product_ids, agg
+    )
+    if inflation is None:
         raise HTTPException(
             status_code=404, detail="Insufficient price data to calculate inflation"
         )
 
-    # Средняя инфляция по категории
-    average_inflation = sum(inflations) / len(inflations)
-
     return InflationCategoryResponse(
-        inflation_percentage=round(average_inflation, 2),
+        inflation_percentage=inflation,
         start_date=start_date,
         end_date=end_date,
+        agg=agg,
+        coverage=coverage,
         category_id=db_category.CategoryID,
         category_name=db_category.CategoryName,
     )
 
 
+@app.post("/inflation/batch", response_model=InflationBatchResponse)
+def get_inflation_batch(request: InflationBatchRequest, db: Session = Depends(get_db)):
+    # Один снимок цен на все даты из всех запросов
+    dates = [d for spec in request.specs for d in (spec.start_date, spec.end_date)]
+    snapshot = get_prices_as_of(db, dates)
+    products = db.query(Product.ProductID, Product.ProductName, Product.CategoryID).all()
+    category_names = dict(db.query(Category.CategoryID, Category.CategoryName).all())
+    return build_inflation_batch(request.specs, snapshot, products, category_names)
+
+
 @app.get("/inflation/product/{product_id}", response_model=InflationProductResponse)
 def get_inflation_by_product(
-    product_id: int, start_date: date, end_date: date, db: Session = Depends(get_db)
+    product_id: int,
+    start_date: date,
+    end_date: date,
+    agg: InflationAgg = "mean",
+    db: Session = Depends(get_db),
 ):
     # Проверка существования продукта
     db_product = db.query(Product).filter(Product.ProductID == product_id).first()
@@ -746,10 +2325,13 @@ def get_inflation_by_product(
             status_code=400, detail="Cannot calculate inflation due to zero start price"
         )
 
+    # Для одного продукта все способы усреднения дают одно и то же
     return InflationProductResponse(
         inflation_percentage=round(inflation, 2),
         start_date=start_date,
         end_date=end_date,
+        agg=agg,
+        coverage=InflationCoverage(products_total=1, products_used=1, products_skipped=0),
         product_id=db_product.ProductID,
         product_name=db_product.ProductName,
     )
@@ -757,99 +2339,791 @@ def get_inflation_by_product(
 
 @app.get("/inflation/overall", response_model=InflationOverallResponse)
 def get_overall_inflation(
-    start_date: date, end_date: date, db: Session = Depends(get_db)
+    start_date: date,
+    end_date: date,
+    agg: InflationAgg = "mean",
+    db: Session = Depends(get_db),
+):
+    product_ids = [product_id for (product_id,) in db.query(Product.ProductID)]
+    if not product_ids:
+        raise HTTPException(status_code=404, detail="No products found")
+
+    snapshot = get_prices_as_of(db, [start_date, end_date])
+    inflation, coverage = aggregate_inflation(
+        snapshot[start_date], snapshot[end_date], product_ids, agg
+    )
+    if inflation is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Insufficient price data to calculate overall inflation",
+        )
+
+    return InflationOverallResponse(
+        inflation_percentage=inflation,
+        start_date=start_date,
+        end_date=end_date,
+        agg=agg,
+        coverage=coverage,
+    )
+
+
+@app.get("/inflation/overall/all_time", response_model=InflationOverallAllTimeResponse)
+def get_overall_inflation_all_time(
+    agg: InflationAgg = "mean", db: Session = Depends(get_db)
 ):
-    products = db.query(Product).all()
-    if not products:
+    version = get_cache_version(db, "prices")
+    cached = prices_cache.get(version, f"all_time:{agg}")
+    if cached is not None:
+        return cached
+
+    product_ids = [product_id for (product_id,) in db.query(Product.ProductID)]
+    if not product_ids:
         raise HTTPException(status_code=404, detail="No products found")
 
-    inflations = []
+    # Первая и последняя цена каждого продукта из предрасчитанной статистики
+    stats = db.query(
+        ProductPriceStats.ProductID, ProductPriceStats.FirstPrice, ProductPriceStats.LastPrice
+    ).all()
+    response = make_all_time_response(stats, product_ids, agg)
+    prices_cache.set(version, f"all_time:{agg}", response)
+    return response
 
-    for product in products:
-        start_price_record = get_price_on_or_before(db, product.ProductID, start_date)
-        end_price_record = get_price_on_or_before(db, product.ProductID, end_date)
 
-        if not start_price_record or not end_price_record:
-            continue  # Пропустить, если недостаточно данных
+# Асинхронные версии эндпоинтов чтения (включаются через ASYNC_DB=1)
+async_router = APIRouter()
 
-        # Извлечение валидных цен
-        start_price = get_valid_price(start_price_record)
-        end_price = get_valid_price(end_price_record)
 
-        if start_price is None or end_price is None:
-            continue  # Пропустить, если цена отсутствует
+def make_product_response(product, price_with_discount, price_without_discount, price_date):
+    return ProductResponse(
+        ProductID=product.ProductID,
+        ProductName=product.ProductName,
+        CategoryID=product.CategoryID,
+        ProductLink=product.ProductLink,
+        LatestPriceWithDiscount=(
+            float(price_with_discount) if price_with_discount else None
+        ),
+        LatestPriceWithoutDiscount=(
+            float(price_without_discount) if price_without_discount else None
+        ),
+        LatestPriceDate=price_date,
+    )
 
-        inflation = calculate_inflation(start_price, end_price)
-        if inflation is not None:
-            inflations.append(inflation)
 
-    if not inflations:
+def latest_prices_subquery():
+    """
+    Последняя запись цены каждого продукта (оконная функция вместо загрузки
+    всей истории через joinedload).
+    """
+    ranked = select(
+        Price.ProductID,
+        Price.PriceWithDiscount,
+        Price.PriceWithoutDiscount,
+        Price.PriceDate,
+        func.row_number()
+        .over(partition_by=Price.ProductID, order_by=Price.PriceDate.desc())
+        .label("rn"),
+    ).subquery()
+    return select(ranked).filter(ranked.c.rn == 1).subquery()
+
+
+async def async_get_price_on_or_before(
+    db: AsyncSession, product_id: int, target_date: date
+):
+    result = await db.execute(
+        select(Price)
+        .filter(Price.ProductID == product_id, Price.PriceDate <= target_date)
+        .order_by(Price.PriceDate.desc())
+        .limit(1)
+    )
+    return result.scalars().first()
+
+
+async def async_get_prices_as_of(db: AsyncSession, dates, product_ids=None):
+    if not dates:
+        return {}
+    rows = []
+    for query in prices_as_of_queries(max(dates), product_ids):
+        rows.extend((await db.execute(query)).all())
+    return collect_prices_as_of(rows, dates)
+
+
+@async_router.get("/categories/", response_model=List[CategoryResponse])
+async def async_get_categories(db: AsyncSession = Depends(get_async_db)):
+    version = (await db.execute(cache_version_query("categories"))).scalar() or 0
+    categories = categories_cache.get(version, "all")
+    if categories is None:
+        result = await db.execute(select(Category))
+        categories = [CategoryResponse.model_validate(c) for c in result.scalars()]
+        categories_cache.set(version, "all", categories)
+    return categories
+
+
+@async_router.get("/categories/{category_id}", response_model=CategoryResponse)
+async def async_get_category(category_id: int, db: AsyncSession = Depends(get_async_db)):
+    db_category = await db.get(Category, category_id)
+    if db_category is None:
+        raise HTTPException(status_code=404, detail="Category not found")
+    return db_category
+
+
+@async_router.get("/products/", response_model=List[ProductResponse])
+async def async_get_products(db: AsyncSession = Depends(get_async_db)):
+    latest = latest_prices_subquery()
+    result = await db.execute(
+        select(
+            Product,
+            latest.c.PriceWithDiscount,
+            latest.c.PriceWithoutDiscount,
+            latest.c.PriceDate,
+        ).outerjoin(latest, latest.c.ProductID == Product.ProductID)
+    )
+    return [make_product_response(*row) for row in result.all()]
+
+
+@async_router.get("/products/{product_id}", response_model=ProductResponse)
+async def async_get_product(product_id: int, db: AsyncSession = Depends(get_async_db)):
+    latest = latest_prices_subquery()
+    result = await db.execute(
+        select(
+            Product,
+            latest.c.PriceWithDiscount,
+            latest.c.PriceWithoutDiscount,
+            latest.c.PriceDate,
+        )
+        .outerjoin(latest, latest.c.ProductID == Product.ProductID)
+        .filter(Product.ProductID == product_id)
+    )
+    row = result.first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return make_product_response(*row)
+
+
+@async_router.get(
+    "/products/{product_id}/stats", response_model=ProductPriceStatsResponse
+)
+async def async_get_product_price_stats(
+    product_id: int, db: AsyncSession = Depends(get_async_db)
+):
+    stats = await db.get(ProductPriceStats, product_id)
+    if stats is None:
+        if await db.get(Product, product_id) is None:
+            raise HTTPException(status_code=404, detail="Product not found")
         raise HTTPException(
-            status_code=404,
-            detail="Insufficient price data to calculate overall inflation",
+            status_code=404, detail="Insufficient price data for inflation calculation"
         )
+    return make_price_stats_response(stats)
 
-    # Средняя инфляция по всем продуктам
-    average_inflation = sum(inflations) / len(inflations)
 
-    return InflationOverallResponse(
-        inflation_percentage=round(average_inflation, 2),
+@async_router.get("/prices/", response_model=List[PriceResponse])
+async def async_get_prices(db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(select(Price))
+    return result.scalars().all()
+
+
+@async_router.get("/prices/{price_id}", response_model=PriceResponse)
+async def async_get_price(price_id: int, db: AsyncSession = Depends(get_async_db)):
+    db_price = await db.get(Price, price_id)
+    if db_price is None:
+        raise HTTPException(status_code=404, detail="Price not found")
+    return db_price
+
+
+@async_router.get(
+    "/inflation/category/{category_id}", response_model=InflationCategoryResponse
+)
+async def async_get_inflation_by_category(
+    category_id: int,
+    start_date: date,
+    end_date: date,
+    agg: InflationAgg = "mean",
+    db: AsyncSession = Depends(get_async_db),
+):
+    db_category = await db.get(Category, category_id)
+    if not db_category:
+        raise HTTPException(status_code=404, detail="Category not found")
+
+    result = await db.execute(
+        select(Product.ProductID).filter(Product.CategoryID == category_id)
+    )
+    product_ids = result.scalars().all()
+    if not product_ids:
+        raise HTTPException(
+            status_code=404, detail="No products found in this category"
+        )
+
+    snapshot = await async_get_prices_as_of(db, [start_date, end_date], product_ids)
+    inflation, coverage = aggregate_inflation(
+        snapshot[start_date], snapshot[end_date], product_ids, agg
+    )
+    if inflation is None:
+        raise HTTPException(
+            status_code=404, detail="Insufficient price data to calculate inflation"
+        )
+
+    return InflationCategoryResponse(
+        inflation_percentage=inflation,
         start_date=start_date,
         end_date=end_date,
+        agg=agg,
+        coverage=coverage,
+        category_id=db_category.CategoryID,
+        category_name=db_category.CategoryName,
     )
 
 
-@app.get("/inflation/overall/all_time", response_model=InflationOverallAllTimeResponse)
-def get_overall_inflation_all_time(db: Session = Depends(get_db)):
-    products = db.query(Product).all()
-    if not products:
-        raise HTTPException(status_code=404, detail="No products found")
+@async_router.post("/inflation/batch", response_model=InflationBatchResponse)
+async def async_get_inflation_batch(
+    request: InflationBatchRequest, db: AsyncSession = Depends(get_async_db)
+):
+    dates = [d for spec in request.specs for d in (spec.start_date, spec.end_date)]
+    snapshot = await async_get_prices_as_of(db, dates)
+    products = (
+        await db.execute(
+            select(Product.ProductID, Product.ProductName, Product.CategoryID)
+        )
+    ).all()
+    category_names = dict(
+        (await db.execute(select(Category.CategoryID, Category.CategoryName))).all()
+    )
+    return build_inflation_batch(request.specs, snapshot, products, category_names)
 
-    inflations = []
 
-    for product in products:
-        # Получение самой ранней и самой поздней цены
-        earliest_price_record = (
-            db.query(Price)
-            .filter(Price.ProductID == product.ProductID)
-            .order_by(Price.PriceDate.asc())
-            .first()
+@async_router.get(
+    "/inflation/product/{product_id}", response_model=InflationProductResponse
+)
+async def async_get_inflation_by_product(
+    product_id: int,
+    start_date: date,
+    end_date: date,
+    agg: InflationAgg = "mean",
+    db: AsyncSession = Depends(get_async_db),
+):
+    db_product = await db.get(Product, product_id)
+    if not db_product:
+        raise HTTPException(status_code=404, detail="Product not found")
+
+    start_price_record = await async_get_price_on_or_before(db, product_id, start_date)
+    end_price_record = await async_get_price_on_or_before(db, product_id, end_date)
+
+    if not start_price_record or not end_price_record:
+        raise HTTPException(
+            status_code=404, detail="Insufficient price data to calculate inflation"
         )
-        latest_price_record = (
-            db.query(Price)
-            .filter(Price.ProductID == product.ProductID)
-            .order_by(Price.PriceDate.desc())
-            .first()
+
+    start_price = get_valid_price(start_price_record)
+    end_price = get_valid_price(end_price_record)
+
+    if start_price is None or end_price is None:
+        raise HTTPException(
+            status_code=400, detail="Insufficient price data for inflation calculation"
         )
 
-        if not earliest_price_record or not latest_price_record:
-            continue 
+    inflation = calculate_inflation(start_price, end_price)
+    if inflation is None:
+        raise HTTPException(
+            status_code=400, detail="Cannot calculate inflation due to zero start price"
+        )
 
-        # Извлечение валидных цен
-        start_price = get_valid_price(earliest_price_record)
-        end_price = get_valid_price(latest_price_record)
+    # Для одного продукта все способы усреднения дают одно и то же
+    return InflationProductResponse(
+        inflation_percentage=round(inflation, 2),
+        start_date=start_date,
+        end_date=end_date,
+        agg=agg,
+        coverage=InflationCoverage(products_total=1, products_used=1, products_skipped=0),
+        product_id=db_product.ProductID,
+        product_name=db_product.ProductName,
+    )
 
-        if start_price is None or end_price is None:
-            continue  # Пропустить, если цена отсутствует
 
-        inflation = calculate_inflation(start_price, end_price)
-        if inflation is not None:
-            inflations.append(inflation)
+@async_router.get("/inflation/overall", response_model=InflationOverallResponse)
+async def async_get_overall_inflation(
+    start_date: date,
+    end_date: date,
+    agg: InflationAgg = "mean",
+    db: AsyncSession = Depends(get_async_db),
+):
+    product_ids = (await db.execute(select(Product.ProductID))).scalars().all()
+    if not product_ids:
+        raise HTTPException(status_code=404, detail="No products found")
 
-    if not inflations:
+    snapshot = await async_get_prices_as_of(db, [start_date, end_date])
+    inflation, coverage = aggregate_inflation(
+        snapshot[start_date], snapshot[end_date], product_ids, agg
+    )
+    if inflation is None:
         raise HTTPException(
             status_code=404,
             detail="Insufficient price data to calculate overall inflation",
         )
 
-    # Средняя инфляция по всем продуктам
-    average_inflation = sum(inflations) / len(inflations)
+    return InflationOverallResponse(
+        inflation_percentage=inflation,
+        start_date=start_date,
+        end_date=end_date,
+        agg=agg,
+        coverage=coverage,
+    )
 
-    return InflationOverallAllTimeResponse(
-        inflation_percentage=round(average_inflation, 2), observation_period="All Time"
+
+@async_router.get(
+    "/inflation/overall/all_time", response_model=InflationOverallAllTimeResponse
+)
+async def async_get_overall_inflation_all_time(
+    agg: InflationAgg = "mean", db: AsyncSession = Depends(get_async_db)
+):
+    version = (await db.execute(cache_version_query("prices"))).scalar() or 0
+    cached = prices_cache.get(version, f"all_time:{agg}")
+    if cached is not None:
+        return cached
+
+    product_ids = (await db.execute(select(Product.ProductID))).scalars().all()
+    if not product_ids:
+        raise HTTPException(status_code=404, detail="No products found")
+
+    result = await db.execute(
+        select(
+            ProductPriceStats.ProductID,
+            ProductPriceStats.FirstPrice,
+            ProductPriceStats.LastPrice,
+        )
+    )
+    response = make_all_time_response(result.all(), product_ids, agg)
+    prices_cache.set(version, f"all_time:{agg}", response)
+    return response
+
+
+if ASYNC_DB:
+    # Асинхронные эндпоинты заменяют синхронные с тем же путём и методом
+    replaced = {
+        (route.path, method)
+        for route in async_router.routes
+        for method in route.methods
+    }
+    app.router.routes = [
+        route
+        for route in app.router.routes
+        if not (
+            isinstance(route, APIRoute)
+            and any((route.path, method) in replaced for method in route.methods)
+        )
+    ]
+    app.include_router(async_router)
+
+
+# Профили запросов
+@app.get("/admin/profiles", dependencies=[Depends(require_admin)])
+def get_profiles():
+    """
+    Сохранённые профили запросов, новые первыми.
+    """
+    return list_profiles(PROFILE_POLICY.directory)
+
+
+@app.get("/admin/profiles/{name}", dependencies=[Depends(require_admin)])
+def get_profile(name: str, format: Literal["pstats", "text"] = "pstats"):
+    """
+    Профиль в формате pstats (python -m pstats, snakeviz) или текстовый
+    отчёт по самым дорогим функциям.
+    """
+    path = profile_path(PROFILE_POLICY.directory, name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "text":
+        return PlainTextResponse(format_profile_file(path, PROFILE_POLICY.top))
+    return FileResponse(path, media_type="application/octet-stream", filename=name)
+
+
+# Прогрев при старте и готовность к приёму трафика
+warmup_state = {"ready": False, "error": None, "steps": {}, "skipped": {}, "ready_at": None}
+
+
+def run_warmup_step(name: str, step):
+    started = time.perf_counter()
+    try:
+        step()
+    except HTTPException as e:
+        # Эндпоинт ответил 404 на пустой базе: прогревать нечего, это не ошибка
+        warmup_state["skipped"][name] = e.detail
+    warmup_state["steps"][name] = round(time.perf_counter() - started, 3)
+
+
+async def run_warmup_step_async(name: str, step):
+    started = time.perf_counter()
+    try:
+        await step()
+    except HTTPException as e:
+        warmup_state["skipped"][name] = e.detail
+    warmup_state["steps"][name] = round(time.perf_counter() - started, 3)
+
+
+def warm_up_sync():
+    """
+    Первые запросы не должны платить за настройку мапперов, компиляцию
+    запросов и холодные кэши: выполняем самые частые чтения заранее.
+    Скомпилированные запросы остаются в кэше SQLAlchemy, категории и
+    инфляция за всё время — в categories_cache и prices_cache.
+    """
+    run_warmup_step("mappers", configure_mappers)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = SessionLocal()
+    try:
+        run_warmup_step("changes", lambda: get_changes_since(db, 0, 1))
+        if ASYNC_DB:
+            return
+        run_warmup_step("categories", lambda: get_categories(db=db))
+        run_warmup_step("products", lambda: get_products(db=db))
+        if PRICE_STORE:
+            run_warmup_step("price_store", lambda: save_price_store(db))
+        run_warmup_step("latest_prices", lambda: get_prices_as_of(db, [date.today()]))
+        run_warmup_step("inflation_all_time", lambda: get_overall_inflation_all_time(db=db))
+    finally:
+        db.close()
+
+
+async def warm_up_async():
+    AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+    async with AsyncSessionLocal() as db:
+        for name, endpoint in (
+            ("categories", async_get_categories),
+            ("products", async_get_products),
+            ("inflation_all_time", async_get_overall_inflation_all_time),
+        ):
+            await run_warmup_step_async(name, lambda: endpoint(db=db))
+        await run_warmup_step_async(
+            "latest_prices", lambda: async_get_prices_as_of(db, [date.today()])
+        )
+
+
+def warm_up_driver():
+    # Первый запуск Chrome заметно дольше следующих (распаковка профиля, шрифты)
+    with get_driver() as driver:
+        driver.get("about:blank")
+
+
+async def warm_up():
+    try:
+        if WARMUP:
+            await run_in_threadpool(warm_up_sync)
+            if ASYNC_DB:
+                await warm_up_async()
+        if WARMUP_DRIVER:
+            try:
+                await run_in_threadpool(run_warmup_step, "driver", warm_up_driver)
+            except Exception as e:
+                # Без браузера API работает, страдает только парсинг
+                print(f"Ошибка прогрева браузера: {e}")
+                warmup_state["steps"]["driver"] = None
+        warmup_state["ready_at"] = round(time.perf_counter() - IMPORT_STARTED, 3)
+        warmup_state["ready"] = True
+    except Exception as e:
+        warmup_state["error"] = str(e)
+        print(f"Ошибка прогрева: {e}")
+
+
+@app.get("/health/ready")
+def get_readiness():
+    """
+    Готовность к трафику: 503, пока не закончен прогрев (или если он
+    завершился ошибкой), затем 200 со временем от импорта до готовности.
+    """
+    if warmup_state["error"] is not None:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "failed", "error": warmup_state["error"]},
+        )
+    if not warmup_state["ready"]:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "warming_up", "steps": warmup_state["steps"]},
+        )
+    return {
+        "status": "ready",
+        "startup_seconds": warmup_state["ready_at"],
+        "steps": warmup_state["steps"],
+        "skipped": warmup_state["skipped"],
+    }
+
+
+# Фоновое обновление цен
+
+
+def validate_parsed_prices(db: Session, parsed: dict) -> dict:
+    """
+    Проверить результаты парсинга {product_id: parsed_prices} на выбросы.
+    Возвращает {product_id: (цена со скидкой, цена без скидки)} для прошедших
+    проверку; подозрительные добавляются в карантин. Не коммитит.
+    """
+    items = {}
+    for product_id, parsed_prices in parsed.items():
+        if not parsed_prices:
+            continue
+        price_with_discount = parsed_prices.get("price_with_discount")
+        price_without_discount = parsed_prices.get("price_without_discount")
+        if price_with_discount is None and price_without_discount is None:
+            continue
+        items[product_id] = (price_with_discount, price_without_discount)
+    return validate_scraped_prices(
+        db, Price, items, datetime.utcnow().date(), ANOMALY_POLICY
+    )
+
+
+def upsert_daily_prices(db: Session, prices: dict, price_date: date) -> dict:
+    """
+    Записать цены {product_id: (со скидкой, без скидки)} за price_date,
+    перезаписывая существующие записи за эту дату. Не коммитит.
+    """
+    if not prices:
+        return {}
+    existing = {
+        db_price.ProductID: db_price
+        for db_price in db.query(Price).filter(
+            Price.ProductID.in_(list(prices)), Price.PriceDate == price_date
+        )
+    }
+    stored = {}
+    for product_id, (price_with_discount, price_without_discount) in prices.items():
+        db_price = existing.get(product_id)
+        if db_price is None:
+            db_price = Price(ProductID=product_id, PriceDate=price_date)
+            db.add(db_price)
+        db_price.PriceWithDiscount = price_with_discount
+        db_price.PriceWithoutDiscount = price_without_discount
+        stored[product_id] = db_price
+    bump_cache_version(db, "prices")
+    return stored
+
+
+def store_scraped_prices(db: Session, parsed: dict) -> dict:
+    """
+    Проверить и сохранить пачку спарсенных цен {product_id: parsed_prices}
+    за сегодня за один проход: история всех продуктов читается одним
+    запросом, выбросы уходят в карантин. Не коммитит.
+    """
+    accepted = validate_parsed_prices(db, parsed)
+    return upsert_daily_prices(db, accepted, datetime.utcnow().date())
+
+
+def store_scraped_price(db: Session, product_id: int, parsed_prices) -> Optional[Price]:
+    """
+    Сохранить спарсенную цену за сегодня (перезаписывает сегодняшнюю запись).
+    Не коммитит.
+    """
+    return store_scraped_prices(db, {product_id: parsed_prices}).get(product_id)
+
+
+def scrape_now_or_enqueue(db: Session, product_id: int, url: str, store: str):
+    """
+    Спарсить цену сразу. Если предохранитель магазина открыт или парсинг
+    не удался, продукт ставится в очередь повторов и возвращается None.
+    """
+    if is_circuit_open(db, store):
+        enqueue_scrape(db, product_id, url, store, SCRAPE_POLICY)
+        return None
+    try:
+        parsed_prices = parse_url(get_driver, url, store)
+    except Exception as e:
+        print(f"Ошибка при парсинге цены продукта {product_id}: {e}")
+        record_store_failure(db, store, SCRAPE_POLICY)
+        enqueue_scrape(
+            db, product_id, url, store, SCRAPE_POLICY, error=f"{type(e).__name__}: {e}"
+        )
+        return None
+    record_store_success(db, store, SCRAPE_POLICY)
+    return parsed_prices
+
+
+def run_scrape_job(job: ScrapeJob):
+    """
+    Обработчик задания из очереди: исключение означает неудачную попытку.
+    Удачный повтор считается парсингом по расписанию, иначе продукт
+    остаётся просроченным и парсится ещё раз в ближайшем цикле.
+    """
+    parsed_prices = parse_url(get_driver, job.Url, job.Store)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = SessionLocal()
+    try:
+        if db.get(Product, job.ProductID) is None:
+            return  # Продукт удалён, пока задание ждало в очереди
+        store_scraped_price(db, job.ProductID, parsed_prices)
+        db.commit()
+        if SCRAPE_BUDGET_PER_HOUR > 0:
+            mark_scraped(db, job.ProductID, SCHEDULE_POLICY)
+    finally:
+        db.close()
+
+
+def scrape_queue_loop():
+    while True:
+        SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        db = SessionLocal()
+        try:
+            processed = process_jobs(db, run_scrape_job, SCRAPE_POLICY)
+        except Exception as e:
+            print(f"Ошибка обработки очереди парсинга: {e}")
+            processed = 0
+        finally:
+            db.close()
+        if not processed:
+            time.sleep(SCRAPE_QUEUE_POLL_SECONDS)
+
+
+def get_due_products(db: Session):
+    """
+    Продукты, которым по расписанию пора обновиться, в пределах доли бюджета
+    на один цикл. Продукты без расписания (новые) идут первыми.
+    """
+    limit = max(1, round(SCRAPE_BUDGET_PER_HOUR * SCRAPE_INTERVAL_SECONDS / 3600))
+    return (
+        db.query(Product.ProductID, Product.ProductLink)
+        .outerjoin(ScrapeSchedule, ScrapeSchedule.ProductID == Product.ProductID)
+        .filter(
+            (ScrapeSchedule.NextScrapeAt.is_(None))
+            | (ScrapeSchedule.NextScrapeAt <= datetime.utcnow())
+        )
+        .order_by(ScrapeSchedule.NextScrapeAt.is_not(None), ScrapeSchedule.NextScrapeAt)
+        .limit(limit)
+        .all()
     )
 
 
+def update_scrape_schedule(db: Session):
+    """
+    Пересчитать расписание парсинга по всей истории цен одним запросом.
+    """
+    rows = db.execute(
+        select(
+            Product.ProductID,
+            Price.PriceDate,
+            Price.PriceWithDiscount,
+            Price.PriceWithoutDiscount,
+        )
+        .outerjoin(Price, Price.ProductID == Product.ProductID)
+        .order_by(Product.ProductID, Price.PriceDate)
+    ).all()
+    histories = {
+        product_id: [row[1:] for row in group if row.PriceDate is not None]
+        for product_id, group in groupby(rows, key=lambda row: row.ProductID)
+    }
+    rebuild_schedule(db, histories, SCHEDULE_POLICY)
+
+
+def run_scrape_cycle():
+    """
+    Один цикл обновления цен всех продуктов. Продукт парсится, только если
+    этот воркер взял его в аренду на период цикла; неудачные попытки
+    уходят в очередь повторов. Продукты магазина с открытым предохранителем
+    тоже уходят в очередь, а парсинг по расписанию откладывается до закрытия
+    предохранителя, чтобы они не занимали бюджет следующих циклов.
+    """
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = SessionLocal()
+    try:
+        leased = []
+        if SCRAPE_BUDGET_PER_HOUR > 0:
+            products = get_due_products(db)
+        else:
+            products = db.query(Product.ProductID, Product.ProductLink).all()
+        for product_id, link in products:
+            store = get_store_for_url(link)
+            if store is None:
+                continue
+            if not acquire_scrape_lease(db, product_id, SCRAPE_INTERVAL_SECONDS):
+                continue  # Продукт уже обновляет другой воркер
+            open_until = circuit_open_until(db, store)
+            if open_until is not None:
+                enqueue_scrape(db, product_id, link, store, SCRAPE_POLICY)
+                if SCRAPE_BUDGET_PER_HOUR > 0:
+                    postpone_scrape(db, product_id, open_until, SCHEDULE_POLICY)
+                continue
+            leased.append((product_id, link, store))
+
+        # Пачками по одному браузеру с несколькими вкладками
+        for start in range(0, len(leased), SCRAPE_BATCH_SIZE):
+            batch = leased[start : start + SCRAPE_BATCH_SIZE]
+            links = [link for _, link, _ in batch]
+            with get_batch_driver() as driver:
+                results = parse_many(driver, links, tabs=SCRAPE_TABS)
+            parsed = {}
+            for product_id, link, store in batch:
+                result = results[link]
+                if SCRAPE_BUDGET_PER_HOUR > 0:
+                    mark_scraped(db, product_id, SCHEDULE_POLICY)
+                if isinstance(result, Exception):
+                    print(f"Ошибка при парсинге цены продукта {product_id}: {result}")
+                    record_store_failure(db, store, SCRAPE_POLICY)
+                    enqueue_scrape(
+                        db,
+                        product_id,
+                        link,
+                        store,
+                        SCRAPE_POLICY,
+                        error=f"{type(result).__name__}: {result}",
+                    )
+                    continue
+                record_store_success(db, store, SCRAPE_POLICY)
+                parsed[product_id] = result
+            # Вся пачка проверяется на выбросы и сохраняется одной транзакцией
+            store_scraped_prices(db, parsed)
+            db.commit()
+    finally:
+        db.close()
+
+
+def scrape_loop():
+    while True:
+        try:
+            run_scrape_cycle()
+        except Exception as e:
+            print(f"Ошибка цикла обновления цен: {e}")
+        time.sleep(SCRAPE_INTERVAL_SECONDS)
+
+
+def save_price_store(db: Session):
+    # Догнать журнал до его очистки, иначе при следующем обновлении — полная загрузка
+    price_store.refresh(db, Price)
+    if PRICE_STORE_PATH:
+        price_store.save(PRICE_STORE_PATH)
+
+
+def maintenance_loop():
+    while True:
+        SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        db = SessionLocal()
+        try:
+            if PRICE_STORE:
+                save_price_store(db)
+        except Exception as e:
+            db.rollback()
+            print(f"Ошибка сохранения хранилища цен: {e}")
+        try:
+            trim_change_log(db, CHANGE_LOG_RETENTION_DAYS)
+        except Exception as e:
+            print(f"Ошибка очистки журнала изменений: {e}")
+        try:
+            if SCRAPE_BUDGET_PER_HOUR > 0:
+                update_scrape_schedule(db)
+        except Exception as e:
+            db.rollback()
+            print(f"Ошибка пересчёта расписания парсинга: {e}")
+        finally:
+            db.close()
+        time.sleep(3600)
+
+
+def start_background_tasks():
+    threading.Thread(target=maintenance_loop, daemon=True).start()
+    for _ in range(SCRAPE_QUEUE_THREADS):
+        threading.Thread(target=scrape_queue_loop, daemon=True).start()
+    if SCRAPE_INTERVAL_SECONDS > 0:
+        threading.Thread(target=scrape_loop, daemon=True).start()
+
+
 # Запуск FastAPI сервера, если запускается основной скрипт
 if __name__ == "__main__":
-    uvicorn.run(app, host="127.0.0.1", port=8000)
+    if WORKERS > 1:
+        # Несколько процессов: приложение передаётся строкой импорта
+        uvicorn.run("main:app", host=HOST, port=PORT, workers=WORKERS)
+    else:
+        uvicorn.run(app, host=HOST, port=PORT)
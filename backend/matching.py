@@ -0,0 +1,233 @@
+"""
+Сопоставление одинаковых товаров разных магазинов. Название приводится
+к словам и объёму («0,9л» и «900 мл» совпадают), слова режутся на
+символьные триграммы, а по триграммам строится MinHash-сигнатура.
+Кандидаты ищутся через LSH: сигнатура делится на полосы, и товары,
+совпавшие хотя бы в одной полосе, сравниваются по коэффициенту Жаккара
+с весами IDF (редкие триграммы бренда важнее частых вроде «мол»).
+Так не нужно сравнивать все пары товаров между собой.
+Найденные пары сохраняются как предложения и подтверждаются вручную.
+"""
+import math
+import re
+import zlib
+from collections import Counter, defaultdict
+from datetime import datetime
+from itertools import combinations, product
+
+from sqlalchemy import Column, Integer, String, Float, DateTime, UniqueConstraint
+from sqlalchemy.orm import declarative_base
+
+MatchBase = declarative_base()
+
+# Статусы пар
+PROPOSED = "proposed"
+CONFIRMED = "confirmed"
+REJECTED = "rejected"
+
+# Единицы объёма приводятся к граммам, миллилитрам и штукам
+UNITS = {
+    "г": ("г", 1),
+    "гр": ("г", 1),
+    "кг": ("г", 1000),
+    "мл": ("мл", 1),
+    "л": ("мл", 1000),
+    "шт": ("шт", 1),
+}
+QUANTITY_RE = re.compile(r"(\d+(?:[.,]\d+)?)\s*(кг|гр|г|мл|л|шт)(?![а-я])\.?")
+# Слова, которые встречаются в названиях почти всех товаров
+STOP_WORDS = {"бзмж", "в", "с", "со", "и", "из", "для", "на", "по", "без"}
+
+EMPTY_BIN = 1 << 32
+
+
+class ProductMatch(MatchBase):
+    __tablename__ = "product_matches"
+    # Пара хранится один раз: магазин ProductID идёт раньше по алфавиту
+    __table_args__ = (UniqueConstraint("ProductID", "MatchedProductID"),)
+
+    MatchID = Column(Integer, primary_key=True)
+    ProductID = Column(Integer, nullable=False, index=True)
+    Store = Column(String, nullable=False)
+    MatchedProductID = Column(Integer, nullable=False, index=True)
+    MatchedStore = Column(String, nullable=False)
+    Score = Column(Float, nullable=True)  # None для пар, добавленных вручную
+    Status = Column(String, nullable=False, default=PROPOSED, index=True)
+    CreatedAt = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class MatchPolicy:
+    """
+    Параметры поиска: num_hashes = bands * rows. Пара попадает в кандидаты
+    с вероятностью 1 - (1 - J^rows)^bands, где J — сходство по Жаккару;
+    при 16 полосах по 4 это ~64% для J = 0.5 и ~99% для J = 0.7.
+    Корзины больше max_bucket (общие слова вроде «молоко») пропускаются.
+    max_candidates — сколько пар предлагать для товара в каждом другом
+    магазине (лучшие по сходству).
+    """
+
+    def __init__(
+        self,
+        bands: int = 16,
+        rows: int = 4,
+        min_score: float = 0.6,
+        max_bucket: int = 100,
+        max_candidates: int = 1,
+    ):
+        self.bands = bands
+        self.rows = rows
+        self.min_score = min_score
+        self.max_bucket = max_bucket
+        self.max_candidates = max_candidates
+
+    @property
+    def num_hashes(self):
+        return self.bands * self.rows
+
+
+def parse_name(name: str):
+    """
+    Разобрать название на нормализованные слова и объём:
+    «Масло подсолнечное 0.9л» -> (["масло", "подсолнечное"], "900мл").
+    """
+    text = name.lower().replace("ё", "е")
+    quantity = None
+    match = QUANTITY_RE.search(text)
+    if match:
+        unit, factor = UNITS[match.group(2)]
+        amount = float(match.group(1).replace(",", ".")) * factor
+        quantity = f"{amount:g}{unit}"
+        text = text[: match.start()] + " " + text[match.end() :]
+    words = [
+        word
+        for word in re.findall(r"\w+", text)
+        if word not in STOP_WORDS and (len(word) > 1 or word.isdigit())
+    ]
+    return words, quantity
+
+
+def name_shingles(words) -> frozenset:
+    """
+    Символьные триграммы слов: окончания и опечатки меняют лишь
+    несколько триграмм, а порядок слов не важен.
+    """
+    shingles = set()
+    for word in words:
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            shingles.add(padded[i : i + 3])
+    return frozenset(shingles)
+
+
+def shingle_weights(shingle_sets) -> dict:
+    """
+    Вес IDF каждой триграммы: log(число товаров / число товаров с ней).
+    """
+    counts = Counter()
+    for shingles in shingle_sets:
+        counts.update(shingles)
+    total = len(shingle_sets)
+    return {shingle: math.log(total / count) + 1e-6 for shingle, count in counts.items()}
+
+
+def jaccard(left: frozenset, right: frozenset, weights: dict, left_total, right_total):
+    """
+    Взвешенный коэффициент Жаккара: сумма весов общих триграмм к сумме
+    весов всех триграмм пары. Суммы весов каждого товара считаются заранее.
+    """
+    common = sum(weights[shingle] for shingle in left & right)
+    return common / (left_total + right_total - common)
+
+
+def minhash(shingles, num_hashes: int) -> list:
+    """
+    MinHash с одной хеш-функцией: хеш триграммы выбирает корзину и
+    значение, в корзине остаётся минимум. Это в num_hashes раз быстрее
+    отдельной хеш-функции на каждую позицию сигнатуры. Пустые корзины
+    заполняются из следующей непустой со сдвигом (densification).
+    """
+    bins = [EMPTY_BIN] * num_hashes
+    for shingle in shingles:
+        h = zlib.crc32(shingle.encode())
+        index, value = h % num_hashes, h // num_hashes
+        if value < bins[index]:
+            bins[index] = value
+    if EMPTY_BIN in bins:
+        filled = list(bins)
+        for i in range(num_hashes):
+            if bins[i] != EMPTY_BIN:
+                continue
+            for step in range(1, num_hashes):
+                value = bins[(i + step) % num_hashes]
+                if value != EMPTY_BIN:
+                    filled[i] = value + step * EMPTY_BIN
+                    break
+        bins = filled
+    return bins
+
+
+def propose_matches(products, policy: MatchPolicy, exclude=frozenset()) -> list:
+    """
+    Найти вероятные пары одинаковых товаров разных магазинов.
+    products — [(ProductID, название, магазин), ...], exclude — уже
+    известные пары (ProductID, MatchedProductID). Возвращает
+    [(ProductID, MatchedProductID, сходство), ...] по убыванию сходства,
+    не больше max_candidates пар на товар и магазин.
+    """
+    items = {}
+    buckets = defaultdict(list)
+    for product_id, name, store in products:
+        if store is None:
+            continue
+        words, quantity = parse_name(name)
+        shingles = name_shingles(words)
+        if not shingles:
+            continue
+        items[product_id] = (store, quantity, shingles)
+        signature = minhash(shingles, policy.num_hashes)
+        for band in range(policy.bands):
+            key = (band, *signature[band * policy.rows : (band + 1) * policy.rows])
+            buckets[key].append(product_id)
+
+    candidates = set()
+    for members in buckets.values():
+        if len(members) < 2 or len(members) > policy.max_bucket:
+            continue
+        # Пары только между разными магазинами; слева магазин раньше по алфавиту
+        by_store = defaultdict(list)
+        for product_id in members:
+            by_store[items[product_id][0]].append(product_id)
+        if len(by_store) < 2:
+            continue
+        for left_store, right_store in combinations(sorted(by_store), 2):
+            candidates.update(product(by_store[left_store], by_store[right_store]))
+
+    weights = shingle_weights([shingles for _, _, shingles in items.values()])
+    totals = {
+        product_id: sum(weights[shingle] for shingle in shingles)
+        for product_id, (_, _, shingles) in items.items()
+    }
+    scored = []
+    for left, right in candidates - set(exclude):
+        _, left_quantity, left_shingles = items[left]
+        _, right_quantity, right_shingles = items[right]
+        if left_quantity and right_quantity and left_quantity != right_quantity:
+            continue  # Разная фасовка — разные товары
+        score = jaccard(
+            left_shingles, right_shingles, weights, totals[left], totals[right]
+        )
+        if score >= policy.min_score:
+            scored.append((left, right, score))
+    scored.sort(key=lambda pair: -pair[2])
+
+    taken = defaultdict(int)
+    result = []
+    for left, right, score in scored:
+        left_key = (left, items[right][0])
+        right_key = (right, items[left][0])
+        if taken[left_key] >= policy.max_candidates or taken[right_key] >= policy.max_candidates:
+            continue
+        taken[left_key] += 1
+        taken[right_key] += 1
+        result.append((left, right, round(score, 4)))
+    return result
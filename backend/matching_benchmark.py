@@ -0,0 +1,109 @@
+# matching_benchmark.py
+# Скорость и качество поиска одинаковых товаров (matching.propose_matches)
+# на синтетическом каталоге двух магазинов: у части товаров первого магазина
+# есть двойник во втором с переставленными словами, другой записью объёма
+# и лишними или пропущенными словами. База не нужна.
+#   python matching_benchmark.py --products 100000
+import argparse
+import random
+import time
+
+from matching import MatchPolicy, propose_matches
+
+# Параметры
+SHARED_FRACTION = 0.6  # доля товаров, которые продаются в обоих магазинах
+
+NOUNS = [
+    "молоко", "кефир", "сметана", "творог", "сыр", "масло", "хлеб", "батон", "сок",
+    "чай", "кофе", "рис", "гречка", "макароны", "печенье", "шоколад", "колбаса",
+    "сосиски", "пельмени", "йогурт", "майонез", "кетчуп", "вода", "конфеты", "мука",
+]
+ADJECTIVES = [
+    "пастеризованное", "ультрапастеризованное", "отборное", "классический", "нарезка",
+    "копченая", "вареная", "молочный", "сливочное", "пшеничный", "ржаной", "натуральный",
+    "растворимый", "черный", "зеленый", "газированная", "негазированная", "домашний",
+    "горький", "фруктовый", "обезжиренный", "томатный", "провансаль", "цельнозерновой",
+]
+UNITS = [("г", [100, 180, 200, 250, 300, 400, 450, 500, 900]), ("мл", [200, 330, 500, 930, 1000])]
+SYLLABLES = ["ка", "ро", "ми", "ла", "ве", "то", "ни", "су", "да", "бо", "ге", "ну", "за", "пи"]
+
+
+def brand(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+
+
+def make_item(rng):
+    unit, amounts = rng.choice(UNITS)
+    return {
+        "noun": rng.choice(NOUNS),
+        "brand": brand(rng),
+        "adjectives": rng.sample(ADJECTIVES, rng.randint(1, 3)),
+        "unit": unit,
+        "amount": rng.choice(amounts),
+    }
+
+
+def render(item, rng, variant):
+    """
+    Название товара так, как его пишет магазин: во втором магазине слова
+    переставлены, объём записан иначе, одно слово может пропасть.
+    """
+    words = [item["noun"], item["brand"], *item["adjectives"]]
+    amount, unit = item["amount"], item["unit"]
+    if variant:
+        rng.shuffle(words)
+        if len(words) > 3 and rng.random() < 0.3:
+            words.pop(rng.randrange(2, len(words)))
+        if amount >= 1000 and rng.random() < 0.5:
+            quantity = f"{amount / 1000:g}".replace(".", ",") + ("кг" if unit == "г" else "л")
+        else:
+            quantity = f"{amount} {unit}"
+    else:
+        quantity = f"{amount}{unit}"
+    return " ".join(words) + " " + quantity
+
+
+def generate_catalog(products, rng):
+    catalog = []
+    expected = set()
+    shared = int(products / 2 * SHARED_FRACTION)
+    own = products // 2 - shared
+    product_id = 0
+    for i in range(shared + 2 * own):
+        item = make_item(rng)
+        if i < shared:
+            left, right = product_id + 1, product_id + 2
+            catalog.append((left, render(item, rng, False), "5ka"))
+            catalog.append((right, render(item, rng, True), "magnit"))
+            expected.add((left, right))
+            product_id += 2
+        else:
+            product_id += 1
+            store = "5ka" if i % 2 else "magnit"
+            catalog.append((product_id, render(item, rng, store == "magnit"), store))
+    return catalog, expected
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк поиска одинаковых товаров")
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--min-score", type=float, default=MatchPolicy().min_score)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    catalog, expected = generate_catalog(args.products, rng)
+    print(f"Товаров: {len(catalog)}, настоящих пар: {len(expected)}")
+    print(f"Полный перебор: {len(catalog) ** 2 // 4} сравнений")
+
+    started = time.perf_counter()
+    proposals = propose_matches(catalog, MatchPolicy(min_score=args.min_score))
+    elapsed = time.perf_counter() - started
+
+    found = {(left, right) for left, right, _ in proposals}
+    correct = len(found & expected)
+    print(
+        f"Найдено пар: {len(found)} за {elapsed:.1f} с, "
+        f"точность {correct / max(1, len(found)):.1%}, "
+        f"полнота {correct / max(1, len(expected)):.1%}"
+    )
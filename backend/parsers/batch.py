@@ -0,0 +1,136 @@
+import time
+from collections import deque
+
+from selenium.common.exceptions import WebDriverException
+
+from parsers.driver_settings import get_driver
+from parsers.registry import STORE_PARSERS, get_store_for_url, page_cache
+
+# Ресурсы, которые не нужны для чтения цены: картинки, шрифты, видео
+# и сторонние счётчики. Блокируются через CDP в каждой вкладке.
+BLOCKED_URL_PATTERNS = [
+    "*.png",
+    "*.jpg",
+    "*.jpeg",
+    "*.gif",
+    "*.webp",
+    "*.avif",
+    "*.svg",
+    "*.ico",
+    "*.woff",
+    "*.woff2",
+    "*.ttf",
+    "*.otf",
+    "*.mp4",
+    "*.webm",
+    "*google-analytics.com*",
+    "*googletagmanager.com*",
+    "*doubleclick.net*",
+    "*mc.yandex.ru*",
+    "*top-fwz1.mail.ru*",
+    "*vk.com/rtrg*",
+]
+
+
+def block_heavy_resources(driver, patterns=BLOCKED_URL_PATTERNS):
+    """
+    Включить блокировку ресурсов в текущей вкладке.
+    Для браузеров без CDP страница загружается как есть.
+    """
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+    except (AttributeError, WebDriverException):
+        pass
+
+
+def get_batch_driver():
+    """
+    Браузер для parse_many. При стратегии загрузки по умолчанию ("normal")
+    chromedriver на каждом switch_to.window и find_elements ждёт полной
+    загрузки вкладки, и вкладки фактически грузятся по очереди.
+    """
+    return get_driver(page_load_strategy="none")
+
+
+def parse_many(driver, urls, tabs=4, store=None, poll_interval=0.05):
+    """
+    Спарсить несколько ссылок в одном браузере: страницы загружаются
+    параллельно в нескольких вкладках, цены извлекаются по мере готовности
+    каждой страницы. Возвращает {url: результат или исключение}.
+    store задаёт парсер для всех ссылок; по умолчанию он определяется по домену.
+    driver должен быть создан через get_batch_driver.
+    """
+    results = {}
+    queue = deque()
+    for url in dict.fromkeys(urls):
+        cached = page_cache.get(url)
+        if cached is not None:
+            results[url] = cached
+        else:
+            queue.append(url)
+    if not queue:
+        return results
+
+    main_handle = driver.current_window_handle
+    handles = [main_handle]
+    for _ in range(min(tabs, len(queue)) - 1):
+        driver.switch_to.new_window("tab")
+        handles.append(driver.current_window_handle)
+
+    # handle -> (url, парсер, крайний срок)
+    active = {}
+
+    def start_next(handle):
+        while queue:
+            url = queue.popleft()
+            parser = STORE_PARSERS.get(store or get_store_for_url(url))
+            if parser is None:
+                results[url] = ValueError(f"Магазин не поддерживается: {url}")
+                continue
+            driver.switch_to.window(handle)
+            # Сначала пустая страница, чтобы не прочитать цену с предыдущей ссылки
+            driver.get("about:blank")
+            # Навигация без ожидания загрузки — браузер грузит вкладки параллельно
+            driver.execute_script("window.location.href = arguments[0];", url)
+            active[handle] = (url, parser, time.monotonic() + parser.timeout)
+            return
+
+    try:
+        for handle in handles:
+            driver.switch_to.window(handle)
+            block_heavy_resources(driver)
+            start_next(handle)
+
+        while active:
+            progressed = False
+            for handle in list(active):
+                url, parser, deadline = active[handle]
+                driver.switch_to.window(handle)
+                if any(driver.find_elements(*locator) for locator in parser.ready):
+                    try:
+                        results[url] = parser.extract(driver)
+                        page_cache.set(url, results[url])
+                    except Exception as e:
+                        results[url] = e
+                elif time.monotonic() > deadline:
+                    results[url] = TimeoutError(
+                        f"{parser.name}: страница не загрузилась за {parser.timeout} с"
+                    )
+                else:
+                    continue
+                progressed = True
+                del active[handle]
+                start_next(handle)
+            if not progressed:
+                time.sleep(poll_interval)
+    finally:
+        for handle in handles[1:]:
+            try:
+                driver.switch_to.window(handle)
+                driver.close()
+            except WebDriverException:
+                pass
+        driver.switch_to.window(main_handle)
+
+    return results
@@ -2,8 +2,13 @@ from selenium.webdriver.chrome.options import Options
 from selenium import webdriver
 
 
-def get_driver():
+def get_driver(page_load_strategy="normal"):
+    """
+    page_load_strategy="none" — команды драйвера не ждут загрузки страницы
+    (нужно для parse_many, который сам следит за готовностью вкладок).
+    """
     chrome_options = Options()
+    chrome_options.page_load_strategy = page_load_strategy
     # chrome_options.add_argument("--headless")
     chrome_options.add_argument("--disable-gpu")
     chrome_options.add_argument("--no-sandbox")
@@ -0,0 +1,173 @@
+import re
+import threading
+import time
+from urllib.parse import urlparse
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+
+from parsers.stores import STORES
+
+# Число в тексте цены: цифры и разделители (пробелы, точки, запятые) между ними
+PRICE_RE = re.compile(r"\d[\d\s.,]*\d|\d")
+
+
+def normalize_price(text):
+    """
+    Привести текст цены к числу: "1 299,90 ₽" -> 1299.9.
+    Возвращает None, если в тексте нет цены. Число берётся только из цифр
+    и разделителей между ними, так что точка в «руб.» не считается
+    десятичной. Последний разделитель — десятичный, остальные — разряды.
+
+    >>> normalize_price("1 299,90 ₽")
+    1299.9
+    >>> normalize_price("129,90 руб.")
+    129.9
+    >>> normalize_price("129.90 ₽.")
+    129.9
+    >>> normalize_price("12,5 р.")
+    12.5
+    >>> normalize_price("1.299,90")
+    1299.9
+    >>> normalize_price("99 ₽")
+    99.0
+    >>> normalize_price("нет в наличии") is None
+    True
+    """
+    if text is None:
+        return None
+    match = PRICE_RE.search(text)
+    if match is None:
+        return None
+    cleaned = re.sub(r"\s", "", match.group()).replace(",", ".")
+    # Точки, кроме последней, — разделители разрядов
+    whole, dot, fraction = cleaned.rpartition(".")
+    if dot:
+        cleaned = whole.replace(".", "") + "." + fraction
+    try:
+        return float(cleaned)
+    except ValueError:
+        return None
+
+
+class StoreParser:
+    """
+    Парсер магазина, собранный из декларативного описания в stores.py.
+    Селекторы превращаются в локаторы один раз при создании.
+    """
+
+    def __init__(self, name, config):
+        self.name = name
+        self.hosts = config["hosts"]
+        self.timeout = config["timeout"]
+        self.ready = [(By.XPATH, xpath) for xpath in config["ready"]]
+        self.variants = [
+            {
+                field: [(By.XPATH, xpath) for xpath in xpaths]
+                for field, xpaths in variant.items()
+            }
+            for variant in config["variants"]
+        ]
+
+    def wait_ready(self, driver):
+        WebDriverWait(driver, self.timeout).until(
+            EC.any_of(*(EC.presence_of_element_located(loc) for loc in self.ready))
+        )
+
+    def extract(self, driver):
+        """
+        Извлечь цены с уже загруженной страницы по первому подходящему
+        варианту вёрстки. ValueError, если ни один вариант не подошёл.
+        """
+        for variant in self.variants:
+            texts = {}
+            for field, locators in variant.items():
+                for locator in locators:
+                    elements = driver.find_elements(*locator)
+                    if elements:
+                        texts[field] = elements[0].text
+                        break
+                else:
+                    break  # Поле не найдено — пробуем следующий вариант
+            else:
+                return {
+                    field: normalize_price(texts.get(field))
+                    for field in ("price_with_discount", "price_without_discount")
+                }
+        raise ValueError(f"{self.name}: цена не найдена ни по одному варианту вёрстки")
+
+    def parse(self, driver, url):
+        driver.get(url)
+        self.wait_ready(driver)
+        return self.extract(driver)
+
+
+STORE_PARSERS = {name: StoreParser(name, config) for name, config in STORES.items()}
+
+
+def get_store_for_url(url):
+    """
+    Определить магазин по домену ссылки. None, если магазин не поддерживается.
+    """
+    host = (urlparse(url).hostname or "").lower()
+    for name, parser in STORE_PARSERS.items():
+        for store_host in parser.hosts:
+            if host == store_host or host.endswith("." + store_host):
+                return name
+    return None
+
+
+class PageResultCache:
+    """
+    Кэш результатов парсинга по URL с коротким TTL: повторный запрос
+    той же ссылки в пределах цикла не открывает страницу заново.
+    """
+
+    def __init__(self, ttl_seconds=300):
+        self.ttl_seconds = ttl_seconds
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def get(self, url):
+        with self.lock:
+            entry = self.values.get(url)
+            if entry is None:
+                return None
+            stored_at, result = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self.values[url]
+                return None
+            return result
+
+    def set(self, url, result):
+        with self.lock:
+            now = time.monotonic()
+            if len(self.values) >= 1024:
+                # Убираем устаревшие записи, чтобы кэш не рос бесконечно
+                self.values = {
+                    key: entry
+                    for key, entry in self.values.items()
+                    if now - entry[0] <= self.ttl_seconds
+                }
+            self.values[url] = (now, result)
+
+
+page_cache = PageResultCache()
+
+
+def parse_url(get_driver, url, store=None):
+    """
+    Спарсить цены по ссылке подходящим парсером магазина.
+    Браузер создаётся через get_driver только при промахе кэша.
+    """
+    cached = page_cache.get(url)
+    if cached is not None:
+        return cached
+    store = store or get_store_for_url(url)
+    if store is None:
+        raise ValueError(f"Магазин не поддерживается: {url}")
+    with get_driver() as driver:
+        result = STORE_PARSERS[store].parse(driver, url)
+    page_cache.set(url, result)
+    return result
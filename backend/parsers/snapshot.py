@@ -0,0 +1,182 @@
+"""
+Извлечение цен из сохранённого HTML страницы без браузера. Селекторы и
+порядок вариантов вёрстки — те же, что у StoreParser.extract, поэтому
+снимки страниц (driver.page_source после загрузки цены) можно проверять
+офлайн и намного быстрее, чем через Selenium.
+
+Поддерживается подмножество XPath, которого хватает для stores.py: шаги
+через / и //, tag или *, условия [n], [@attr], [@attr="v"] и
+[contains(@attr, "v")].
+"""
+import re
+from html.parser import HTMLParser
+
+from parsers.registry import normalize_price
+
+# Элементы без закрывающего тега
+VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "param", "source", "track", "wbr",
+}
+# Содержимое этих элементов не попадает в видимый текст
+HIDDEN_TAGS = {"head", "script", "style", "template", "noscript"}
+
+STEP_RE = re.compile(r"(//|/)([\w-]+|\*)((?:\[[^\]]*\])*)")
+PREDICATE_RE = re.compile(
+    r"""\[(?:(?P<index>\d+)"""
+    r"""|@(?P<attr>[\w-]+)(?:\s*=\s*(?P<quote>["'])(?P<value>.*?)(?P=quote))?"""
+    r"""|contains\(\s*@(?P<contains_attr>[\w-]+)\s*,\s*(?P<cquote>["'])(?P<part>.*?)(?P=cquote)\s*\))\]"""
+)
+
+
+class Element:
+    __slots__ = ("tag", "attrs", "order", "children", "parts")
+
+    def __init__(self, tag, attrs=(), order=0):
+        self.tag = tag
+        self.attrs = {name: value or "" for name, value in attrs}
+        self.order = order  # номер в порядке документа
+        self.children = []
+        self.parts = []  # текст и дочерние элементы в порядке документа
+
+    def append(self, child):
+        self.children.append(child)
+        self.parts.append(child)
+
+    def text(self) -> str:
+        """
+        Видимый текст элемента с пробелами, схлопнутыми как в Selenium.
+        """
+        chunks = []
+
+        def walk(element):
+            for part in element.parts:
+                if isinstance(part, str):
+                    chunks.append(part)
+                elif part.tag not in HIDDEN_TAGS:
+                    walk(part)
+
+        walk(self)
+        return " ".join("".join(chunks).split())
+
+
+class TreeBuilder(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = Element("#document")
+        self.stack = [self.root]
+        self.count = 0
+
+    def new_element(self, tag, attrs):
+        self.count += 1
+        element = Element(tag, attrs, self.count)
+        self.stack[-1].append(element)
+        return element
+
+    def handle_starttag(self, tag, attrs):
+        element = self.new_element(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.stack.append(element)
+
+    def handle_startendtag(self, tag, attrs):
+        self.new_element(tag, attrs)
+
+    def handle_endtag(self, tag):
+        # Незакрытые вложенные элементы закрываются вместе с родителем
+        for i in range(len(self.stack) - 1, 0, -1):
+            if self.stack[i].tag == tag:
+                del self.stack[i:]
+                return
+
+    def handle_data(self, data):
+        self.stack[-1].parts.append(data)
+
+
+def parse_document(html: str) -> Element:
+    builder = TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    return builder.root
+
+
+def descendants(node: Element):
+    for child in node.children:
+        yield child
+        yield from descendants(child)
+
+
+def matches(element: Element, predicate) -> bool:
+    if predicate.group("attr") is not None:
+        value = element.attrs.get(predicate.group("attr"))
+        if predicate.group("quote") is None:
+            return value is not None
+        return value == predicate.group("value")
+    value = element.attrs.get(predicate.group("contains_attr"))
+    return value is not None and predicate.group("part") in value
+
+
+def find_elements(root: Element, xpath: str) -> list:
+    """
+    Элементы по XPath в порядке документа (как find_elements).
+    ValueError для синтаксиса, который здесь не поддерживается.
+    """
+    steps = []
+    position = 0
+    while position < len(xpath):
+        match = STEP_RE.match(xpath, position)
+        if match is None:
+            raise ValueError(f"XPath не поддерживается: {xpath}")
+        predicates = list(PREDICATE_RE.finditer(match.group(3)))
+        if "".join(p.group(0) for p in predicates) != match.group(3):
+            raise ValueError(f"XPath не поддерживается: {xpath}")
+        steps.append((match.group(1), match.group(2), predicates))
+        position = match.end()
+    if not steps:
+        raise ValueError(f"XPath не поддерживается: {xpath}")
+
+    nodes = [root]
+    for axis, tag, predicates in steps:
+        if axis == "//":
+            # //tag — дочерние tag у самого узла и всех его потомков
+            nodes = nodes + [d for node in nodes for d in descendants(node)]
+        found = {}
+        for node in nodes:
+            # Условия применяются по очереди к детям одного родителя
+            children = [c for c in node.children if tag == "*" or c.tag == tag]
+            for predicate in predicates:
+                if predicate.group("index") is not None:
+                    index = int(predicate.group("index"))
+                    children = children[index - 1 : index] if index > 0 else []
+                else:
+                    children = [c for c in children if matches(c, predicate)]
+            for child in children:
+                found[id(child)] = child
+        if not found:
+            return []
+        nodes = sorted(found.values(), key=lambda element: element.order)
+    return nodes
+
+
+def extract_snapshot(parser, html: str):
+    """
+    Цены со снимка страницы по первому подходящему варианту вёрстки
+    парсера магазина: (номер варианта, {поле: цена}). ValueError, если
+    ни один вариант не подошёл.
+    """
+    root = parse_document(html)
+    for variant_index, variant in enumerate(parser.variants):
+        texts = {}
+        for field, locators in variant.items():
+            for _, xpath in locators:
+                elements = find_elements(root, xpath)
+                if elements:
+                    texts[field] = elements[0].text()
+                    break
+            else:
+                break  # Поле не найдено — пробуем следующий вариант
+        else:
+            return variant_index, {
+                field: normalize_price(texts.get(field))
+                for field in ("price_with_discount", "price_without_discount")
+            }
+    raise ValueError(f"{parser.name}: цена не найдена ни по одному варианту вёрстки")
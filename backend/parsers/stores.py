@@ -0,0 +1,66 @@
+# Декларативное описание магазинов для реестра парсеров.
+#
+# Чтобы добавить сеть, достаточно новой записи:
+#   hosts    — домены магазина (поддомены тоже подходят);
+#   timeout  — сколько секунд ждать загрузки цены;
+#   ready    — селекторы, появление любого из которых означает, что цена загрузилась;
+#   variants — варианты вёрстки в порядке приоритета. Вариант подходит, если найдены
+#              все его поля; для каждого поля перечисляются запасные селекторы.
+#
+# Пока у каждого поля только абсолютный XPath из прежних парсеров: запасные
+# селекторы (по классу или data-атрибуту, например
+# //div[contains(@class, "price")]/span) добавляются только по сохранённым
+# страницам магазина (scrape_replay.py record) и проверяются на
+# scrape_fixtures: python scrape_replay.py run.
+
+STORES = {
+    "5ka": {
+        "hosts": ["5ka.ru"],
+        "timeout": 10,
+        "ready": [
+            "/html/body/div[1]/div[2]/div[2]/div[1]/div[2]/div/div[1]/div[2]/div[1]/p[1]",
+            "/html/body/div[1]/div[2]/div[2]/div[1]/div[2]/div/div[1]/div[2]/div/p[1]",
+        ],
+        "variants": [
+            # Цена со скидкой
+            {
+                "price_without_discount": [
+                    "/html/body/div[1]/div[2]/div[2]/div[1]/div[2]/div/div[1]/div[2]/div[1]/p[1]",
+                ],
+                "price_with_discount": [
+                    "/html/body/div[1]/div[2]/div[2]/div[1]/div[2]/div/div[1]/div[2]/div[2]/div[2]/p[1]",
+                ],
+            },
+            # Цена без скидки
+            {
+                "price_without_discount": [
+                    "/html/body/div[1]/div[2]/div[2]/div[1]/div[2]/div/div[1]/div[2]/div/p[1]",
+                ],
+            },
+        ],
+    },
+    "magnit": {
+        "hosts": ["magnit.ru"],
+        "timeout": 5,
+        "ready": [
+            "/html/body/div[1]/div/div/div/main/div/div[1]/section/div/div/div/div[2]/section[1]/section/div[1]/span[1]",
+        ],
+        "variants": [
+            # Цена со скидкой
+            {
+                "price_without_discount": [
+                    "/html/body/div[1]/div/div/div/main/div/div[1]/section/div/div/div/div[2]/section[1]/section/div[1]/span[1]/span",
+                ],
+                "price_with_discount": [
+                    "/html/body/div[1]/div/div/div/main/div/div[1]/section/div/div/div/div[2]/section[1]/section/div[1]/div[1]/span/span",
+                ],
+            },
+            # Цена без скидки
+            {
+                "price_without_discount": [
+                    "/html/body/div[1]/div/div/div/main/div/div[1]/section/div/div/div/div[2]/section[1]/section/div[1]/span[1]/span",
+                ],
+            },
+        ],
+    },
+}
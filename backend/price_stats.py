@@ -0,0 +1,295 @@
+"""
+Предрасчитанная статистика цен по продуктам: первая и последняя цена,
+минимум, максимум, число записей и скидок. Таблица обновляется
+инкрементально при каждом flush, поэтому аналитика читает одну строку
+на продукт вместо всей истории.
+"""
+from collections import defaultdict
+from itertools import groupby
+
+from sqlalchemy import Column, Integer, Float, Date, select, insert, update, delete
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import declarative_base, Session
+
+PriceStatsBase = declarative_base()
+
+PRICE_FIELDS = ("ProductID", "PriceDate", "PriceWithDiscount", "PriceWithoutDiscount")
+# Цены хранятся как DECIMAL(10, 2): до записи в базу в объекте может
+# лежать неокруглённое значение, а история вернёт округлённое
+PRICE_SCALE = 2
+
+
+class ProductPriceStats(PriceStatsBase):
+    __tablename__ = "product_price_stats"
+
+    ProductID = Column(Integer, primary_key=True)
+    FirstDate = Column(Date, nullable=False)
+    FirstPrice = Column(Float, nullable=False)
+    LastDate = Column(Date, nullable=False)
+    LastPrice = Column(Float, nullable=False)
+    MinPrice = Column(Float, nullable=False)
+    MaxPrice = Column(Float, nullable=False)
+    Count = Column(Integer, nullable=False)
+    PriceSum = Column(Float, nullable=False)
+    DiscountCount = Column(Integer, nullable=False)
+    DiscountSum = Column(Float, nullable=False)  # сумма размеров скидок в процентах
+
+
+def price_point(price_date, with_discount, without_discount):
+    """
+    Запись цены в виде (дата, цена, скидка в % или None).
+    Цена выбирается как в get_valid_price; None, если цены нет.
+    """
+    if with_discount is not None:
+        with_discount = round(float(with_discount), PRICE_SCALE)
+    if without_discount is not None:
+        without_discount = round(float(without_discount), PRICE_SCALE)
+    price = with_discount if with_discount is not None else without_discount
+    if price is None or price_date is None:
+        return None
+    discount = None
+    if with_discount is not None and without_discount and with_discount < without_discount:
+        discount = (without_discount - with_discount) / without_discount * 100
+    return price_date, price, discount
+
+
+def add_point(stats, point):
+    """
+    Учесть запись в агрегатах (dict с полями ProductPriceStats или None).
+    """
+    price_date, price, discount = point
+    if stats is None:
+        stats = {
+            "FirstDate": price_date,
+            "FirstPrice": price,
+            "LastDate": price_date,
+            "LastPrice": price,
+            "MinPrice": price,
+            "MaxPrice": price,
+            "Count": 0,
+            "PriceSum": 0.0,
+            "DiscountCount": 0,
+            "DiscountSum": 0.0,
+        }
+    elif price_date < stats["FirstDate"]:
+        stats["FirstDate"], stats["FirstPrice"] = price_date, price
+    elif price_date >= stats["LastDate"]:
+        stats["LastDate"], stats["LastPrice"] = price_date, price
+    stats["MinPrice"] = min(stats["MinPrice"], price)
+    stats["MaxPrice"] = max(stats["MaxPrice"], price)
+    stats["Count"] += 1
+    stats["PriceSum"] += price
+    if discount is not None:
+        stats["DiscountCount"] += 1
+        stats["DiscountSum"] += discount
+    return stats
+
+
+def remove_point(stats, point) -> bool:
+    """
+    Вычесть запись из агрегатов. False, если запись была крайней
+    (первой, последней, минимумом или максимумом) — тогда агрегаты
+    продукта нужно пересчитать по истории.
+    """
+    price_date, price, discount = point
+    if stats is None or stats["Count"] <= 1:
+        return False
+    if price_date <= stats["FirstDate"] or price_date >= stats["LastDate"]:
+        return False
+    if price <= stats["MinPrice"] or price >= stats["MaxPrice"]:
+        return False
+    stats["Count"] -= 1
+    stats["PriceSum"] -= price
+    if discount is not None:
+        stats["DiscountCount"] -= 1
+        stats["DiscountSum"] -= discount
+    return True
+
+
+def _history_query(price_model, product_ids=None):
+    query = select(*(getattr(price_model, field) for field in PRICE_FIELDS))
+    if product_ids is not None:
+        query = query.where(price_model.ProductID.in_(product_ids))
+    return query.order_by(price_model.ProductID, price_model.PriceDate)
+
+
+def compute_price_stats(rows) -> dict:
+    """
+    Агрегаты по истории, упорядоченной по продукту и дате:
+    {product_id: dict с полями ProductPriceStats}.
+    """
+    result = {}
+    for product_id, group in groupby(rows, key=lambda row: row[0]):
+        stats = None
+        for row in group:
+            point = price_point(*row[1:])
+            if point is not None:
+                stats = add_point(stats, point)
+        if stats is not None:
+            result[product_id] = stats
+    return result
+
+
+def _stored_point(obj, old: bool):
+    """
+    Значения записи цены до изменения (old=True) или после. None для
+    старых значений, если они не загружены в сессию, — тогда продукт
+    пересчитывается целиком.
+    """
+    state = inspect(obj)
+    values = []
+    for field in PRICE_FIELDS:
+        if old:
+            history = state.attrs[field].history
+            if history.deleted:
+                values.append(history.deleted[0])
+            elif field in state.dict:
+                values.append(state.dict[field])
+            else:
+                return None
+        else:
+            values.append(getattr(obj, field))
+    return values[0], price_point(*values[1:])
+
+
+def register_price_stats(price_model):
+    """
+    Поддерживать product_price_stats при каждом flush: новые записи
+    добавляются к агрегатам, изменённые и удалённые вычитаются.
+    Пересчёт по истории нужен, только если затронута крайняя запись.
+    Массовые UPDATE/DELETE мимо ORM событий не вызывают — после них
+    нужен refresh_price_stats для затронутых продуктов.
+    """
+
+    @event.listens_for(Session, "after_flush")
+    def update_price_stats(session, flush_context):
+        added = defaultdict(list)
+        removed = defaultdict(list)
+        recompute = set()
+
+        def remove(obj):
+            stored = _stored_point(obj, old=True)
+            if stored is None:
+                recompute.add(obj.ProductID)
+            elif stored[1] is not None:
+                removed[stored[0]].append(stored[1])
+
+        for obj in session.new:
+            if isinstance(obj, price_model):
+                product_id, point = _stored_point(obj, old=False)
+                if point is not None:
+                    added[product_id].append(point)
+        for obj in session.dirty:
+            if isinstance(obj, price_model) and session.is_modified(obj):
+                remove(obj)
+                product_id, point = _stored_point(obj, old=False)
+                if point is not None:
+                    added[product_id].append(point)
+        for obj in session.deleted:
+            if isinstance(obj, price_model):
+                remove(obj)
+
+        product_ids = set(added) | set(removed) | recompute
+        if not product_ids:
+            return
+        connection = session.connection()
+        rows = connection.execute(
+            select(ProductPriceStats.__table__)
+            .where(ProductPriceStats.ProductID.in_(product_ids))
+            .with_for_update()
+        ).mappings()
+        current = {
+            row["ProductID"]: {k: v for k, v in row.items() if k != "ProductID"}
+            for row in rows
+        }
+        fresh = {}
+        for product_id in product_ids:
+            stats = current.get(product_id)
+            if product_id not in recompute and all(
+                remove_point(stats, point) for point in removed[product_id]
+            ):
+                for point in added[product_id]:
+                    stats = add_point(stats, point)
+                fresh[product_id] = stats
+            else:
+                recompute.add(product_id)
+        if recompute:
+            # Записи этого flush уже в базе, поэтому история актуальна
+            history = connection.execute(_history_query(price_model, recompute))
+            computed = compute_price_stats(history)
+            for product_id in recompute:
+                fresh[product_id] = computed.get(product_id)
+
+        for product_id, stats in fresh.items():
+            if stats is None:
+                connection.execute(
+                    delete(ProductPriceStats).where(ProductPriceStats.ProductID == product_id)
+                )
+            elif product_id in current:
+                connection.execute(
+                    update(ProductPriceStats)
+                    .where(ProductPriceStats.ProductID == product_id)
+                    .values(**stats)
+                )
+            else:
+                connection.execute(
+                    insert(ProductPriceStats).values(ProductID=product_id, **stats)
+                )
+
+
+def rebuild_price_stats(db: Session, price_model, dry_run: bool = False) -> list:
+    """
+    Пересчитать статистику всех продуктов по полной истории цен.
+    Возвращает ID продуктов, у которых сохранённые агрегаты расходились
+    с пересчитанными. При dry_run таблица не меняется.
+    """
+    expected = compute_price_stats(db.execute(_history_query(price_model)))
+    stored = {
+        row["ProductID"]: {k: v for k, v in row.items() if k != "ProductID"}
+        for row in db.execute(select(ProductPriceStats.__table__)).mappings()
+    }
+    mismatched = []
+    for product_id in sorted(set(expected) | set(stored)):
+        left, right = expected.get(product_id), stored.get(product_id)
+        if left is None or right is None or any(
+            abs(left[k] - right[k]) > 1e-6 if isinstance(left[k], float) else left[k] != right[k]
+            for k in left
+        ):
+            mismatched.append(product_id)
+    if not dry_run:
+        db.execute(delete(ProductPriceStats))
+        if expected:
+            db.execute(
+                insert(ProductPriceStats),
+                [{"ProductID": product_id, **stats} for product_id, stats in expected.items()],
+            )
+        db.commit()
+    return mismatched
+
+
+def refresh_price_stats(db: Session, price_model, product_ids, chunk_size: int = 500):
+    """
+    Пересчитать статистику указанных продуктов по их истории, например
+    после массового удаления цен мимо ORM. Продукты без истории удаляются
+    из таблицы. Не коммитит.
+    """
+    product_ids = sorted(set(product_ids))
+    for i in range(0, len(product_ids), chunk_size):
+        chunk = product_ids[i : i + chunk_size]
+        computed = compute_price_stats(db.execute(_history_query(price_model, chunk)))
+        db.execute(delete(ProductPriceStats).where(ProductPriceStats.ProductID.in_(chunk)))
+        if computed:
+            db.execute(
+                insert(ProductPriceStats),
+                [{"ProductID": product_id, **stats} for product_id, stats in computed.items()],
+            )
+
+
+def ensure_price_stats(db: Session, price_model):
+    """
+    Заполнить таблицу при первом запуске на базе, где история уже есть.
+    """
+    has_stats = db.execute(select(ProductPriceStats.ProductID).limit(1)).first()
+    has_prices = db.execute(select(price_model.PriceID).limit(1)).first()
+    if has_prices and not has_stats:
+        rebuild_price_stats(db, price_model)
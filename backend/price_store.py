@@ -0,0 +1,368 @@
+"""
+Компактное хранилище истории цен в памяти для аналитики. Вместо объекта
+Price с Decimal на каждую запись цены лежат в колонках array: цены в
+копейках (int64), даты — порядковые номера дней (int32), всё упорядочено
+по (ProductID, PriceDate), а для каждого продукта хранится смещение его
+первой записи. Поиск цены на дату — бинарный поиск внутри продукта.
+
+Хранилище только для чтения: новые и изменённые записи подтягиваются по
+журналу изменений (changes) целыми продуктами в небольшой оверлей, который
+время от времени сливается с основными колонками. Колонки можно сохранить
+в файл и при перезапуске отобразить его в память через mmap без разбора.
+"""
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import date
+from itertools import groupby
+
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+
+from changefeed import Change, get_first_seq
+
+# Отсутствующая цена (в таблице prices — NULL)
+MISSING = -(2**63)
+
+# Заголовок файла: сигнатура, порядок байт, число продуктов, записей и номер журнала
+FILE_MAGIC = b"PRICES01"
+FILE_HEADER = struct.Struct("<8s8sqqq")
+
+# Размер пачки идентификаторов в IN (лимит параметров SQLite)
+ID_CHUNK = 900
+
+PricePoint = namedtuple(
+    "PricePoint", ["PriceDate", "PriceWithDiscount", "PriceWithoutDiscount"]
+)
+
+
+def to_kopecks(value) -> int:
+    return MISSING if value is None else round(float(value) * 100)
+
+
+def from_kopecks(value: int):
+    return None if value == MISSING else value / 100
+
+
+class PriceColumns:
+    """
+    Колонки истории цен. product_ids отсортированы, записи продукта
+    product_ids[i] занимают позиции offsets[i]..offsets[i + 1].
+    """
+
+    def __init__(self, product_ids, offsets, dates, with_discount, without_discount):
+        self.product_ids = product_ids
+        self.offsets = offsets
+        self.dates = dates
+        self.with_discount = with_discount
+        self.without_discount = without_discount
+
+    def __len__(self):
+        return len(self.dates)
+
+    def bounds(self, product_id):
+        """
+        Позиции записей продукта или None, если записей нет.
+        """
+        i = bisect_left(self.product_ids, product_id)
+        if i == len(self.product_ids) or self.product_ids[i] != product_id:
+            return None
+        return self.offsets[i], self.offsets[i + 1]
+
+    def last_before(self, bounds, ordinal: int):
+        """
+        Позиция последней записи на или до дня ordinal (или None).
+        """
+        lo, hi = bounds
+        k = bisect_right(self.dates, ordinal, lo, hi)
+        return k - 1 if k > lo else None
+
+    def point(self, k) -> PricePoint:
+        return PricePoint(
+            date.fromordinal(self.dates[k]),
+            from_kopecks(self.with_discount[k]),
+            from_kopecks(self.without_discount[k]),
+        )
+
+    def valid_price(self, k):
+        # Как get_valid_price: цена со скидкой, иначе обычная
+        value = self.with_discount[k]
+        if value == MISSING:
+            value = self.without_discount[k]
+        return from_kopecks(value)
+
+    def rows(self, product_id):
+        bounds = self.bounds(product_id)
+        if bounds is None:
+            return
+        for k in range(*bounds):
+            yield product_id, self.dates[k], self.with_discount[k], self.without_discount[k]
+
+
+def build_columns(rows) -> PriceColumns:
+    """
+    Собрать колонки из строк (ProductID, день, копейки со скидкой,
+    копейки без скидки), упорядоченных по продукту и дню.
+    """
+    product_ids, offsets = array("q"), array("q")
+    dates, with_discount, without_discount = array("i"), array("q"), array("q")
+    current = None
+    for product_id, ordinal, with_value, without_value in rows:
+        if product_id != current:
+            product_ids.append(product_id)
+            offsets.append(len(dates))
+            current = product_id
+        dates.append(ordinal)
+        with_discount.append(with_value)
+        without_discount.append(without_value)
+    offsets.append(len(dates))
+    return PriceColumns(product_ids, offsets, dates, with_discount, without_discount)
+
+
+def _history_query(price_model, product_ids=None):
+    query = select(
+        price_model.ProductID,
+        price_model.PriceDate,
+        price_model.PriceWithDiscount,
+        price_model.PriceWithoutDiscount,
+    )
+    if product_ids is not None:
+        query = query.where(price_model.ProductID.in_(product_ids))
+    return query.order_by(price_model.ProductID, price_model.PriceDate)
+
+
+def _compact_rows(result):
+    for product_id, price_date, with_discount, without_discount in result:
+        yield (
+            product_id,
+            price_date.toordinal(),
+            to_kopecks(with_discount),
+            to_kopecks(without_discount),
+        )
+
+
+def _chunks(values, size=ID_CHUNK):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i : i + size]
+
+
+class CompactPriceStore:
+    """
+    История цен в колонках с догоняющим обновлением по журналу изменений.
+    Читатели берут пару (колонки, оверлей) одной ссылкой и не блокируются;
+    обновление строит новую пару и подменяет её целиком.
+    """
+
+    def __init__(self, path: str = None, compact_ratio: float = 0.05):
+        self.path = path  # файл для быстрой загрузки при перезапуске
+        self.compact_ratio = compact_ratio
+        self.state = (build_columns([]), {})
+        self.seq = 0  # последний учтённый номер журнала изменений
+        self.saved_seq = None
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        columns, overlay = self.state
+        count = len(columns)
+        for product_id, part in overlay.items():
+            bounds = columns.bounds(product_id)
+            count += len(part) - (bounds[1] - bounds[0] if bounds else 0)
+        return count
+
+    # Чтение
+
+    def _locate(self, product_id):
+        columns, overlay = self.state
+        columns = overlay.get(product_id, columns)
+        return columns, columns.bounds(product_id)
+
+    def price_on_or_before(self, product_id: int, target_date: date):
+        """
+        Последняя запись цены продукта на или до даты (как
+        get_price_on_or_before) в виде PricePoint или None.
+        """
+        columns, bounds = self._locate(product_id)
+        if bounds is None:
+            return None
+        k = columns.last_before(bounds, target_date.toordinal())
+        return columns.point(k) if k is not None else None
+
+    def prices_as_of(self, dates, product_ids=None) -> dict:
+        """
+        Цены продуктов (по умолчанию всех) на или до каждой из дат в формате
+        collect_prices_as_of: {дата: {ProductID: цена}}.
+        """
+        dates = sorted(set(dates))
+        ordinals = [d.toordinal() for d in dates]
+        snapshot = {d: {} for d in dates}
+        columns, overlay = self.state
+        if product_ids is None:
+            product_ids = sorted(set(columns.product_ids) | set(overlay))
+        for product_id in product_ids:
+            part = overlay.get(product_id, columns)
+            bounds = part.bounds(product_id)
+            if bounds is None:
+                continue
+            for d, ordinal in zip(dates, ordinals):
+                k = part.last_before(bounds, ordinal)
+                if k is not None:
+                    snapshot[d][product_id] = part.valid_price(k)
+        return snapshot
+
+    # Обновление
+
+    def refresh(self, db: Session, price_model):
+        """
+        Догнать базу по журналу изменений. Новые и изменённые записи
+        перечитываются целыми продуктами; удаление записей (в том числе
+        перенос цены к другому продукту, он журналируется как delete и
+        insert) или пропуск в журнале (его очистили) — полная перезагрузка.
+        """
+        with self.lock:
+            if not self.loaded and not (self.path and self._load_file(self.path)):
+                self._reload(db, price_model)
+                return
+            last_seq = db.execute(select(func.max(Change.Seq))).scalar() or 0
+            if last_seq <= self.seq:
+                return
+            if get_first_seq(db) > self.seq + 1:
+                self._reload(db, price_model)
+                return
+            changes = db.execute(
+                select(Change.Op, Change.EntityID).where(
+                    Change.Entity == "price", Change.Seq > self.seq, Change.Seq <= last_seq
+                )
+            ).all()
+            if any(op == "delete" for op, _ in changes):
+                self._reload(db, price_model)
+                return
+            price_ids = {entity_id for _, entity_id in changes}
+            product_ids = set()
+            for chunk in _chunks(price_ids):
+                product_ids.update(
+                    db.execute(
+                        select(price_model.ProductID)
+                        .where(price_model.PriceID.in_(chunk))
+                        .distinct()
+                    ).scalars()
+                )
+            columns, overlay = self.state
+            overlay = dict(overlay)
+            for chunk in _chunks(sorted(product_ids)):
+                result = db.execute(_history_query(price_model, chunk))
+                for product_id, rows in groupby(_compact_rows(result), key=lambda r: r[0]):
+                    overlay[product_id] = build_columns(rows)
+            self.state = (columns, overlay)
+            self.seq = last_seq
+            if sum(len(part) for part in overlay.values()) > self.compact_ratio * max(
+                len(columns), 1000
+            ):
+                self._compact()
+
+    def _reload(self, db: Session, price_model):
+        # Номер журнала берётся до чтения: изменения после него применятся повторно
+        seq = db.execute(select(func.max(Change.Seq))).scalar() or 0
+        result = db.execute(_history_query(price_model).execution_options(yield_per=10000))
+        self.state = (build_columns(_compact_rows(result)), {})
+        self.seq = seq
+        self.loaded = True
+
+    def _compact(self):
+        """
+        Слить оверлей с основными колонками (без обращения к базе).
+        """
+        columns, overlay = self.state
+        product_ids = sorted(set(columns.product_ids) | set(overlay))
+
+        def rows():
+            for product_id in product_ids:
+                yield from overlay.get(product_id, columns).rows(product_id)
+
+        self.state = (build_columns(rows()), {})
+
+    # Файл
+
+    def save(self, path: str) -> bool:
+        """
+        Записать колонки в файл (оверлей предварительно сливается).
+        Ничего не делает, если с последнего сохранения или загрузки ничего
+        не изменилось. Запись атомарная: через временный файл.
+        """
+        with self.lock:
+            if not self.loaded or self.saved_seq == self.seq:
+                return False
+            if self.state[1]:
+                self._compact()
+            columns = self.state[0]
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(
+                    FILE_HEADER.pack(
+                        FILE_MAGIC,
+                        sys.byteorder.encode(),
+                        len(columns.product_ids),
+                        len(columns),
+                        self.seq,
+                    )
+                )
+                # Сначала 8-байтовые колонки, даты (4 байта) в конце — без выравнивания
+                for column in (
+                    columns.product_ids,
+                    columns.offsets,
+                    columns.with_discount,
+                    columns.without_discount,
+                    columns.dates,
+                ):
+                    f.write(column)
+            os.replace(tmp_path, path)
+            self.saved_seq = self.seq
+            return True
+
+    def _load_file(self, path: str) -> bool:
+        """
+        Отобразить сохранённые колонки в память. Данные не копируются:
+        колонки — memoryview поверх mmap, страницы читаются по мере
+        обращения. False, если файла нет или он в другом формате.
+        """
+        try:
+            with open(path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+        if len(mapped) < FILE_HEADER.size:
+            return False
+        magic, byteorder, products, rows, seq = FILE_HEADER.unpack_from(mapped)
+        expected = FILE_HEADER.size + 8 * (2 * products + 1) + 8 * 2 * rows + 4 * rows
+        if (
+            magic != FILE_MAGIC
+            or byteorder.rstrip(b"\0") != sys.byteorder.encode()
+            or len(mapped) != expected
+        ):
+            return False
+        view = memoryview(mapped)
+        position = FILE_HEADER.size
+        parts = []
+        for count, code, size in (
+            (products, "q", 8),
+            (products + 1, "q", 8),
+            (rows, "q", 8),
+            (rows, "q", 8),
+            (rows, "i", 4),
+        ):
+            parts.append(view[position : position + count * size].cast(code))
+            position += count * size
+        product_ids, offsets, with_discount, without_discount, dates = parts
+        self.state = (
+            PriceColumns(product_ids, offsets, dates, with_discount, without_discount),
+            {},
+        )
+        self.seq = self.saved_seq = seq
+        self.loaded = True
+        return True
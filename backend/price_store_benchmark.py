@@ -0,0 +1,112 @@
+# price_store_benchmark.py
+# Память и скорость CompactPriceStore против объектов Price из ORM на
+# синтетической истории: байт на запись, поиск цены на дату и загрузка
+# сохранённого файла через mmap. База не нужна.
+#   python price_store_benchmark.py --products 20000 --days 500
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from decimal import Decimal
+
+from main import Price
+from price_store import CompactPriceStore, build_columns, to_kopecks
+
+# Параметры
+ORM_SAMPLE = 100_000  # объектов Price для оценки памяти ORM
+
+
+def generate_rows(products, days, rng):
+    start = date(2023, 1, 1)
+    for product_id in range(1, products + 1):
+        price = Decimal(rng.randint(5_000, 50_000)) / 100
+        for day in range(days):
+            if rng.random() < 0.05:
+                price = (price * Decimal(rng.uniform(0.9, 1.15))).quantize(Decimal("0.01"))
+            with_discount = (price * Decimal("0.8")).quantize(Decimal("0.01")) if day % 30 < 5 else None
+            yield product_id, start + timedelta(days=day), with_discount, price
+
+
+def measure(build):
+    tracemalloc.start()
+    started = time.perf_counter()
+    value = build()
+    elapsed = time.perf_counter() - started
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size, elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк компактного хранилища цен")
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--days", type=int, default=500)
+    parser.add_argument("--lookups", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rows_total = args.products * args.days
+
+    rng = random.Random(args.seed)
+    orm_rows = [row for _, row in zip(range(ORM_SAMPLE), generate_rows(args.products, args.days, rng))]
+    objects, orm_size, _ = measure(
+        lambda: [
+            Price(ProductID=p, PriceDate=d, PriceWithDiscount=w, PriceWithoutDiscount=wo)
+            for p, d, w, wo in orm_rows
+        ]
+    )
+    del objects, orm_rows
+    print(f"ORM: {orm_size / ORM_SAMPLE:.0f} байт на запись (выборка {ORM_SAMPLE})")
+
+    rng = random.Random(args.seed)
+    store = CompactPriceStore()
+    columns, store_size, elapsed = measure(
+        lambda: build_columns(
+            (p, d.toordinal(), to_kopecks(w), to_kopecks(wo))
+            for p, d, w, wo in generate_rows(args.products, args.days, rng)
+        )
+    )
+    store.state = (columns, {})
+    store.loaded = True
+    store.seq = 1
+    print(
+        f"CompactPriceStore: {rows_total} записей, {store_size / rows_total:.1f} байт "
+        f"на запись, {store_size / 2**20:.0f} МБ, построение {elapsed:.1f} с"
+    )
+
+    queries = [
+        (rng.randint(1, args.products), date(2023, 1, 1) + timedelta(days=rng.randint(0, args.days)))
+        for _ in range(args.lookups)
+    ]
+    started = time.perf_counter()
+    for product_id, target_date in queries:
+        store.price_on_or_before(product_id, target_date)
+    elapsed = time.perf_counter() - started
+    print(f"price_on_or_before: {elapsed / args.lookups * 1e6:.1f} мкс на запрос")
+
+    started = time.perf_counter()
+    snapshot = store.prices_as_of([date(2023, 6, 1), date(2024, 1, 1)])
+    print(
+        f"prices_as_of по {len(snapshot[date(2024, 1, 1)])} продуктам на 2 даты: "
+        f"{time.perf_counter() - started:.2f} с"
+    )
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "prices.bin")
+        started = time.perf_counter()
+        store.save(path)
+        saved = time.perf_counter() - started
+        reloaded = CompactPriceStore()
+        started = time.perf_counter()
+        reloaded._load_file(path)
+        loaded = time.perf_counter() - started
+        assert reloaded.prices_as_of([date(2024, 1, 1)]) == {
+            date(2024, 1, 1): snapshot[date(2024, 1, 1)]
+        }
+        print(
+            f"Файл {os.path.getsize(path) / 2**20:.0f} МБ: запись {saved:.2f} с, "
+            f"загрузка через mmap {loaded * 1000:.1f} мс"
+        )
+        del reloaded
@@ -0,0 +1,408 @@
+"""
+Профилирование отдельных запросов через cProfile. Администратор добавляет
+к запросу заголовок X-Profile (или параметр ?profile=) и свой X-Admin-Token:
+профиль сохраняется в каталог в формате pstats, а при значении «text»
+вместо ответа возвращается отчёт по самым дорогим функциям. В режиме
+выборки профилируется каждый N-й запрос каждого маршрута, в каталоге
+остаются только последние файлы.
+
+Синхронные эндпоинты FastAPI выполняются в пуле потоков, а cProfile видит
+только свой поток, поэтому вызовы run_in_threadpool из FastAPI (эндпоинт,
+зависимости, проверка модели ответа) на время профилируемого запроса
+получают собственный профилировщик. Время SQL считается по событиям
+движка. Если профилирование не настроено, ничего из этого не подключается.
+"""
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import re
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from starlette.datastructures import Headers, QueryParams
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Match
+
+# Профиль текущего запроса (None — запрос не профилируется)
+current_profile = ContextVar("current_profile", default=None)
+
+PROFILE_SUFFIX = ".prof"
+PROFILE_NAME_RE = re.compile(r"^[\w.-]+\.prof$")
+
+
+class ProfilePolicy:
+    """
+    admin_token — токен для профилирования по запросу (None — выключено),
+    sample_every — профилировать каждый N-й запрос маршрута (0 — выключено),
+    directory и keep — каталог профилей и сколько последних файлов хранить,
+    top — сколько функций показывать в текстовом отчёте.
+    """
+
+    def __init__(
+        self,
+        admin_token: str = None,
+        sample_every: int = 0,
+        directory: str = "profiles",
+        keep: int = 200,
+        top: int = 40,
+    ):
+        self.admin_token = admin_token
+        self.sample_every = sample_every
+        self.directory = directory
+        self.keep = keep
+        self.top = top
+
+    @property
+    def enabled(self):
+        return bool(self.admin_token) or self.sample_every > 0
+
+    def is_admin(self, token) -> bool:
+        if not self.admin_token or not token:
+            return False
+        return hmac.compare_digest(token.encode(), self.admin_token.encode())
+
+
+class RequestProfile:
+    """
+    Профили всех потоков, в которых выполнялся запрос, и время SQL.
+    """
+
+    def __init__(self):
+        self.profilers = []
+        self.seconds = 0.0
+        self.sql_seconds = 0.0
+        self.sql_queries = 0
+        self.active = True
+        self.streaming = False
+        self.lock = threading.Lock()
+
+    def start(self):
+        if not self.active:
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+: профилировщик уже включён (он общий для всех потоков)
+            return None
+        with self.lock:
+            self.profilers.append(profiler)
+        return profiler
+
+    def run(self, func, /, *args, **kwargs):
+        profiler = self.start()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+
+    def add_query(self, seconds: float):
+        with self.lock:
+            self.sql_seconds += seconds
+            self.sql_queries += 1
+
+    def stats(self, stream=None) -> pstats.Stats:
+        return pstats.Stats(*self.profilers, stream=stream)
+
+    def summary(self) -> str:
+        return (
+            f"Всего {self.seconds * 1000:.1f} мс, SQL {self.sql_seconds * 1000:.1f} мс "
+            f"({self.sql_queries} запросов)"
+        )
+
+
+def track_sql(engine):
+    """
+    Считать время выполнения SQL профилируемых запросов (без выборки строк).
+    Для асинхронного движка передаётся его sync_engine.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if current_profile.get() is not None:
+            conn.info.setdefault("profile_query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        profile = current_profile.get()
+        started = conn.info.get("profile_query_started")
+        if profile is not None and started:
+            profile.add_query(time.perf_counter() - started.pop())
+
+
+def profiled_threadpool(run_in_threadpool):
+    """
+    Обёртка run_in_threadpool: в профилируемом запросе функция
+    выполняется под профилировщиком своего потока.
+    """
+
+    async def run(func, *args, **kwargs):
+        profile = current_profile.get()
+        if profile is None:
+            return await run_in_threadpool(func, *args, **kwargs)
+        return await run_in_threadpool(profile.run, func, *args, **kwargs)
+
+    return run
+
+
+def profile_label(method: str, path: str) -> str:
+    slug = re.sub(r"\W+", "_", path).strip("_") or "root"
+    return f"{method.lower()}_{slug[:60]}"
+
+
+def save_profile(profile: RequestProfile, directory: str, keep: int, label: str) -> str:
+    """
+    Записать профиль в каталог и удалить самые старые файлы сверх keep.
+    В имени — время, метка запроса, общее время и время SQL.
+    """
+    os.makedirs(directory, exist_ok=True)
+    now = time.time()
+    name = (
+        f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}.{int(now % 1 * 1000):03d}-"
+        f"{os.getpid()}-{label}-"
+        f"{profile.seconds * 1000:.0f}ms-sql{profile.sql_seconds * 1000:.0f}ms{PROFILE_SUFFIX}"
+    )
+    profile.stats().dump_stats(os.path.join(directory, name))
+    files = list_profiles(directory)
+    for old in files[keep:]:
+        try:
+            os.remove(os.path.join(directory, old["name"]))
+        except FileNotFoundError:
+            pass  # Удалил другой воркер
+    return name
+
+
+def list_profiles(directory: str) -> list:
+    """
+    Сохранённые профили, новые первыми.
+    """
+    try:
+        names = [name for name in os.listdir(directory) if name.endswith(PROFILE_SUFFIX)]
+    except FileNotFoundError:
+        return []
+    files = []
+    for name in names:
+        try:
+            stat = os.stat(os.path.join(directory, name))
+        except FileNotFoundError:
+            continue
+        files.append({"name": name, "size": stat.st_size, "created_at": stat.st_mtime})
+    files.sort(key=lambda f: f["created_at"], reverse=True)
+    return files
+
+
+def profile_path(directory: str, name: str):
+    """
+    Путь к сохранённому профилю или None (имя проверяется, чтобы не выйти
+    за пределы каталога).
+    """
+    if not PROFILE_NAME_RE.match(name):
+        return None
+    path = os.path.join(directory, name)
+    return path if os.path.isfile(path) else None
+
+
+def format_stats(stats: pstats.Stats, stream, top: int, header: str = None) -> str:
+    if header:
+        stream.write(header + "\n\n")
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+    return stream.getvalue()
+
+
+def format_profile_file(path: str, top: int) -> str:
+    stream = io.StringIO()
+    return format_stats(pstats.Stats(path, stream=stream), stream, top)
+
+
+def is_streaming(message) -> bool:
+    """
+    Начало потокового ответа (StreamingResponse, SSE): у него нет
+    Content-Length, и он может не закончиться никогда.
+    """
+    return message["type"] == "http.response.start" and not any(
+        key.lower() == b"content-length" for key, _ in message.get("headers", [])
+    )
+
+
+def requested_mode(scope):
+    """
+    Режим профилирования из заголовка X-Profile или параметра profile:
+    «text» — вернуть отчёт вместо ответа, любое другое непустое значение
+    (кроме «0») — сохранить профиль. None — профилирование не запрошено.
+    """
+    value = Headers(scope=scope).get("x-profile")
+    if value is None:
+        value = QueryParams(scope["query_string"]).get("profile")
+    if not value or value == "0":
+        return None
+    return "text" if value.lower() == "text" else "store"
+
+
+class ProfilingMiddleware:
+    """
+    ASGI-посредник: профилирование по запросу администратора и выборочное.
+    Одновременно профилируется один запрос на процесс: профилировщики разных
+    запросов в потоке цикла событий мешали бы друг другу. Профиль потока
+    цикла событий включает и другие запросы, выполнявшиеся параллельно.
+    """
+
+    def __init__(self, app, policy: ProfilePolicy, router):
+        self.app = app
+        self.policy = policy
+        self.router = router
+        self.counters = defaultdict(int)
+        self.busy = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        mode = requested_mode(scope)
+        if mode is not None:
+            await self.profile_on_demand(scope, receive, send, mode)
+            return
+        if self.policy.sample_every > 0 and not self.busy:
+            route_path = self.route_path(scope)
+            if route_path is not None:
+                self.counters[route_path] += 1
+                if (self.counters[route_path] - 1) % self.policy.sample_every == 0:
+                    profile = await self.run_profiled(scope, receive, send)
+                    if profile.streaming:
+                        return
+                    save_profile(
+                        profile,
+                        self.policy.directory,
+                        self.policy.keep,
+                        profile_label(scope["method"], route_path),
+                    )
+                    return
+        await self.app(scope, receive, send)
+
+    def route_path(self, scope):
+        # Шаблон пути маршрута, чтобы /products/1 и /products/2 считались вместе
+        for route in self.router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", None)
+        return None
+
+    async def run_profiled(self, scope, receive, send) -> RequestProfile:
+        """
+        Выполнить запрос под профилировщиком. Для потокового ответа
+        профилирование прекращается на его первом сообщении (profile.streaming),
+        а сам ответ идёт дальше как обычно.
+        """
+        profile = RequestProfile()
+        self.busy = True
+        token = current_profile.set(profile)
+        profiler = profile.start()
+        started = time.perf_counter()
+
+        def stop():
+            if not profile.active:
+                return
+            profile.active = False
+            if profiler is not None:
+                profiler.disable()
+            profile.seconds = time.perf_counter() - started
+            self.busy = False
+
+        async def watch(message):
+            if is_streaming(message):
+                profile.streaming = True
+                stop()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, watch)
+        finally:
+            stop()
+            current_profile.reset(token)
+        return profile
+
+    async def profile_on_demand(self, scope, receive, send, mode):
+        if not self.policy.is_admin(Headers(scope=scope).get("x-admin-token")):
+            response = JSONResponse({"detail": "Admin token required"}, status_code=403)
+            await response(scope, receive, send)
+            return
+        if self.busy:
+            response = JSONResponse(
+                {"detail": "Another request is being profiled"}, status_code=409
+            )
+            await response(scope, receive, send)
+            return
+
+        # Ответ придерживается, чтобы добавить заголовки с итогами профиля.
+        # Потоковый ответ не профилируется: вместо него сразу уходит 400
+        messages = []
+        refused = False
+
+        async def buffer(message):
+            nonlocal refused
+            if refused:
+                return
+            if is_streaming(message):
+                refused = True
+                response = JSONResponse(
+                    {"detail": "Streaming responses cannot be profiled"}, status_code=400
+                )
+                await response(scope, receive, send)
+                return
+            messages.append(message)
+
+        profile = await self.run_profiled(scope, receive, buffer)
+        if refused:
+            return
+        name = save_profile(
+            profile,
+            self.policy.directory,
+            self.policy.keep,
+            profile_label(scope["method"], scope["path"]),
+        )
+        headers = {
+            "X-Profile-File": name,
+            "X-Profile-Seconds": f"{profile.seconds:.4f}",
+            "X-Profile-SQL-Seconds": f"{profile.sql_seconds:.4f}",
+            "X-Profile-SQL-Queries": str(profile.sql_queries),
+        }
+        if mode == "text":
+            status = next(
+                (m["status"] for m in messages if m["type"] == "http.response.start"), 500
+            )
+            stream = io.StringIO()
+            report = format_stats(
+                profile.stats(stream=stream), stream, self.policy.top, profile.summary()
+            )
+            response = PlainTextResponse(
+                report, headers={**headers, "X-Profile-Status": str(status)}
+            )
+            await response(scope, receive, send)
+            return
+        for message in messages:
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (key.lower().encode("latin-1"), value.encode("latin-1"))
+                    for key, value in headers.items()
+                ]
+            await send(message)
+
+
+def install_profiling(app, policy: ProfilePolicy, engines):
+    """
+    Подключить профилирование к приложению: посредник, учёт SQL на
+    движках и профилировщик в потоках пула FastAPI.
+    """
+    import fastapi.dependencies.utils
+    import fastapi.routing
+
+    for module in (fastapi.routing, fastapi.dependencies.utils):
+        module.run_in_threadpool = profiled_threadpool(module.run_in_threadpool)
+    for engine in engines:
+        track_sql(engine)
+    app.add_middleware(ProfilingMiddleware, policy=policy, router=app.router)
@@ -0,0 +1,30 @@
+# rebuild_stats.py
+# Полный пересчёт таблицы product_price_stats по истории цен.
+# С --check только сравнивает сохранённую статистику с пересчитанной
+# и завершается с кодом 1 при расхождениях.
+#   python rebuild_stats.py --check
+import argparse
+import sys
+
+from sqlalchemy.orm import Session
+
+from main import engine, init_database, Price
+from price_stats import rebuild_price_stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пересчёт статистики цен")
+    parser.add_argument(
+        "--check", action="store_true", help="только проверить, без записи"
+    )
+    args = parser.parse_args()
+
+    init_database(engine)
+    with Session(engine) as db:
+        mismatched = rebuild_price_stats(db, Price, dry_run=args.check)
+    if mismatched:
+        print(f"Расхождения у {len(mismatched)} продуктов: {mismatched[:20]}")
+    else:
+        print("Статистика совпадает с историей цен")
+    if args.check:
+        sys.exit(1 if mismatched else 0)
+    print("Статистика пересчитана")
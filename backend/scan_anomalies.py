@@ -0,0 +1,34 @@
+# scan_anomalies.py
+# Пакетная проверка сохранённой истории цен на выбросы. Найденные записи
+# попадают в карантин (/quarantine) и удаляются из prices только после
+# отклонения. С --dry-run только выводит найденное.
+#   python scan_anomalies.py --dry-run
+import argparse
+
+from sqlalchemy.orm import Session
+
+from main import engine, init_database, Price, ANOMALY_POLICY
+from anomalies import scan_price_history
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Поиск выбросов в истории цен")
+    parser.add_argument(
+        "--dry-run", action="store_true", help="только вывести, без записи в карантин"
+    )
+    args = parser.parse_args()
+
+    init_database(engine)
+    # Вывод внутри сессии: после коммита записи карантина перечитываются из базы
+    with Session(engine) as db:
+        found = scan_price_history(db, Price, ANOMALY_POLICY, dry_run=args.dry_run)
+        for entry in found:
+            price = (
+                entry.PriceWithDiscount
+                if entry.PriceWithDiscount is not None
+                else entry.PriceWithoutDiscount
+            )
+            print(
+                f"Продукт {entry.ProductID}, {entry.PriceDate}: {price} ₽ "
+                f"(медиана {entry.Baseline}) — {entry.Reasons}"
+            )
+    print(f"Найдено подозрительных цен: {len(found)}")
@@ -0,0 +1,242 @@
+# schedule_simulation.py
+# Симуляция адаптивного расписания парсинга на синтетической истории цен
+# из fake_history.py: сравнение равномерного расписания и адаптивного
+# при одинаковом бюджете страниц в час.
+#
+# Первые --history-days дней истории превращаются в ежедневные записи,
+# как в таблице prices, и по ним строится расписание. Следующие --eval-days
+# дней парсер наблюдает цену только в моменты парсинга; для каждого
+# изменения считается задержка до первого парсинга после него.
+#
+# Второй прогон — отказ одного из двух магазинов на --outage-hours часов:
+# циклы парсинга как в run_scrape_cycle (не больше бюджета на цикл, самые
+# просроченные первыми) с предохранителем из scrape_queue. Сравнивается,
+# сколько успевает парсить исправный магазин, если продукты магазина с
+# открытым предохранителем остаются просроченными и если их парсинг
+# откладывается до закрытия предохранителя.
+#   python schedule_simulation.py --products 300 --budgets 12,25,50
+import argparse
+import random
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+
+from fake_history import generate_price_events
+from scheduling import SchedulePolicy, allocate_intervals, estimate_change_rates
+from scrape_queue import ScrapePolicy
+
+STORES = ("5ka", "magnit")  # продукты делятся между магазинами поровну
+FAILED_STORE = "5ka"
+
+
+def generate_products(count, hours, rng):
+    """
+    Продукты с разной волатильностью: большинство меняет цену раз
+    в несколько недель, часть — ежедневно; у трети бывают акции.
+    """
+    products = []
+    for _ in range(count):
+        change_every_days = min(120, rng.lognormvariate(2.5, 1.2))
+        promo_every_days = rng.uniform(7, 30) if rng.random() < 0.3 else None
+        products.append(
+            generate_price_events(
+                hours,
+                change_every_days * 24,
+                promo_every_days * 24 if promo_every_days else None,
+                promo_length_hours=rng.uniform(2, 7) * 24,
+                start_price=rng.uniform(50, 500),
+                rng=rng,
+            )
+        )
+    return products
+
+
+def daily_history(events, days):
+    """
+    Ежедневные снимки цены за первые days дней — как их видит таблица prices.
+    """
+    start = date(2024, 1, 1)
+    times = [t for t, _, _ in events]
+    history = []
+    for day in range(days):
+        _, with_discount, without_discount = events[bisect_right(times, day * 24) - 1]
+        history.append((start + timedelta(days=day), with_discount, without_discount))
+    return history
+
+
+def simulate(products, intervals, start_hour, end_hour, rng):
+    """
+    Парсить каждый продукт с его интервалом (со случайной фазой) и посчитать
+    задержки обнаружения изменений. Изменение, перекрытое следующим
+    до ближайшего парсинга, считается пропущенным.
+    """
+    latencies = []
+    missed = 0
+    promos = promos_missed = 0
+    pages = 0
+    for product_id, events in enumerate(products):
+        interval = intervals[product_id]
+        first = start_hour + rng.uniform(0, interval)
+        scrapes = []
+        t = first
+        while t < end_hour:
+            scrapes.append(t)
+            t += interval
+        pages += len(scrapes)
+
+        times = [t for t, _, _ in events]
+        window = range(bisect_left(times, start_hour), bisect_left(times, end_hour))
+        for i in window:
+            changed_at, with_discount, _ = events[i]
+            is_promo_start = with_discount is not None and events[i - 1][1] is None
+            promos += is_promo_start
+            next_change = times[i + 1] if i + 1 < len(times) else float("inf")
+            k = bisect_left(scrapes, changed_at)
+            if k == len(scrapes):
+                continue  # Изменение после последнего парсинга окна
+            if scrapes[k] >= next_change:
+                missed += 1
+                promos_missed += is_promo_start
+                continue
+            latencies.append(scrapes[k] - changed_at)
+    return latencies, missed, promos, promos_missed, pages
+
+
+def simulate_outage(intervals, outage, cycle_hours, limit, postpone, rng, policy=None):
+    """
+    Циклы парсинга каждые cycle_hours по limit продуктов с самым ранним
+    следующим парсингом. В часы outage = (начало, конец) страницы
+    FAILED_STORE не грузятся: после failure_threshold неудач подряд
+    предохранитель открывается на cooldown_seconds. Продукт магазина с
+    открытым предохранителем уходит в очередь повторов (здесь не
+    моделируется) и, если postpone, откладывается до закрытия
+    предохранителя. Возвращает {магазин: (страниц за время отказа,
+    средняя просрочка парсинга в часах)}.
+    """
+    policy = policy or ScrapePolicy()
+    cooldown_hours = policy.cooldown_seconds / 3600
+    start, end = outage
+    next_at = {
+        product_id: start + rng.uniform(0, interval)
+        for product_id, interval in intervals.items()
+    }
+    failures = 0
+    open_until = float("-inf")
+    pages = {store: 0 for store in STORES}
+    lateness = {store: [] for store in STORES}
+    t = start
+    while t < end:
+        due = sorted(
+            (at, product_id) for product_id, at in next_at.items() if at <= t
+        )[:limit]
+        for at, product_id in due:
+            store = STORES[product_id % len(STORES)]
+            if store == FAILED_STORE and open_until > t:
+                if postpone:
+                    next_at[product_id] = open_until
+                continue
+            pages[store] += 1
+            lateness[store].append(t - at)
+            next_at[product_id] = t + intervals[product_id]
+            if store == FAILED_STORE:
+                failures += 1
+                if failures >= policy.failure_threshold:
+                    open_until = t + cooldown_hours
+        t += cycle_hours
+    return {
+        store: (pages[store], sum(lateness[store]) / max(1, len(lateness[store])))
+        for store in STORES
+    }
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Симуляция расписания парсинга")
+    parser.add_argument("--products", type=int, default=300)
+    parser.add_argument("--history-days", type=int, default=90)
+    parser.add_argument("--eval-days", type=int, default=30)
+    parser.add_argument(
+        "--budgets", default="6,12,25,50", help="бюджеты страниц в час через запятую"
+    )
+    parser.add_argument("--outage-hours", type=float, default=24)
+    parser.add_argument("--cycle-minutes", type=float, default=15)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    start_hour = args.history_days * 24
+    end_hour = start_hour + args.eval_days * 24
+    products = generate_products(args.products, end_hour, rng)
+
+    weights = {}
+    for product_id, events in enumerate(products):
+        change_rate, promo_rate = estimate_change_rates(
+            daily_history(events, args.history_days)
+        )
+        weights[product_id] = (change_rate, promo_rate)
+
+    print(
+        f"{'бюджет/ч':>8} {'политика':>12} {'страниц/ч':>9} {'задержка, ч':>11} "
+        f"{'p90, ч':>7} {'пропущено':>9} {'акций пропущено':>15}"
+    )
+    for budget in (float(value) for value in args.budgets.split(",")):
+        policy = SchedulePolicy(budget_per_hour=budget)
+        schedules = {
+            "равномерная": allocate_intervals({i: 1.0 for i in weights}, policy),
+            "адаптивная": allocate_intervals(
+                {
+                    i: change_rate + policy.promo_weight * promo_rate
+                    for i, (change_rate, promo_rate) in weights.items()
+                },
+                policy,
+            ),
+        }
+        for name, intervals in schedules.items():
+            latencies, missed, promos, promos_missed, pages = simulate(
+                products, intervals, start_hour, end_hour, random.Random(args.seed)
+            )
+            total = len(latencies) + missed
+            print(
+                f"{budget:>8.0f} {name:>12} {pages / (end_hour - start_hour):>9.1f} "
+                f"{sum(latencies) / max(1, len(latencies)):>11.1f} "
+                f"{percentile(latencies, 0.9):>7.1f} "
+                f"{missed / max(1, total):>9.1%} "
+                f"{promos_missed / max(1, promos):>15.1%}"
+            )
+
+    healthy = next(store for store in STORES if store != FAILED_STORE)
+    cycle_hours = args.cycle_minutes / 60
+    outage = (start_hour, start_hour + args.outage_hours)
+    print()
+    print(
+        f"Отказ {FAILED_STORE} на {args.outage_hours:.0f} ч, цикл {args.cycle_minutes:.0f} мин"
+    )
+    print(
+        f"{'бюджет/ч':>8} {'продукты отказа':>16} {f'страниц {healthy}/ч':>17} "
+        f"{'просрочка, ч':>12} {f'попыток {FAILED_STORE}/ч':>15}"
+    )
+    for budget in (float(value) for value in args.budgets.split(",")):
+        policy = SchedulePolicy(budget_per_hour=budget)
+        intervals = allocate_intervals(
+            {
+                i: change_rate + policy.promo_weight * promo_rate
+                for i, (change_rate, promo_rate) in weights.items()
+            },
+            policy,
+        )
+        # Как get_due_products: доля бюджета на один цикл
+        limit = max(1, round(budget * cycle_hours))
+        for name, postpone in (("просрочены", False), ("отложены", True)):
+            result = simulate_outage(
+                intervals, outage, cycle_hours, limit, postpone, random.Random(args.seed)
+            )
+            pages, lateness = result[healthy]
+            print(
+                f"{budget:>8.0f} {name:>16} {pages / args.outage_hours:>17.1f} "
+                f"{lateness:>12.1f} {result[FAILED_STORE][0] / args.outage_hours:>15.1f}"
+            )
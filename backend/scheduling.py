@@ -0,0 +1,193 @@
+"""
+Адаптивная частота парсинга: для каждого продукта по истории цен
+оценивается, как часто меняется цена и как часто начинаются и
+заканчиваются акции, и в пределах общего бюджета страниц в час
+продукту назначается собственный интервал обновления.
+"""
+from datetime import datetime, timedelta
+from math import sqrt
+
+from sqlalchemy import Column, Integer, Float, DateTime, select
+from sqlalchemy.orm import declarative_base, Session
+from sqlalchemy.dialects import postgresql, sqlite
+
+ScheduleBase = declarative_base()
+
+# Априорная оценка для продуктов с короткой историей:
+# одно изменение за PRIOR_DAYS дней
+PRIOR_CHANGES = 1.0
+PRIOR_DAYS = 30.0
+
+
+class ScrapeSchedule(ScheduleBase):
+    __tablename__ = "scrape_schedule"
+
+    ProductID = Column(Integer, primary_key=True)
+    ChangeRate = Column(Float, nullable=False)  # изменений цены в день
+    PromoRate = Column(Float, nullable=False)  # начал и окончаний акций в день
+    IntervalHours = Column(Float, nullable=False)
+    LastScrapedAt = Column(DateTime, nullable=True)
+    NextScrapeAt = Column(DateTime, nullable=False, index=True)
+
+
+class SchedulePolicy:
+    """
+    Параметры планировщика: бюджет страниц в час, границы интервала
+    и вес акций относительно обычных изменений цены.
+    """
+
+    def __init__(
+        self,
+        budget_per_hour: float,
+        min_interval_hours: float = 1,
+        max_interval_hours: float = 168,
+        promo_weight: float = 2,
+    ):
+        self.budget_per_hour = budget_per_hour
+        self.min_interval_hours = min_interval_hours
+        self.max_interval_hours = max_interval_hours
+        self.promo_weight = promo_weight
+
+
+def estimate_change_rates(history) -> tuple:
+    """
+    Оценить по истории [(дата, цена со скидкой, цена без скидки), ...],
+    отсортированной по дате, частоту изменений обычной цены и частоту
+    начала или окончания акций (в событиях в день).
+    """
+    changes = 0
+    promo_switches = 0
+    previous = None
+    for price_date, with_discount, without_discount in history:
+        on_promo = with_discount is not None and (
+            without_discount is None or with_discount < without_discount
+        )
+        if previous is not None:
+            if without_discount != previous[2]:
+                changes += 1
+            if on_promo != previous[3]:
+                promo_switches += 1
+        previous = (price_date, with_discount, without_discount, on_promo)
+    span_days = (history[-1][0] - history[0][0]).days if history else 0
+    days = span_days + PRIOR_DAYS
+    # Акции оцениваются без априорного изменения: их может не быть вовсе
+    return (changes + PRIOR_CHANGES) / days, promo_switches / days
+
+
+def allocate_intervals(weights: dict, policy: SchedulePolicy) -> dict:
+    """
+    Распределить бюджет между продуктами {product_id: вес}: частота
+    парсинга пропорциональна корню из веса (это минимизирует суммарную
+    задержку обнаружения изменений) и ограничена min/max интервалом.
+    Возвращает {product_id: интервал в часах}.
+    """
+    if not weights:
+        return {}
+    max_frequency = 1 / policy.min_interval_hours
+    min_frequency = 1 / policy.max_interval_hours
+    # Если бюджета не хватает даже на максимальный интервал, он не соблюдается
+    if min_frequency * len(weights) > policy.budget_per_hour:
+        min_frequency = 0
+    roots = {product_id: sqrt(weight) for product_id, weight in weights.items()}
+
+    def frequencies(scale):
+        return {
+            product_id: min(max_frequency, max(min_frequency, scale * root))
+            for product_id, root in roots.items()
+        }
+
+    # Масштаб подбирается бинарным поиском: сумма частот монотонна по нему
+    low, high = 0.0, 1.0
+    while sum(frequencies(high).values()) < policy.budget_per_hour and high < 1e12:
+        high *= 2
+    for _ in range(60):
+        middle = (low + high) / 2
+        if sum(frequencies(middle).values()) < policy.budget_per_hour:
+            low = middle
+        else:
+            high = middle
+    return {
+        product_id: 1 / frequency if frequency > 0 else policy.max_interval_hours
+        for product_id, frequency in frequencies(low).items()
+    }
+
+
+def _upsert(db: Session):
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(ScrapeSchedule)
+    return sqlite.insert(ScrapeSchedule)
+
+
+def rebuild_schedule(db: Session, histories: dict, policy: SchedulePolicy, now=None):
+    """
+    Пересчитать интервалы для всех продуктов {product_id: история}.
+    Следующий парсинг отсчитывается от последнего; продукт, который
+    ещё не парсился по расписанию, становится доступным сразу.
+    """
+    now = now or datetime.utcnow()
+    rates = {
+        product_id: estimate_change_rates(history)
+        for product_id, history in histories.items()
+    }
+    intervals = allocate_intervals(
+        {
+            product_id: change_rate + policy.promo_weight * promo_rate
+            for product_id, (change_rate, promo_rate) in rates.items()
+        },
+        policy,
+    )
+    last_scraped = dict(
+        db.execute(select(ScrapeSchedule.ProductID, ScrapeSchedule.LastScrapedAt)).all()
+    )
+    for product_id, interval in intervals.items():
+        change_rate, promo_rate = rates[product_id]
+        scraped_at = last_scraped.get(product_id)
+        next_at = scraped_at + timedelta(hours=interval) if scraped_at else now
+        values = {
+            "ChangeRate": change_rate,
+            "PromoRate": promo_rate,
+            "IntervalHours": interval,
+            "NextScrapeAt": next_at,
+        }
+        stmt = _upsert(db).values(ProductID=product_id, **values)
+        db.execute(
+            stmt.on_conflict_do_update(index_elements=[ScrapeSchedule.ProductID], set_=values)
+        )
+    db.commit()
+
+
+def _get_schedule(db: Session, product_id: int, policy: SchedulePolicy) -> ScrapeSchedule:
+    schedule = db.get(ScrapeSchedule, product_id)
+    if schedule is None:
+        # Новый продукт до пересчёта расписания — максимальная частота
+        schedule = ScrapeSchedule(
+            ProductID=product_id,
+            ChangeRate=PRIOR_CHANGES / PRIOR_DAYS,
+            PromoRate=0.0,
+            IntervalHours=policy.min_interval_hours,
+        )
+        db.add(schedule)
+    return schedule
+
+
+def mark_scraped(db: Session, product_id: int, policy: SchedulePolicy, now=None):
+    """
+    Отметить попытку парсинга и назначить следующую. Неудачи тоже
+    считаются: повторами занимается очередь, а не расписание.
+    """
+    now = now or datetime.utcnow()
+    schedule = _get_schedule(db, product_id, policy)
+    schedule.LastScrapedAt = now
+    schedule.NextScrapeAt = now + timedelta(hours=schedule.IntervalHours)
+    db.commit()
+
+
+def postpone_scrape(db: Session, product_id: int, until: datetime, policy: SchedulePolicy):
+    """
+    Отложить парсинг по расписанию до until (например, пока открыт
+    предохранитель магазина), не отмечая попытку. Иначе просроченный
+    продукт остаётся первым в очереди и каждый цикл занимает бюджет.
+    """
+    schedule = _get_schedule(db, product_id, policy)
+    schedule.NextScrapeAt = until
+    db.commit()
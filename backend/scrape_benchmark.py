@@ -0,0 +1,173 @@
+# scrape_benchmark.py
+# Сравнение скорости парсинга: одна страница на браузер (как в create_product)
+# против parse_many — несколько вкладок в одном браузере с блокировкой тяжёлых ресурсов.
+# Браузер для parse_many создаётся с page_load_strategy="none" (get_batch_driver):
+# иначе chromedriver ждёт полной загрузки каждой вкладки при переключении,
+# и вкладки грузятся по очереди.
+#
+# Страницы генерируются из селекторов parsers/stores.py и раздаются локальным
+# HTTP-сервером с искусственной задержкой, поэтому сеть и сайты магазинов не нужны.
+#   python scrape_benchmark.py --pages 40 --tabs 4 --latency 0.2
+import argparse
+import http.server
+import os
+import re
+import tempfile
+import threading
+import time
+from functools import partial
+
+from parsers.driver_settings import get_driver
+from parsers.registry import STORE_PARSERS, page_cache
+from parsers.stores import STORES
+from parsers.batch import parse_many, get_batch_driver
+
+# Параметры
+IMAGE_SIZE = 300 * 1024  # «тяжёлая» картинка на каждой странице
+FONT_SIZE = 100 * 1024
+
+
+def build_page(xpaths_with_text):
+    """
+    Построить HTML, в котором каждый абсолютный XPath вида
+    /html/body/div[1]/span[2] указывает на элемент с заданным текстом.
+    """
+    root = {"tag": "body", "children": [], "text": ""}
+    for xpath, text in xpaths_with_text.items():
+        node = root
+        for step in xpath.strip("/").split("/")[2:]:  # без html и body
+            match = re.fullmatch(r"(\w+)(?:\[(\d+)\])?", step)
+            tag, index = match.group(1), int(match.group(2) or 1)
+            same_tag = [child for child in node["children"] if child["tag"] == tag]
+            while len(same_tag) < index:
+                child = {"tag": tag, "children": [], "text": ""}
+                node["children"].append(child)
+                same_tag.append(child)
+            node = same_tag[index - 1]
+        node["text"] = text
+
+    def render(node):
+        inner = node["text"] + "".join(render(child) for child in node["children"])
+        return f"<{node['tag']}>{inner}</{node['tag']}>"
+
+    head = (
+        "<head><meta charset='utf-8'>"
+        "<style>@font-face{font-family:F;src:url(/static/font.woff2)}"
+        "body{font-family:F}</style></head>"
+    )
+    body = "".join(render(child) for child in root["children"])
+    # Картинка и шрифт не нужны для цены, но задерживают событие load
+    image = "<img src='/static/image.png'>"
+    return f"<!DOCTYPE html><html>{head}<body>{body}{image}</body></html>"
+
+
+def write_fixtures(directory, pages):
+    """
+    Сгенерировать pages страниц, перебирая магазины и варианты вёрстки.
+    Возвращает список (путь, магазин, ожидаемый результат).
+    """
+    os.makedirs(os.path.join(directory, "static"), exist_ok=True)
+    with open(os.path.join(directory, "static", "image.png"), "wb") as f:
+        f.write(os.urandom(IMAGE_SIZE))
+    with open(os.path.join(directory, "static", "font.woff2"), "wb") as f:
+        f.write(os.urandom(FONT_SIZE))
+
+    layouts = []
+    for store, config in STORES.items():
+        for variant_index, variant in enumerate(config["variants"]):
+            layouts.append((store, variant_index, variant))
+
+    fixtures = []
+    for i in range(pages):
+        store, variant_index, variant = layouts[i % len(layouts)]
+        expected = {"price_with_discount": None, "price_without_discount": None}
+        xpaths = {}
+        for field, selectors in variant.items():
+            price = 50 + i + (0.5 if field == "price_with_discount" else 0.99)
+            expected[field] = round(price, 2)
+            xpaths[selectors[0]] = f"{price:.2f}".replace(".", ",") + " ₽"
+        path = f"/{store}/{variant_index}/{i}.html"
+        os.makedirs(os.path.dirname(directory + path), exist_ok=True)
+        with open(directory + path, "w", encoding="utf-8") as f:
+            f.write(build_page(xpaths))
+        fixtures.append((path, store, expected))
+    return fixtures
+
+
+class SlowHandler(http.server.SimpleHTTPRequestHandler):
+    latency = 0.0
+
+    def do_GET(self):
+        time.sleep(self.latency)  # имитация сетевой задержки
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(directory, latency):
+    SlowHandler.latency = latency
+    handler = partial(SlowHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_single(base_url, fixtures):
+    results = {}
+    for path, store, _ in fixtures:
+        with get_driver() as driver:
+            try:
+                results[path] = STORE_PARSERS[store].parse(driver, base_url + path)
+            except Exception as e:
+                results[path] = e
+    return results
+
+
+def run_batch(base_url, fixtures, tabs):
+    results = {}
+    with get_batch_driver() as driver:
+        for store in STORES:
+            urls = [base_url + path for path, s, _ in fixtures if s == store]
+            batch = parse_many(driver, urls, tabs=tabs, store=store)
+            for url, result in batch.items():
+                results[url[len(base_url) :]] = result
+    return results
+
+
+def report(name, fixtures, results, elapsed):
+    correct = sum(1 for path, _, expected in fixtures if results.get(path) == expected)
+    print(
+        f"{name}: {len(fixtures)} страниц за {elapsed:.1f} с, "
+        f"{len(fixtures) / elapsed * 60:.0f} стр/мин, верно {correct}/{len(fixtures)}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк парсинга страниц")
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--tabs", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.2, help="задержка ответа, с")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        fixtures = write_fixtures(directory, args.pages)
+        server = serve(directory, args.latency)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        try:
+            started = time.perf_counter()
+            results = run_single(base_url, fixtures)
+            elapsed = time.perf_counter() - started
+            report("Один браузер на страницу", fixtures, results, elapsed)
+
+            page_cache.values.clear()
+            started = time.perf_counter()
+            results = run_batch(base_url, fixtures, args.tabs)
+            report(
+                f"parse_many, {args.tabs} вкладки",
+                fixtures,
+                results,
+                time.perf_counter() - started,
+            )
+        finally:
+            server.shutdown()
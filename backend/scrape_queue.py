@@ -0,0 +1,272 @@
+"""
+Персистентная очередь заданий на парсинг цен: повторные попытки
+с экспоненциальной задержкой и джиттером, автомат-предохранитель
+(circuit breaker) на магазин и список «мёртвых» заданий (dead letter).
+"""
+import random
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import Column, Integer, String, DateTime, select, update, or_, and_
+from sqlalchemy.orm import declarative_base, Session
+
+ScrapeQueueBase = declarative_base()
+
+# Статусы заданий
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+DEAD = "dead"
+
+
+class ScrapeJob(ScrapeQueueBase):
+    __tablename__ = "scrape_jobs"
+
+    JobID = Column(Integer, primary_key=True)
+    ProductID = Column(Integer, nullable=False, index=True)
+    Url = Column(String, nullable=False)
+    Store = Column(String, nullable=False)
+    Status = Column(String, nullable=False, default=PENDING, index=True)
+    Attempts = Column(Integer, nullable=False, default=0)
+    MaxAttempts = Column(Integer, nullable=False, default=5)
+    NextRunAt = Column(DateTime, nullable=False, default=datetime.utcnow)
+    LeaseToken = Column(String, nullable=True)
+    LeaseExpiresAt = Column(DateTime, nullable=True)
+    LastError = Column(String, nullable=True)
+    CreatedAt = Column(DateTime, nullable=False, default=datetime.utcnow)
+    UpdatedAt = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class StoreCircuit(ScrapeQueueBase):
+    __tablename__ = "store_circuits"
+
+    Store = Column(String, primary_key=True)
+    ConsecutiveFailures = Column(Integer, nullable=False, default=0)
+    OpenUntil = Column(DateTime, nullable=True)
+
+
+class ScrapePolicy:
+    """
+    Параметры повторов и предохранителя.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 5,
+        base_delay: float = 30,
+        max_delay: float = 3600,
+        lease_seconds: float = 300,
+        failure_threshold: int = 5,
+        cooldown_seconds: float = 900,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease_seconds = lease_seconds
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+
+    def backoff(self, attempts: int) -> float:
+        """
+        Задержка перед следующей попыткой: экспонента с полным джиттером,
+        чтобы повторы от разных воркеров не приходили одновременно.
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempts))
+
+
+def enqueue_scrape(
+    db: Session,
+    product_id: int,
+    url: str,
+    store: str,
+    policy: ScrapePolicy,
+    error: str = None,
+) -> ScrapeJob:
+    """
+    Поставить продукт в очередь. Если для него уже есть активное задание,
+    возвращается оно — дубликаты не создаются.
+    """
+    job = (
+        db.query(ScrapeJob)
+        .filter(
+            ScrapeJob.ProductID == product_id,
+            ScrapeJob.Status.in_([PENDING, LEASED]),
+        )
+        .first()
+    )
+    if job is None:
+        job = ScrapeJob(
+            ProductID=product_id,
+            Url=url,
+            Store=store,
+            MaxAttempts=policy.max_attempts,
+            LastError=error,
+        )
+        db.add(job)
+        db.commit()
+    return job
+
+
+def circuit_open_until(db: Session, store: str, now: datetime = None):
+    """
+    До какого момента открыт предохранитель магазина; None, если закрыт.
+    """
+    now = now or datetime.utcnow()
+    circuit = db.get(StoreCircuit, store)
+    if circuit is not None and circuit.OpenUntil is not None and circuit.OpenUntil > now:
+        return circuit.OpenUntil
+    return None
+
+
+def is_circuit_open(db: Session, store: str, now: datetime = None) -> bool:
+    return circuit_open_until(db, store, now) is not None
+
+
+def lease_jobs(db: Session, limit: int, policy: ScrapePolicy) -> list:
+    """
+    Атомарно забрать до limit готовых к запуску заданий. Задание с истёкшей
+    арендой (упавший воркер) снова становится доступным. Магазины
+    с открытым предохранителем пропускаются.
+    """
+    now = datetime.utcnow()
+    token = uuid.uuid4().hex
+    open_stores = select(StoreCircuit.Store).where(StoreCircuit.OpenUntil > now)
+    due = (
+        select(ScrapeJob.JobID)
+        .where(
+            or_(
+                and_(ScrapeJob.Status == PENDING, ScrapeJob.NextRunAt <= now),
+                and_(ScrapeJob.Status == LEASED, ScrapeJob.LeaseExpiresAt <= now),
+            ),
+            ScrapeJob.Store.not_in(open_stores),
+        )
+        .order_by(ScrapeJob.NextRunAt)
+        .limit(limit)
+    )
+    db.execute(
+        update(ScrapeJob)
+        .where(
+            ScrapeJob.JobID.in_(due),
+            # Повторная проверка статуса защищает от гонки между воркерами
+            or_(
+                ScrapeJob.Status == PENDING,
+                and_(ScrapeJob.Status == LEASED, ScrapeJob.LeaseExpiresAt <= now),
+            ),
+        )
+        .values(
+            Status=LEASED,
+            LeaseToken=token,
+            LeaseExpiresAt=now + timedelta(seconds=policy.lease_seconds),
+            UpdatedAt=now,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return db.query(ScrapeJob).filter(ScrapeJob.LeaseToken == token).all()
+
+
+def _record_store_result(db: Session, store: str, success: bool, policy: ScrapePolicy):
+    circuit = db.get(StoreCircuit, store)
+    if circuit is None:
+        circuit = StoreCircuit(Store=store, ConsecutiveFailures=0)
+        db.add(circuit)
+    if success:
+        circuit.ConsecutiveFailures = 0
+        circuit.OpenUntil = None
+        return
+    circuit.ConsecutiveFailures += 1
+    if circuit.ConsecutiveFailures >= policy.failure_threshold:
+        circuit.OpenUntil = datetime.utcnow() + timedelta(seconds=policy.cooldown_seconds)
+
+
+def record_store_success(db: Session, store: str, policy: ScrapePolicy):
+    _record_store_result(db, store, True, policy)
+    db.commit()
+
+
+def record_store_failure(db: Session, store: str, policy: ScrapePolicy):
+    _record_store_result(db, store, False, policy)
+    db.commit()
+
+
+def _update_leased(db: Session, job: ScrapeJob, token: str, **values) -> bool:
+    """
+    Изменить задание, только если оно всё ещё арендовано с этим токеном.
+    Если аренда истекла и задание взял другой воркер, ничего не меняется
+    (False): иначе задание выполнилось бы дважды, а его статус и число
+    попыток перезаписались бы.
+    """
+    result = db.execute(
+        update(ScrapeJob)
+        .where(ScrapeJob.JobID == job.JobID, ScrapeJob.LeaseToken == token)
+        .values(LeaseToken=None, UpdatedAt=datetime.utcnow(), **values)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        db.rollback()
+        return False
+    return True
+
+
+def complete_job(db: Session, job: ScrapeJob, token: str, policy: ScrapePolicy) -> bool:
+    if not _update_leased(db, job, token, Status=DONE, LastError=None):
+        return False
+    _record_store_result(db, job.Store, True, policy)
+    db.commit()
+    return True
+
+
+def fail_job(db: Session, job: ScrapeJob, token: str, error: str, policy: ScrapePolicy) -> bool:
+    """
+    Зафиксировать неудачную попытку: отложить задание с backoff
+    или перевести его в dead letter после MaxAttempts попыток.
+    """
+    attempts = job.Attempts + 1
+    if attempts >= job.MaxAttempts:
+        values = {"Status": DEAD}
+    else:
+        values = {
+            "Status": PENDING,
+            "NextRunAt": datetime.utcnow() + timedelta(seconds=policy.backoff(attempts)),
+        }
+    if not _update_leased(db, job, token, Attempts=attempts, LastError=error, **values):
+        return False
+    _record_store_result(db, job.Store, False, policy)
+    db.commit()
+    return True
+
+
+def retry_dead_job(db: Session, job: ScrapeJob):
+    """
+    Вернуть задание из dead letter в очередь с обнулённым счётчиком попыток.
+    """
+    job.Status = PENDING
+    job.Attempts = 0
+    job.NextRunAt = datetime.utcnow()
+    job.UpdatedAt = job.NextRunAt
+    db.commit()
+
+
+def process_jobs(db: Session, handler, policy: ScrapePolicy, limit: int = 10) -> int:
+    """
+    Забрать готовые задания и выполнить handler(job) для каждого.
+    Исключение из handler считается неудачной попыткой.
+    Возвращает число обработанных заданий.
+    """
+    jobs = lease_jobs(db, limit, policy)
+    for job in jobs:
+        # Токен запоминается до handler: после rollback объект перечитывается
+        token = job.LeaseToken
+        # Предохранитель мог открыться на предыдущем задании этой же пачки
+        if is_circuit_open(db, job.Store):
+            if _update_leased(db, job, token, Status=PENDING):
+                db.commit()
+            continue
+        try:
+            handler(job)
+        except Exception as e:
+            db.rollback()
+            fail_job(db, job, token, f"{type(e).__name__}: {e}", policy)
+        else:
+            complete_job(db, job, token, policy)
+    return len(jobs)
@@ -0,0 +1,314 @@
+# scrape_replay.py
+# Офлайн-проверка парсеров на сохранённых страницах: корректность по каждому
+# варианту вёрстки и скорость (стр/с) для разных способов парсинга. Страницы
+# раздаются локальным HTTP-сервером, сайты магазинов не нужны.
+#
+# Формат фикстур: <каталог>/<магазин>/<вариант>/<имя>.html — снимок страницы
+# после загрузки цены (driver.page_source), рядом <имя>.json:
+#   {"store": "5ka", "variant": "0", "url": "...", "recorded_at": "...",
+#    "expected": {"price_with_discount": 89.99, "price_without_discount": 119.99}}
+# Вариант — номер варианта вёрстки из parsers/stores.py или "unknown";
+# expected = null означает, что парсер должен завершиться ошибкой.
+#
+# Проверка верности — по страницам из scrape_fixtures/ (по умолчанию): по
+# странице на магазин и вариант вёрстки, ожидаемые цены сверены вручную.
+# Пока там только страницы, написанные вручную по вёрстке магазинов
+# ("source": "hand-written"); снятые командой record заменяют их после
+# проверки цен глазами. Синтетические страницы (--synthetic) строятся по
+# тем же селекторам, что читают парсеры, поэтому годятся только для
+# скорости: их верность не учитывается в коде возврата.
+#
+#   python scrape_replay.py run --backend snapshot --backend selenium
+#   python scrape_replay.py run --synthetic 200 --backend snapshot --backend batch
+#   python scrape_replay.py record --out scrape_fixtures https://5ka.ru/product/...
+#   python scrape_replay.py generate --out /tmp/fixtures --pages 200
+#
+# Способы парсинга: selenium — parse_5ka/parse_magnit в одном браузере,
+# batch — parse_many с вкладками, snapshot — разбор HTML без браузера.
+# Код возврата 1, если хоть одна страница из фикстур разобрана неверно.
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+from urllib.request import urlopen
+
+from parsers.driver_settings import get_driver
+from parsers.registry import STORE_PARSERS, get_store_for_url, page_cache
+from parsers.batch import parse_many, get_batch_driver
+from parsers.five import parse_5ka
+from parsers.magnit import parse_magnit
+from parsers.snapshot import extract_snapshot
+from parsers.stores import STORES
+from scrape_benchmark import build_page, serve
+
+PARSE_FUNCTIONS = {"5ka": parse_5ka, "magnit": parse_magnit}
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scrape_fixtures")
+
+# Параметры синтетических страниц: пункты меню и скрипт с «ценой» вне
+# нужного элемента, чтобы страница была похожа на настоящую
+FILLER_ITEMS = 200
+UNKNOWN_PER_STORE = 1  # страниц с незнакомой вёрсткой на магазин
+
+
+def write_fixture(directory, store, variant, name, html, meta):
+    folder = os.path.join(directory, store, variant)
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, name + ".html"), "w", encoding="utf-8") as f:
+        f.write(html)
+    with open(os.path.join(folder, name + ".json"), "w", encoding="utf-8") as f:
+        json.dump({"store": store, "variant": variant, **meta}, f, ensure_ascii=False, indent=2)
+
+
+def add_filler(html):
+    items = "".join(f"<li>Товар {i}</li>" for i in range(FILLER_ITEMS))
+    filler = f"<script>var price = '999,99 ₽';</script><ul>{items}</ul>"
+    return html.replace("</body>", filler + "</body>")
+
+
+def generate(directory, pages):
+    """
+    Синтетические снимки для всех магазинов и вариантов вёрстки из
+    stores.py и по UNKNOWN_PER_STORE страниц, где цены нет ни по одному
+    варианту.
+    """
+    layouts = [
+        (store, variant_index, variant)
+        for store, config in STORES.items()
+        for variant_index, variant in enumerate(config["variants"])
+    ]
+    for i in range(pages):
+        store, variant_index, variant = layouts[i % len(layouts)]
+        expected = {"price_with_discount": None, "price_without_discount": None}
+        xpaths = {}
+        for field, selectors in variant.items():
+            price = 50 + i + (0.5 if field == "price_with_discount" else 0.99)
+            expected[field] = round(price, 2)
+            xpaths[selectors[0]] = f"{price:.2f}".replace(".", ",") + " ₽"
+        write_fixture(
+            directory,
+            store,
+            str(variant_index),
+            f"page{i}",
+            add_filler(build_page(xpaths)),
+            {"url": None, "recorded_at": None, "expected": expected},
+        )
+    for store in STORES:
+        for i in range(UNKNOWN_PER_STORE):
+            html = build_page({"/html/body/main/section/p": "Товар закончился"})
+            write_fixture(
+                directory,
+                store,
+                "unknown",
+                f"page{i}",
+                add_filler(html),
+                {"url": None, "recorded_at": None, "expected": None},
+            )
+
+
+def record(directory, urls):
+    """
+    Сохранить живые страницы как фикстуры. Ожидаемые цены берутся из
+    текущего парсера — их нужно проверить глазами перед коммитом.
+    """
+    with get_driver() as driver:
+        for url in urls:
+            store = get_store_for_url(url)
+            if store is None:
+                print(f"Магазин не поддерживается: {url}")
+                continue
+            parser = STORE_PARSERS[store]
+            driver.get(url)
+            parser.wait_ready(driver)
+            html = driver.page_source
+            expected = parser.extract(driver)
+            try:
+                variant = str(extract_snapshot(parser, html)[0])
+            except ValueError:
+                variant = "unknown"
+            name = hashlib.sha1(url.encode()).hexdigest()[:12]
+            write_fixture(
+                directory,
+                store,
+                variant,
+                name,
+                html,
+                {"url": url, "recorded_at": datetime.now().isoformat(), "expected": expected},
+            )
+            print(f"{store}/{variant}/{name}: {expected}")
+
+
+def load_fixtures(directory):
+    fixtures = []
+    for folder, _, files in os.walk(directory):
+        for file in sorted(files):
+            if not file.endswith(".json"):
+                continue
+            with open(os.path.join(folder, file), encoding="utf-8") as f:
+                meta = json.load(f)
+            html_path = os.path.join(folder, file[: -len(".json")] + ".html")
+            meta["path"] = "/" + os.path.relpath(html_path, directory).replace(os.sep, "/")
+            fixtures.append(meta)
+    fixtures.sort(key=lambda fixture: fixture["path"])
+    return fixtures
+
+
+def run_selenium(base_url, fixtures, tabs):
+    results, durations = {}, {}
+    with get_driver() as driver:
+        for fixture in fixtures:
+            parse = PARSE_FUNCTIONS.get(fixture["store"], STORE_PARSERS[fixture["store"]].parse)
+            started = time.perf_counter()
+            try:
+                results[fixture["path"]] = parse(driver, base_url + fixture["path"])
+            except Exception as e:
+                results[fixture["path"]] = e
+            durations[fixture["path"]] = time.perf_counter() - started
+    return results, durations
+
+
+def run_batch(base_url, fixtures, tabs):
+    page_cache.values.clear()
+    results = {}
+    with get_batch_driver() as driver:
+        for store in STORES:
+            urls = [base_url + f["path"] for f in fixtures if f["store"] == store]
+            for url, result in parse_many(driver, urls, tabs=tabs, store=store).items():
+                results[url[len(base_url) :]] = result
+    return results, {}
+
+
+def run_snapshot(base_url, fixtures, tabs):
+    results, durations = {}, {}
+    for fixture in fixtures:
+        started = time.perf_counter()
+        try:
+            with urlopen(base_url + fixture["path"]) as response:
+                html = response.read().decode("utf-8")
+            results[fixture["path"]] = extract_snapshot(STORE_PARSERS[fixture["store"]], html)[1]
+        except Exception as e:
+            results[fixture["path"]] = e
+        durations[fixture["path"]] = time.perf_counter() - started
+    return results, durations
+
+
+BACKENDS = {"selenium": run_selenium, "batch": run_batch, "snapshot": run_snapshot}
+
+
+def is_correct(fixture, result):
+    if fixture["expected"] is None:
+        return isinstance(result, Exception)
+    return result == fixture["expected"]
+
+
+def report(name, fixtures, results, durations, elapsed, check=True):
+    """
+    Итог по способу парсинга и по каждому варианту вёрстки. Скорость по
+    вариантам — по времени отдельных страниц (у batch страницы грузятся
+    параллельно, поэтому только общая). Возвращает число ошибок; без check
+    (синтетические страницы) ошибки только выводятся.
+    """
+    groups = defaultdict(list)
+    for fixture in fixtures:
+        groups[f"{fixture['store']}/{fixture['variant']}"].append(fixture)
+    failures = [f for f in fixtures if not is_correct(f, results.get(f["path"]))]
+    print(
+        f"{name}: {len(fixtures)} страниц за {elapsed:.2f} с, "
+        f"{len(fixtures) / elapsed:.1f} стр/с, верно {len(fixtures) - len(failures)}/{len(fixtures)}"
+    )
+    for group, members in sorted(groups.items()):
+        correct = sum(1 for f in members if is_correct(f, results.get(f["path"])))
+        seconds = sum(durations.get(f["path"], 0) for f in members)
+        speed = f"{len(members) / seconds:8.1f} стр/с" if durations and seconds else " " * 13
+        print(f"  {group:<16} {speed}  верно {correct}/{len(members)}")
+    for fixture in failures[:10]:
+        print(
+            f"  ОШИБКА {fixture['path']}: ожидалось {fixture['expected']}, "
+            f"получено {results.get(fixture['path'])!r}"
+        )
+    return len(failures) if check else 0
+
+
+def run(directory, backends, tabs, latency, repeat, check=True):
+    fixtures = load_fixtures(directory)
+    if not fixtures:
+        raise SystemExit(f"Нет фикстур в {directory}")
+    server = serve(directory, latency)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    errors = 0
+    try:
+        for name in backends:
+            # Лучший из repeat прогонов, чтобы сгладить шум
+            best = None
+            try:
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    results, durations = BACKENDS[name](base_url, fixtures, tabs)
+                    elapsed = time.perf_counter() - started
+                    if best is None or elapsed < best[2]:
+                        best = (results, durations, elapsed)
+            except Exception as e:
+                # Например, нет Chrome: остальные способы всё равно проверяются
+                print(f"{name}: не удалось запустить ({e.__class__.__name__}: {str(e).strip()})")
+                errors += 1
+                continue
+            errors += report(name, fixtures, *best, check=check)
+    finally:
+        server.shutdown()
+    return errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Проверка парсеров на сохранённых страницах")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = commands.add_parser("generate", help="синтетические фикстуры")
+    generate_parser.add_argument("--out", required=True)
+    generate_parser.add_argument("--pages", type=int, default=200)
+
+    record_parser = commands.add_parser("record", help="сохранить живые страницы")
+    record_parser.add_argument("--out", required=True)
+    record_parser.add_argument("urls", nargs="+")
+
+    run_parser = commands.add_parser("run", help="прогнать парсеры по фикстурам")
+    run_parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    run_parser.add_argument(
+        "--synthetic", type=int, default=0, help="вместо фикстур N синтетических страниц"
+    )
+    run_parser.add_argument(
+        "--backend", action="append", choices=sorted(BACKENDS), help="можно несколько"
+    )
+    run_parser.add_argument("--tabs", type=int, default=4)
+    run_parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, с")
+    run_parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        generate(args.out, args.pages)
+    elif args.command == "record":
+        record(args.out, args.urls)
+    elif args.synthetic:
+        with tempfile.TemporaryDirectory() as directory:
+            generate(directory, args.synthetic)
+            errors = run(
+                directory,
+                args.backend or ["snapshot", "selenium"],
+                args.tabs,
+                args.latency,
+                args.repeat,
+                check=False,
+            )
+        sys.exit(1 if errors else 0)
+    else:
+        errors = run(
+            args.fixtures,
+            args.backend or ["snapshot", "selenium"],
+            args.tabs,
+            args.latency,
+            args.repeat,
+        )
+        sys.exit(1 if errors else 0)
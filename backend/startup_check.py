@@ -0,0 +1,101 @@
+# startup_check.py
+# Время от запуска процесса до готовности (/health/ready) и задержки первых
+# запросов после неё. Сервер запускается в отдельном процессе на свободном
+# порту; для сравнения с холодным стартом — с WARMUP=0. С --empty-db сервер
+# запускается на новой пустой базе SQLite: он тоже должен стать готов.
+#   python startup_check.py --runs 3
+#   python startup_check.py --runs 3 --no-warmup
+#   python startup_check.py --runs 1 --empty-db
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from load_test import DEFAULT_PATHS
+
+# Параметры
+READY_TIMEOUT_SECONDS = 120
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_startup(paths, warmup=True, database_url=None):
+    """
+    Запустить сервер, дождаться готовности и выполнить по одному запросу
+    на каждый путь. Возвращает (секунды до готовности снаружи, отчёт
+    /health/ready, {путь: мс}).
+    """
+    port = free_port()
+    env = dict(os.environ, WARMUP="1" if warmup else "0")
+    if database_url:
+        env["DATABASE_URL"] = database_url
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=60) as client:
+            while True:
+                if time.perf_counter() - started > READY_TIMEOUT_SECONDS:
+                    raise TimeoutError("сервер не стал готов вовремя")
+                if server.poll() is not None:
+                    raise RuntimeError(f"сервер завершился с кодом {server.returncode}")
+                try:
+                    response = client.get("/health/ready")
+                    if response.status_code == 200:
+                        break
+                    if response.json().get("status") == "failed":
+                        raise RuntimeError(response.json().get("error"))
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.05)
+            ready_seconds = time.perf_counter() - started
+            readiness = response.json()
+            first_requests = {}
+            for path in paths:
+                request_started = time.perf_counter()
+                client.get(path)
+                first_requests[path] = (time.perf_counter() - request_started) * 1000
+    finally:
+        server.terminate()
+        server.wait()
+    return ready_seconds, readiness, first_requests
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Время старта и первых запросов")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--no-warmup", action="store_true", help="запуск с WARMUP=0")
+    parser.add_argument("--path", action="append", help="путь для запросов (можно несколько)")
+    parser.add_argument("--empty-db", action="store_true", help="запуск на пустой базе")
+    args = parser.parse_args()
+
+    paths = args.path or DEFAULT_PATHS
+    for run in range(1, args.runs + 1):
+        with tempfile.TemporaryDirectory() as directory:
+            database_url = (
+                f"sqlite:///{os.path.join(directory, 'empty.db')}" if args.empty_db else None
+            )
+            ready_seconds, readiness, first_requests = measure_startup(
+                paths, warmup=not args.no_warmup, database_url=database_url
+            )
+        print(
+            f"Запуск {run}: готов через {ready_seconds:.2f} с "
+            f"(от импорта {readiness['startup_seconds']:.2f} с), "
+            f"этапы: {readiness['steps']}"
+        )
+        if readiness.get("skipped"):
+            print(f"  нечего прогревать: {readiness['skipped']}")
+        for path, ms in first_requests.items():
+            print(f"  {ms:8.1f} мс  {path}")
@@ -0,0 +1,180 @@
+# worker_check.py
+# Проверка координации нескольких процессов на копии базы:
+# 1) аренда продуктов — несколько процессов одновременно берут в аренду одни и
+#    те же продукты, каждый продукт должен достаться ровно одному процессу;
+# 2) версии кэшей — сервер запускается с WORKERS > 1, категории и инфляция за
+#    всё время кэшируются во всех воркерах, затем через один из них создаётся
+#    категория и цена, и ни один воркер не должен вернуть устаревший ответ.
+#   python worker_check.py --processes 4 --products 200 --workers 4
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from coordination import CoordinationBase, acquire_scrape_lease
+
+# Параметры
+READY_TIMEOUT_SECONDS = 120
+LEASE_TTL_SECONDS = 600
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def lease_products(database_url, products, owner, start):
+    engine = create_engine(database_url, connect_args={"timeout": 30})
+    db = sessionmaker(bind=engine)()
+    # У каждого процесса свой порядок продуктов, чтобы они сталкивались
+    product_ids = list(range(1, products + 1))
+    random.Random(owner).shuffle(product_ids)
+    start.wait()  # Все процессы начинают одновременно
+    try:
+        return [
+            product_id
+            for product_id in product_ids
+            if acquire_scrape_lease(db, product_id, LEASE_TTL_SECONDS, owner=owner)
+        ]
+    finally:
+        db.close()
+
+
+def check_leases(directory, processes, products):
+    """
+    Каждый процесс пытается взять в аренду все продукты. Возвращает
+    {продукт: сколько раз он был получен} для продуктов, полученных не один раз.
+    """
+    database_url = f"sqlite:///{os.path.join(directory, 'leases.db')}"
+    CoordinationBase.metadata.create_all(create_engine(database_url))
+    with multiprocessing.Manager() as manager:
+        start = manager.Barrier(processes)
+        with multiprocessing.Pool(processes) as pool:
+            pending = [
+                pool.apply_async(lease_products, (database_url, products, f"worker-{i}", start))
+                for i in range(processes)
+            ]
+            leased = [result.get() for result in pending]
+    counts = {}
+    for product_ids in leased:
+        for product_id in product_ids:
+            counts[product_id] = counts.get(product_id, 0) + 1
+    print(
+        f"Аренда: {processes} процессов, {products} продуктов, получено по процессам "
+        f"{[len(product_ids) for product_ids in leased]}"
+    )
+    return {
+        product_id: counts.get(product_id, 0)
+        for product_id in range(1, products + 1)
+        if counts.get(product_id, 0) != 1
+    }
+
+
+def get(base_url, path):
+    # Новое соединение на каждый запрос, чтобы запросы расходились по воркерам
+    with httpx.Client(base_url=base_url, timeout=60) as client:
+        response = client.get(path)
+        response.raise_for_status()
+        return response.json()
+
+
+def check_cache_versions(directory, workers, requests):
+    """
+    Запустить сервер с workers процессами на копии test.db, прогреть кэши,
+    изменить данные через API и убедиться, что все ответы свежие.
+    Возвращает список описаний устаревших ответов.
+    """
+    database = os.path.join(directory, "workers.db")
+    shutil.copy(os.path.join(BACKEND_DIR, "test.db"), database)
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{database}",
+        WORKERS=str(workers),
+        PORT=str(port),
+        SCRAPE_INTERVAL_SECONDS="0",
+    )
+    server = subprocess.Popen([sys.executable, "main.py"], cwd=BACKEND_DIR, env=env)
+    stale = []
+    try:
+        started = time.perf_counter()
+        ready_in_a_row = 0
+        # Готовность каждого воркера не видна снаружи: ждём серию ответов 200
+        while ready_in_a_row < 4 * workers:
+            if time.perf_counter() - started > READY_TIMEOUT_SECONDS:
+                raise TimeoutError("сервер не стал готов вовремя")
+            if server.poll() is not None:
+                raise RuntimeError(f"сервер завершился с кодом {server.returncode}")
+            try:
+                with httpx.Client(base_url=base_url, timeout=5) as client:
+                    ok = client.get("/health/ready").status_code == 200
+            except httpx.TransportError:
+                ok = False
+            ready_in_a_row = ready_in_a_row + 1 if ok else 0
+            time.sleep(0.05)
+
+        for _ in range(requests):
+            get(base_url, "/categories/")
+            inflation_before = get(base_url, "/inflation/overall/all_time")
+
+        with httpx.Client(base_url=base_url, timeout=60) as client:
+            category = client.post(
+                "/categories/", json={"CategoryName": "Проверка воркеров"}
+            ).json()
+            product_id = client.get("/products/").json()[0]["ProductID"]
+            client.post(
+                "/prices/",
+                json={
+                    "ProductID": product_id,
+                    "PriceDate": date.today().isoformat(),
+                    "PriceWithoutDiscount": 100000,
+                },
+            ).raise_for_status()
+
+        for i in range(requests):
+            categories = get(base_url, "/categories/")
+            if not any(c["CategoryID"] == category["CategoryID"] for c in categories):
+                stale.append(f"запрос {i}: /categories/ без новой категории")
+            inflation = get(base_url, "/inflation/overall/all_time")
+            if inflation == inflation_before:
+                stale.append(f"запрос {i}: /inflation/overall/all_time не изменилась")
+        print(
+            f"Кэши: {workers} воркеров, по {requests} запросов до и после изменения, "
+            f"устаревших ответов {len(stale)}"
+        )
+    finally:
+        server.terminate()
+        server.wait()
+    return stale
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Проверка координации воркеров")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=40)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        duplicates = check_leases(directory, args.processes, args.products)
+        for product_id, count in list(duplicates.items())[:10]:
+            print(f"  продукт {product_id} получен {count} раз")
+        stale = check_cache_versions(directory, args.workers, args.requests)
+        for line in stale[:10]:
+            print(f"  {line}")
+    sys.exit(1 if duplicates or stale else 0)